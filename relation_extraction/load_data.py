@@ -1,8 +1,13 @@
 import os
 import sys
 import collections
+import multiprocessing
 import itertools
+import hashlib
+import json
+import shutil
 import cPickle as pickle
+from array import array
 
 import math
 import random
@@ -15,42 +20,36 @@ import tensorflow as tf
 from lxml import etree
 
 from structures.sentence_structure import Sentence, Token, Dependency
-from structures.instances import Instance
+from structures.instances import Instance, InstanceTable, PathInstance
+from structures.distant_kb import DistantKnowledgeBase
+from structures.vocabulary import VocabularyCounter
 from machine_learning_models import tf_lstm as lstm
+from machine_learning_models import record_stats
+from machine_learning_models import tfrecord_io
 
+# instances serialized per tfrecord write batch
+record_batch_size = 1024
 
-def np_to_tfrecord(features,labels,tfresult_file):
+
+def np_to_tfrecord(features,labels,tfresult_file,compression=None):
     """
-    converts np aray totfrecord
-    :param features: np array of features
+    converts sparse features and np array of labels to tfrecord
+    :param features: list of active feature indices per instance
     :param labels: np array of labels
     :param tfresult_file: name of tfrecord file
+    :param compression: None, 'GZIP' or 'ZLIB'
     :return:  tfrecord file path
     """
-    writer = tf.python_io.TFRecordWriter(tfresult_file)
-    #print(features.shape[0])
-    for i in range(features.shape[0]):
-        x = features[i]
-        x= np.array(x,dtype='int8')
-        x=x.tobytes()
-        #print(x.shape)
-        y = labels[i]
-        y = np.array(y,dtype='int8')
-        y = y.tobytes()
-
-        feature_dict = {}
-        feature_dict['x'] = tf.train.Feature(bytes_list=tf.train.BytesList(value=[x]))
-        feature_dict['y'] = tf.train.Feature(bytes_list=tf.train.BytesList(value=[y]))
-        example = tf.train.Example(features=tf.train.Features(feature=feature_dict))
-        serialized=example.SerializeToString()
-        #print(serialized)
-        writer.write(serialized)
-    writer.close()
+    with tfrecord_io.BatchRecordWriter(tfresult_file, tfrecord_io.feed_forward_examples, compression,
+                                       background=False) as writer:
+        for start in range(0, len(features), record_batch_size):
+            writer.write_batch(features[start:start + record_batch_size], labels[start:start + record_batch_size])
+    record_stats.write_record_stats(labels, tfresult_file)
 
     return tfresult_file
 
 def np_to_lstm_tfrecord(dep_path_list_features,dep_word_features,dep_type_path_length,
-                                                         dep_word_path_length,labels,tfresult_file):
+                                                         dep_word_path_length,labels,tfresult_file,compression=None):
     """
 
     :param dep_path_list_features: dependency path type features
@@ -59,76 +58,121 @@ def np_to_lstm_tfrecord(dep_path_list_features,dep_word_features,dep_type_path_l
     :param dep_word_path_length: dep word path length
     :param labels: distantly trained labels
     :param tfresult_file: tfrecord file path
+    :param compression: None, 'GZIP' or 'ZLIB'
     :return: tfrecord file path
     """
-    writer = tf.python_io.TFRecordWriter(tfresult_file)
-    #print(features.shape[0])
-    for i in range(len(labels)):
-        dep_path_list_feat = dep_path_list_features[i]
-        dep_path_list_feat = np.array(dep_path_list_feat,dtype='int32')
-        dep_path_list_feat=dep_path_list_feat.tobytes()
-
-        dep_word_feat = dep_word_features[i]
-        dep_word_feat = np.array(dep_word_feat, dtype='int32')
-        dep_word_feat = dep_word_feat.tobytes()
-
-        dep_path_length = dep_type_path_length[i]
-        dep_path_length = np.array(dep_path_length,dtype='int32')
-        dep_path_length = dep_path_length.tobytes()
-        #print(dep_path_length)
-
-        dep_word_length = dep_word_path_length[i]
-        dep_word_length = np.array(dep_word_length,dtype='int32')
-        dep_word_length = dep_word_length.tobytes()
-
-        y = labels[i]
-        y = np.array(y,dtype='int32')
-        y = y.tobytes()
-
-        feature_dict = {}
-        feature_dict['dep_path_list'] = tf.train.Feature(bytes_list=tf.train.BytesList(value=[dep_path_list_feat]))
-        feature_dict['dep_word_feat'] = tf.train.Feature(bytes_list=tf.train.BytesList(value=[dep_word_feat]))
-        feature_dict['dep_path_length'] = tf.train.Feature(bytes_list=tf.train.BytesList(value=[dep_path_length]))
-        feature_dict['dep_word_length'] = tf.train.Feature(bytes_list=tf.train.BytesList(value=[dep_word_length]))
-        feature_dict['y'] = tf.train.Feature(bytes_list=tf.train.BytesList(value=[y]))
-        #print(feature_dict['x'])
-
-
-        example = tf.train.Example(features=tf.train.Features(feature=feature_dict))
-        serialized=example.SerializeToString()
-        #print(serialized)
-        writer.write(serialized)
-    writer.close()
+    with tfrecord_io.BatchRecordWriter(tfresult_file, tfrecord_io.lstm_examples, compression, background=False) as writer:
+        for start in range(0, len(labels), record_batch_size):
+            end = start + record_batch_size
+            writer.write_batch(dep_path_list_features[start:end], dep_word_features[start:end],
+                               dep_type_path_length[start:end], dep_word_path_length[start:end], labels[start:end])
+    record_stats.write_record_stats(labels, tfresult_file)
 
     return tfresult_file
 
+def np_to_lstm_npy(dep_path_list_features,dep_word_features,dep_type_path_length,
+                   dep_word_path_length,labels,shard_folder):
+    """
+    writes lstm features as one contiguous .npy array per field so they can be memory mapped, paths of all
+    instances are concatenated into one flat array and split again by their lengths
+    :param dep_path_list_features: dependency path type features
+    :param dep_word_features:  dependency word path features
+    :param dep_type_path_length:  dep type path length
+    :param dep_word_path_length: dep word path length
+    :param labels: distantly trained labels
+    :param shard_folder: folder of shard .npy files
+    :return: shard folder path
+    """
+    if os.path.isdir(shard_folder) == False:
+        os.mkdir(shard_folder)
+
+    # empty shards still need a 2d shape for the label array
+    num_instances = len(labels)
+    num_labels = 0
+    if num_instances > 0:
+        num_labels = len(labels[0])
+    fields = {'dep_path_list': np.fromiter(itertools.chain.from_iterable(dep_path_list_features), dtype='int32'),
+              'dep_word_feat': np.fromiter(itertools.chain.from_iterable(dep_word_features), dtype='int32'),
+              'dep_path_length': np.array(dep_type_path_length, dtype='int32').reshape(num_instances),
+              'dep_word_length': np.array(dep_word_path_length, dtype='int32').reshape(num_instances),
+              'y': np.array(labels, dtype='int32').reshape((num_instances, num_labels))}
+    for field in fields:
+        np.save(shard_folder + '/' + field + '.npy', fields[field])
+
+    return shard_folder
+
+# record folder suffixes of the lstm record formats
+lstm_record_folders = {'tfrecord': '_lstm_tf_record', 'npy': '_lstm_npy'}
+# layout of lstm features in records, records written with another layout are rebuilt
+lstm_record_layout = 'variable_length_paths'
+
+def lstm_record_extension(record_format, compression=None):
+    """
+    file extension of lstm records
+    :param record_format: 'tfrecord' or 'npy'
+    :param compression: None, 'GZIP' or 'ZLIB' for tfrecord files
+    :return: file extension
+    """
+    if record_format == 'npy':
+        return '.npy_shard'
+    return tfrecord_io.record_extension(compression)
 
-def build_dataset(words, occur_count = None):
+def lstm_feature_columns(instances):
     """
-    builds data dictionaries for list of word appearances
-    :param words: list of words
-    :param occur_count: number of words to filter
-    :return: return data dictionary, count dictionary, word to index dictionary, index to word dictionary
+    splits lstm features of instances into the columns written to records
+    :param instances: instances with built lstm features
+    :return: dep path list features, dep word features, dep path lengths, dep word lengths, labels
     """
+    dep_path_list_features = []
+    dep_word_features = []
+    dep_type_path_length = []
+    dep_word_path_length = []
+    labels = []
+    for t in instances:
+        dep_path_list_features.append(t.features[0])
+        dep_word_features.append(t.features[1])
+        dep_type_path_length.append(t.features[2])
+        dep_word_path_length.append(t.features[3])
+        labels.append(t.label)
+    return dep_path_list_features, dep_word_features, dep_type_path_length, dep_word_path_length, labels
+
+def write_lstm_record(columns, record_file, record_format, compression=None):
+    """
+    writes lstm feature columns in the record format
+    :param columns: lstm feature columns
+    :param record_file: tfrecord file or npy shard folder
+    :param record_format: 'tfrecord' or 'npy'
+    :param compression: None, 'GZIP' or 'ZLIB' for tfrecord files
+    :return: record file
+    """
+    if record_format == 'npy':
+        return np_to_lstm_npy(*columns, shard_folder=record_file)
+    return np_to_lstm_tfrecord(*columns, tfresult_file=record_file, compression=compression)
+
 
-    num_total_words = len(set(words))
-    discard_count = 0
-    if occur_count is not None:
+def build_dataset(words, occur_count = None, max_size = None):
+    """
+    builds dictionaries of the words kept after pruning by count, most frequent words get the lowest indexes
+    :param words: list of words or Counter of word appearances
+    :param occur_count: minimum count of kept words, None keeps every word
+    :param max_size: maximum number of kept words, None keeps every word that is frequent enough
+    :return: return kept (word, count) list, word to index dictionary, index to word dictionary
+    """
+
+    if isinstance(words, collections.Counter):
+        word_count_dict = words
+    else:
         word_count_dict = collections.Counter(words)
-        discard_count = sum(1 for i in word_count_dict.values() if i < occur_count)
-    num_words = num_total_words - discard_count
-    count = []
-    count.extend(collections.Counter(words).most_common(num_words))
+    # ties are broken on the word so indexes don't depend on the order counts were merged in
+    count = sorted((item for item in word_count_dict.iteritems() if occur_count is None or item[1] >= occur_count),
+                   key=lambda x: (-x[1], x[0]))
+    if max_size is not None:
+        count = count[:max_size]
     dictionary = dict()
     for word, _ in count:
         dictionary[word] = len(dictionary)
-    data = list()
-    for word in words:
-        if word in dictionary:
-            index = dictionary[word]
-            data.append(index)
     reversed_dictionary = dict(zip(dictionary.values(), dictionary.keys()))
-    return data, count, dictionary, reversed_dictionary
+    return count, dictionary, reversed_dictionary
 
 def feature_pruning(feature_dict,feature_count_tuples,prune_val):
     """
@@ -145,12 +189,33 @@ def feature_pruning(feature_dict,feature_count_tuples,prune_val):
 
     return feature_dict
 
+def distant_label_pair(entity_1, entity_2, forward_instance, reverse_instance, distant_interactions, key_order):
+    """
+    labels forward and reverse instances of an entity pair from the label index of the distant knowledge base,
+    every relation in key_order is labeled with one lookup per entity id combination
+    :param entity_1: set of normalized entity ids of entity 1
+    :param entity_2: set of normalized entity ids of entity 2
+    :param forward_instance: instance from entity 1 to entity 2
+    :param reverse_instance: instance from entity 2 to entity 1
+    :param distant_interactions: relations of the knowledge base, which also holds the reverse relations
+    :param key_order:
+    :return:
+    """
+    if len(key_order) == 0:
+        return
+    # forward and reverse pairs share one knowledge base, which builds the labeler once
+    labeler = distant_interactions[key_order[0]].knowledge_base.get_labeler(key_order)
+    forward_labels, reverse_labels = labeler.label_pair(entity_1, entity_2)
+    forward_instance.set_label(forward_labels)
+    reverse_instance.set_label(reverse_labels)
+
 def build_instances_training(candidate_sentences, distant_interactions,reverse_distant_interactions,key_order, supplemental_dict):
     """
     Builds instances for training
     :param candidate_sentences: sentences
     :param distant_interactions:
-    :param reverse_distant_interactions:
+    :param reverse_distant_interactions: unused, pairs are labeled from the knowledge base of distant_interactions,
+    which holds the reverse relations too
     :param key_order:
     :param entity_1_list:
     :param entity_2_list:
@@ -159,10 +224,10 @@ def build_instances_training(candidate_sentences, distant_interactions,reverse_d
     # initialize vocabularies for different features
     stop_list = get_stop_list(os.path.dirname(os.path.realpath(__file__)) + '/static_data/stop_list.txt')
 
-    path_word_vocabulary = []
-    words_between_entities_vocabulary = []
-    dep_type_vocabulary = []
-    dep_type_word_elements_vocabulary = []
+    path_word_vocabulary = collections.Counter()
+    words_between_entities_vocabulary = collections.Counter()
+    dep_type_vocabulary = collections.Counter()
+    dep_type_word_elements_vocabulary = collections.Counter()
     candidate_instances = []
     for candidate_sentence in candidate_sentences:
         entity_pairs = candidate_sentence.get_entity_pairs()
@@ -181,42 +246,28 @@ def build_instances_training(candidate_sentences, distant_interactions,reverse_d
             if 'GENE' in entity_1_token.get_ner() and 'GENE' in entity_2_token.get_ner():
                 gene_to_gene = True
 
-            entity_combos = set(itertools.product(entity_1,entity_2))
-
             forward_train_instance = Instance(candidate_sentence, pair[0], pair[1], [0]*len(key_order))
             reverse_train_instance = Instance(candidate_sentence, pair[1], pair[0], [0]*len(key_order))
 
-            for i in range(len(key_order)):
-                distant_key = key_order[i]
-                if 'SYMMETRIC' in distant_key:
-                    if len(entity_combos.intersection(distant_interactions[distant_key]))>0 or len(entity_combos.intersection(reverse_distant_interactions[distant_key]))>0:
-                        forward_train_instance.set_label_i(1,i)
-                        reverse_train_instance.set_label_i(1,i)
-                else:
-                    if len(entity_combos.intersection(distant_interactions[distant_key])) > 0:
-                        forward_train_instance.set_label_i(1, i)
-                    elif len(entity_combos.intersection(reverse_distant_interactions[distant_key]))>0:
-                        reverse_train_instance.set_label_i(1, i)
-
-            path_word_vocabulary += forward_train_instance.dependency_words
-            path_word_vocabulary += reverse_train_instance.dependency_words
-            words_between_entities_vocabulary += forward_train_instance.between_words
-            words_between_entities_vocabulary += reverse_train_instance.between_words
-            dep_type_word_elements_vocabulary += forward_train_instance.dependency_elements
-            dep_type_word_elements_vocabulary += reverse_train_instance.dependency_elements
-            dep_type_vocabulary.append(forward_train_instance.dependency_path_string)
-            dep_type_vocabulary.append(reverse_train_instance.dependency_path_string)
+            distant_label_pair(entity_1, entity_2, forward_train_instance, reverse_train_instance,
+                               distant_interactions, key_order)
+
+            for instance in (forward_train_instance, reverse_train_instance):
+                path_word_vocabulary.update(instance.dependency_words)
+                words_between_entities_vocabulary.update(instance.between_words)
+                dep_type_word_elements_vocabulary.update(instance.dependency_elements)
+                dep_type_vocabulary[instance.dependency_path_string] += 1
 
             candidate_instances.append(forward_train_instance)
             if gene_to_gene is True:
                 candidate_instances.append(reverse_train_instance)
 
 
-    data, count, dep_path_word_dictionary, reversed_dictionary = build_dataset(path_word_vocabulary,100)
-    dep_data, dep_count, dep_dictionary, dep_reversed_dictionary = build_dataset(dep_type_vocabulary,100)
-    dep_element_data, dep_element_count, dep_element_dictionary, dep_element_reversed_dictionary = build_dataset(
+    count, dep_path_word_dictionary, reversed_dictionary = build_dataset(path_word_vocabulary,100)
+    dep_count, dep_dictionary, dep_reversed_dictionary = build_dataset(dep_type_vocabulary,100)
+    dep_element_count, dep_element_dictionary, dep_element_reversed_dictionary = build_dataset(
         dep_type_word_elements_vocabulary,100)
-    between_data, between_count, between_word_dictionary, between_reversed_dictionary = build_dataset(
+    between_count, between_word_dictionary, between_reversed_dictionary = build_dataset(
         words_between_entities_vocabulary,100)
 
     print(dep_dictionary)
@@ -239,7 +290,8 @@ def build_instances_testing(test_sentences, dep_dictionary, dep_path_word_dictio
     :param dep_element_dictionary:
     :param between_word_dictionary:
     :param distant_interactions:
-    :param reverse_distant_interactions:
+    :param reverse_distant_interactions: unused, pairs are labeled from the knowledge base of distant_interactions,
+    which holds the reverse relations too
     :param key_order:
     :param entity_1_list:  default is None
     :param entity_2_list: default is None
@@ -267,23 +319,12 @@ def build_instances_testing(test_sentences, dep_dictionary, dep_path_word_dictio
 
 
 
-            entity_combos = set(itertools.product(entity_1,entity_2))
             forward_test_instance = Instance(test_sentence, pair[0], pair[1], [0] *len(key_order))
             reverse_test_instance = Instance(test_sentence, pair[1], pair[0], [0] *len(key_order))
 
 
-            for i in range(len(key_order)):
-                distant_key = key_order[i]
-                if 'SYMMETRIC' in distant_key:
-                    if len(entity_combos.intersection(distant_interactions[distant_key]))>0 or len(entity_combos.intersection(reverse_distant_interactions[distant_key]))>0:
-                        forward_test_instance.set_label_i(1,i)
-                        reverse_test_instance.set_label_i(1,i)
-
-                else:
-                    if len(entity_combos.intersection(distant_interactions[distant_key])) > 0:
-                        forward_test_instance.set_label_i(1, i)
-                    elif len(entity_combos.intersection(reverse_distant_interactions[distant_key]))>0:
-                        reverse_test_instance.set_label_i(1, i)
+            distant_label_pair(entity_1, entity_2, forward_test_instance, reverse_test_instance,
+                               distant_interactions, key_order)
 
             test_instances.append(forward_test_instance)
             if gene_to_gene is True:
@@ -299,7 +340,8 @@ def build_instances_testing(test_sentences, dep_dictionary, dep_path_word_dictio
 
     return test_instances
 
-def build_instances_predict(predict_sentences,dep_dictionary, dep_word_dictionary, dep_element_dictionary, between_word_dictionary,key_order,dep_path_type_dictionary=None):
+def build_instances_predict(predict_sentences,dep_dictionary, dep_word_dictionary, dep_element_dictionary, between_word_dictionary,key_order,dep_path_type_dictionary=None,
+                            stop_list=None):
     """
     buld instances for predicting values
     :param predict_sentences:
@@ -311,10 +353,12 @@ def build_instances_predict(predict_sentences,dep_dictionary, dep_word_dictionar
     :param entity_1_list:
     :param entity_2_list:
     :param dep_path_type_dictionary:
+    :param stop_list: stop list, loaded from static_data if None
     :return: prediciton instances
     """
     predict_instances = []
-    stop_list = get_stop_list(os.path.dirname(os.path.realpath(__file__)) + '/static_data/stop_list.txt')
+    if stop_list is None:
+        stop_list = get_stop_list(os.path.dirname(os.path.realpath(__file__)) + '/static_data/stop_list.txt')
     for p_sentence in predict_sentences:
 
         entity_pairs = p_sentence.get_entity_pairs()
@@ -338,6 +382,8 @@ def build_instances_predict(predict_sentences,dep_dictionary, dep_word_dictionar
                 reverse_predict_instance = Instance(p_sentence, pair[1], pair[0], [-1]*len(key_order))
 
             predict_instances.append(forward_predict_instance)
+            if gene_to_gene is True:
+                predict_instances.append(reverse_predict_instance)
 
     if dep_path_type_dictionary is None:
         for instance in predict_instances:
@@ -349,6 +395,91 @@ def build_instances_predict(predict_sentences,dep_dictionary, dep_word_dictionar
 
     return predict_instances
 
+def iter_predict_instances_from_directory(directory_folder, entity_a, entity_b, dep_dictionary, dep_word_dictionary,
+                                          dep_element_dictionary, between_word_dictionary, key_order, batch_size=4096,
+                                          dep_path_type_dictionary=None):
+    """
+    streams featurized prediction instances of a directory of abstracts in batches, so only one batch of
+    sentences and instances is held in memory
+    :param directory_folder:
+    :param entity_a:
+    :param entity_b:
+    :param dep_dictionary:
+    :param dep_word_dictionary:
+    :param dep_element_dictionary:
+    :param between_word_dictionary:
+    :param key_order:
+    :param batch_size: number of instances per batch
+    :param dep_path_type_dictionary: default is None if not, that means we're creating LSTM model instances
+    :return: generator of lists of instances
+    """
+    stop_list = get_stop_list(os.path.dirname(os.path.realpath(__file__)) + '/static_data/stop_list.txt')
+    predict_instances = []
+    for predict_sentence in iter_sentences_from_directory(directory_folder, entity_a, entity_b):
+        predict_instances.extend(build_instances_predict([predict_sentence], dep_dictionary, dep_word_dictionary,
+                                                         dep_element_dictionary, between_word_dictionary, key_order,
+                                                         dep_path_type_dictionary, stop_list))
+        while len(predict_instances) >= batch_size:
+            yield predict_instances[:batch_size]
+            predict_instances = predict_instances[batch_size:]
+    if len(predict_instances) > 0:
+        yield predict_instances
+
+def build_sentence(sentence, entity_1, entity_2):
+    """
+    builds Sentence object from a CoreNLP sentence element
+    :param sentence: lxml sentence element
+    :param entity_1:
+    :param entity_2:
+    :return: Sentence object
+    """
+    candidate_sentence = Sentence(sentence.find('PMID').text,sentence.get('id')) #get candidate sentence find for pmid because its a tag, get for 'id' because its an attribute
+    tokens = list(sentence.iter('token')) #get tokens for sentence
+
+    for token in tokens:
+        normalized_ner = None
+        ner = token.find('NER').text
+        if token.find('NormalizedNER') is not None:
+            normalized_ner = token.find('NormalizedNER').text
+        #create token objects for sentences. Use to get word, lemma, POS, etc.
+        candidate_token = Token(token.get('id'), token.find('word').text, token.find('lemma').text, token.find('CharacterOffsetBegin').text,
+                                token.find('CharacterOffsetEnd').text, token.find('POS').text, ner, normalized_ner)
+        candidate_sentence.add_token(candidate_token)
+    #gets dependencies between tokens from stanford dependency parse
+    dependencies = list(sentence.iter('dependencies'))
+    basic_dependencies = dependencies[0]
+    #list of all dependencies in sentence
+    deps = list(basic_dependencies.iter('dep'))
+    #generates list of all dependencies within a sentence
+    for d in deps:
+        candidate_dep = Dependency(d.get('type'), candidate_sentence.get_token(d.find('governor').get('idx')), candidate_sentence.get_token(d.find('dependent').get('idx')))
+        candidate_sentence.add_dependency(candidate_dep)
+    # generates sparse dependency graph
+    candidate_sentence.build_dependency_graph()
+    #gets entity pairs of sentence
+    candidate_sentence.generate_entity_pairs(entity_1, entity_2)
+
+    return candidate_sentence
+
+def iter_xml_sentences(xml_file, entity_1, entity_2):
+    """
+    streams candidate sentences from xml file without building the whole tree
+    :param xml_file:
+    :param entity_1:
+    :param entity_2:
+    :return: generator of Sentence objects that have entity pairs
+    """
+    for event, sentence in etree.iterparse(xml_file, events=('end',), tag='sentence'):
+        candidate_sentence = build_sentence(sentence, entity_1, entity_2)
+
+        # free the processed element and any siblings already handled
+        sentence.clear()
+        while sentence.getprevious() is not None:
+            del sentence.getparent()[0]
+
+        if candidate_sentence.get_entity_pairs() is not None:
+            yield candidate_sentence
+
 def load_xml(xml_file, entity_1, entity_2):
     """
     load xml files
@@ -357,80 +488,332 @@ def load_xml(xml_file, entity_1, entity_2):
     :param entity_2:
     :return:
     """
-    tree = etree.parse(xml_file)
-    root = tree.getroot()
     candidate_sentences = []
-    sentences = list(root.iter('sentence'))
     pmids = set()
 
-    for sentence in sentences:
-        candidate_sentence = Sentence(sentence.find('PMID').text,sentence.get('id')) #get candidate sentence find for pmid because its a tag, get for 'id' because its an attribute
-        tokens = list(sentence.iter('token')) #get tokens for sentence
-
-        for token in tokens:
-            normalized_ner = None
-            ner = token.find('NER').text
-            if token.find('NormalizedNER') is not None:
-                normalized_ner = token.find('NormalizedNER').text
-            #create token objects for sentences. Use to get word, lemma, POS, etc.
-            candidate_token = Token(token.get('id'), token.find('word').text, token.find('lemma').text, token.find('CharacterOffsetBegin').text,
-                                    token.find('CharacterOffsetEnd').text, token.find('POS').text, ner, normalized_ner)
-            candidate_sentence.add_token(candidate_token)
-        #gets dependencies between tokens from stanford dependency parse
-        dependencies = list(sentence.iter('dependencies'))
-        basic_dependencies = dependencies[0]
-        #list of all dependencies in sentence
-        deps = list(basic_dependencies.iter('dep'))
-        #generates list of all dependencies within a sentence
-        for d in deps:
-            candidate_dep = Dependency(d.get('type'), candidate_sentence.get_token(d.find('governor').get('idx')), candidate_sentence.get_token(d.find('dependent').get('idx')))
-            candidate_sentence.add_dependency(candidate_dep)
-        # generates dependency matrix
-        candidate_sentence.build_dependency_matrix()
-        #gets entity pairs of sentence
-        candidate_sentence.generate_entity_pairs(entity_1, entity_2)
-        if candidate_sentence.get_entity_pairs() is not None:
-            candidate_sentences.append(candidate_sentence)
-            pmids.add(candidate_sentence.pmid)
+    for candidate_sentence in iter_xml_sentences(xml_file, entity_1, entity_2):
+        candidate_sentences.append(candidate_sentence)
+        pmids.add(candidate_sentence.pmid)
 
     return candidate_sentences, pmids
 
+def iter_abstract_files(directory_folder):
+    """
+    walks directory of abstracts
+    :param directory_folder:
+    :return: generator of abstract file names and paths
+    """
+    for path, subdirs, files in os.walk(directory_folder):
+        # sorted so abstracts are always processed and merged in the same order
+        subdirs.sort()
+        for name in sorted(files):
+            if name.endswith('.txt'):
+                yield name, os.path.join(path, name)
+
+def iter_sentences_from_directory(directory_folder, entity_1, entity_2):
+    """
+    streams candidate sentences from every abstract file in directory
+    :param directory_folder:
+    :param entity_1:
+    :param entity_2:
+    :return: generator of Sentence objects
+    """
+    for name, xmlpath in iter_abstract_files(directory_folder):
+        print(name)
+        for candidate_sentence in iter_xml_sentences(xmlpath, entity_1, entity_2):
+            yield candidate_sentence
+
+
+worker_state = {}
+
+def init_worker(state):
+    """
+    sets the state shared by every file a worker processes
+    :param state: dictionary of dictionaries, distant interactions, and settings
+    :return:
+    """
+    worker_state.clear()
+    worker_state.update(state)
+    if 'sentence_settings' in state:
+        set_sentence_settings(state['sentence_settings'])
+
+def iter_map_abstract_files(function, file_items, state, num_workers=1):
+    """
+    applies function to every file item, sharded across a pool of processes when num_workers > 1, and yields
+    each result as soon as it and the results before it are done
+    :param function: module level function taking one file item
+    :param file_items: list of file items
+    :param state: state available to function through worker_state
+    :param num_workers: number of processes
+    :return: generator of results in the same order as file_items
+    """
+    if num_workers is None or num_workers <= 1 or len(file_items) <= 1:
+        init_worker(state)
+        try:
+            for file_item in file_items:
+                yield function(file_item)
+        finally:
+            worker_state.clear()
+        return
+
+    pool = multiprocessing.Pool(min(num_workers, len(file_items)), init_worker, (state,))
+    try:
+        # chunksize of 1 balances uneven abstract files, imap keeps results in input order
+        for result in pool.imap(function, file_items, 1):
+            yield result
+    finally:
+        pool.close()
+        pool.join()
+
+def map_abstract_files(function, file_items, state, num_workers=1):
+    """
+    applies function to every file item, sharded across a pool of processes when num_workers > 1
+    :param function: module level function taking one file item
+    :param file_items: list of file items
+    :param state: state available to function through worker_state
+    :param num_workers: number of processes
+    :return: list of results in the same order as file_items
+    """
+    return list(iter_map_abstract_files(function, file_items, state, num_workers))
+
+def file_md5(filename):
+    """
+    md5 of file contents
+    :param filename:
+    :return: hex digest
+    """
+    md5 = hashlib.md5()
+    with open(filename, 'rb') as file:
+        for chunk in iter(lambda: file.read(1 << 20), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+def update_fingerprint(md5, obj):
+    """
+    feeds dictionaries, sets, lists and values into md5 independent of dictionary and set ordering
+    :param md5: hashlib md5 object
+    :param obj:
+    :return:
+    """
+    if hasattr(obj, 'fingerprint'):
+        md5.update(obj.fingerprint() + ',')
+    elif isinstance(obj, dict):
+        md5.update('{')
+        for key in sorted(obj):
+            update_fingerprint(md5, key)
+            update_fingerprint(md5, obj[key])
+        md5.update('}')
+    elif isinstance(obj, (set, frozenset)):
+        md5.update('<')
+        for value in sorted(obj):
+            md5.update(repr(value) + ',')
+        md5.update('>')
+    elif isinstance(obj, (list, tuple)):
+        md5.update('[')
+        for value in obj:
+            update_fingerprint(md5, value)
+        md5.update(']')
+    else:
+        md5.update(repr(obj) + ',')
+
+def fingerprint(*objects):
+    """
+    fingerprint of dictionaries or knowledge bases used to build records
+    :param objects:
+    :return: hex digest
+    """
+    md5 = hashlib.md5()
+    update_fingerprint(md5, objects)
+    return md5.hexdigest()
+
+def distant_kb_fingerprint(distant_interactions, reverse_distant_interactions, key_order):
+    """
+    fingerprint of everything used to label records
+    :param distant_interactions:
+    :param reverse_distant_interactions:
+    :param key_order:
+    :return: hex digest
+    """
+    stop_list = get_stop_list(os.path.dirname(os.path.realpath(__file__)) + '/static_data/stop_list.txt')
+    return fingerprint(distant_interactions, reverse_distant_interactions, key_order, stop_list)
+
+def load_record_manifest(record_folder):
+    """
+    loads manifest of records built in folder
+    :param record_folder:
+    :return: manifest dictionary
+    """
+    manifest_file = record_folder + '/manifest.json'
+    if os.path.isfile(manifest_file) is False:
+        return {'fingerprints': {}, 'records': {}}
+    with open(manifest_file) as file:
+        return json.load(file)
+
+def write_record_manifest(record_folder, manifest):
+    """
+    writes manifest of records built in folder
+    :param record_folder:
+    :param manifest:
+    :return:
+    """
+    manifest_file = record_folder + '/manifest.json'
+    with open(manifest_file + '.tmp', 'w') as file:
+        json.dump(manifest, file, indent=1, sort_keys=True)
+    os.rename(manifest_file + '.tmp', manifest_file)
 
-def load_distant_kb(distant_kb_file, column_a, column_b,distant_rel_col,supplemental_dict):
+def sentence_settings(all_pairs_min_tokens=None, max_token_distance=None, max_pairs=None):
+    """
+    Sentence settings used while parsing abstracts, passed to workers in their state
+    :param all_pairs_min_tokens: sentences with at least this many tokens compute all shortest path trees at once,
+    None keeps the per source breadth first search
+    :param max_token_distance: skip entity pairs with more tokens between their mentions, None keeps every pair
+    :param max_pairs: entity pairs generated per sentence, None keeps every pair
+    :return: dictionary of Sentence setting values
+    """
+    return {'all_pairs_min_tokens': all_pairs_min_tokens, 'max_token_distance': max_token_distance,
+            'max_pairs': max_pairs}
+
+def set_sentence_settings(settings):
+    """
+    sets the Sentence settings of this process, workers set them again from their state because pool workers
+    don't see settings changed in the parent after they started
+    :param settings: sentence_settings dictionary
+    :return:
+    """
+    for name, value in settings.items():
+        setattr(Sentence, name, value)
+
+def sentence_fingerprints():
+    """
+    fingerprints of the Sentence entity pair limits and shortest path settings records depend on,
+    empty while the defaults are used
+    :return: dictionary of fingerprints
+    """
+    fingerprints = {}
+    if Sentence.max_token_distance is not None or Sentence.max_pairs is not None:
+        fingerprints['entity_pairs'] = [Sentence.max_token_distance, Sentence.max_pairs]
+    if Sentence.all_pairs_min_tokens is not None:
+        fingerprints['all_pairs_min_tokens'] = Sentence.all_pairs_min_tokens
+    return fingerprints
+
+def update_record_folder(record_folder, function, record_items, state, fingerprints, num_workers=1):
+    """
+    rebuilds only the records whose source file changed since the last build, or every record
+    if the dictionaries or distant knowledge base fingerprints changed
+    :param record_folder: folder holding the records and their manifest
+    :param function: worker building the record of one work item
+    :param record_items: list of (record file or shard folder, source file, work item)
+    :param state: state available to function through worker_state
+    :param fingerprints: dictionary of fingerprints the records depend on
+    :param num_workers: number of processes
+    :return: list of record files in record_items order
     """
-    loads data from knowldege bases into tuples
+    manifest = load_record_manifest(record_folder)
+    previous_records = {}
+    if manifest['fingerprints'] == fingerprints:
+        previous_records = manifest['records']
+
+    records = {}
+    current_records = {}
+    stale_items = []
+    for record_file, source_file, item in record_items:
+        record_name = os.path.basename(record_file)
+        source_stat = os.stat(source_file)
+        previous_entry = previous_records.get(record_name)
+        # only rehash sources whose size or modification time changed
+        if previous_entry is not None and previous_entry['size'] == source_stat.st_size \
+                and previous_entry['mtime'] == source_stat.st_mtime:
+            source_md5 = previous_entry['md5']
+        else:
+            source_md5 = file_md5(source_file)
+        entry = {'source': source_file, 'size': source_stat.st_size, 'mtime': source_stat.st_mtime, 'md5': source_md5}
+        records[record_name] = entry
+        if previous_entry is not None and previous_entry['md5'] == source_md5 and os.path.exists(record_file):
+            current_records[record_name] = entry
+        else:
+            stale_items.append(item)
+
+    # remove records of sources that no longer exist
+    for record_name in manifest['records']:
+        if record_name not in records:
+            if os.path.isdir(record_folder + '/' + record_name):
+                shutil.rmtree(record_folder + '/' + record_name)
+            elif os.path.isfile(record_folder + '/' + record_name):
+                os.remove(record_folder + '/' + record_name)
+            if os.path.isfile(record_stats.stats_file(record_folder + '/' + record_name)):
+                os.remove(record_stats.stats_file(record_folder + '/' + record_name))
+
+    print(str(len(stale_items)) + ' of ' + str(len(record_items)) + ' records need building in ' + record_folder)
+    # stale records are left out of the manifest until rebuilt so an interrupted build is redone
+    write_record_manifest(record_folder, {'fingerprints': fingerprints, 'records': current_records})
+    map_abstract_files(function, stale_items, state, num_workers)
+    write_record_manifest(record_folder, {'fingerprints': fingerprints, 'records': records})
+
+    return [record_file for record_file, source_file, item in record_items]
+
+def count_vocabularies(instance_pairs):
+    """
+    counts feature vocabularies of forward and reverse instances
+    :param instance_pairs: iterable of (forward instance, reverse instance)
+    :return: Counters of path words, dependency path strings, dependency elements, between words, dependency types
+    """
+    path_word_vocabulary = collections.Counter()
+    dep_type_vocabulary = collections.Counter()
+    dep_type_word_elements_vocabulary = collections.Counter()
+    words_between_entities_vocabulary = collections.Counter()
+    dep_type_list_vocabulary = collections.Counter()
+
+    for forward_instance, reverse_instance in instance_pairs:
+        for instance in (forward_instance, reverse_instance):
+            path_word_vocabulary.update(instance.dependency_words)
+            words_between_entities_vocabulary.update(instance.between_words)
+            dep_type_word_elements_vocabulary.update(instance.dependency_elements)
+            dep_type_list_vocabulary.update(instance.dependency_path_list)
+            dep_type_vocabulary[instance.dependency_path_string] += 1
+
+    return path_word_vocabulary, dep_type_vocabulary, dep_type_word_elements_vocabulary, \
+           words_between_entities_vocabulary, dep_type_list_vocabulary
+
+def merge_vocabulary_counts(vocabulary_counts, min_count=None, sketch_width=None):
+    """
+    reduces per file vocabulary counts into one set of counts as they arrive
+    :param vocabulary_counts: iterable of count_vocabularies results
+    :param min_count: count features need to be kept, words rarer than this are left out with sketch_width
+    :param sketch_width: count-min sketch width for approximate counting of very large corpora, None counts exactly
+    :return: merged Counters in count_vocabularies order
+    """
+    # dependency types are few and all kept, they are always counted exactly
+    merged_counts = [VocabularyCounter(min_count, sketch_width) for i in range(4)] + [VocabularyCounter()]
+    for counts in vocabulary_counts:
+        for i in range(len(merged_counts)):
+            merged_counts[i].update(counts[i])
+    return [merged.get_counts() for merged in merged_counts]
+
+
+def load_distant_kb(distant_kb_file, column_a, column_b,distant_rel_col,knowledge_base):
+    """
+    loads pairs of a knowledge base file as packed keys of interned entity ids
     :param distant_kb_file:
     :param column_a:
     :param column_b:
     :param distant_rel_col:
-    :return:
+    :param knowledge_base: DistantKnowledgeBase interning the entities
+    :return: forward and reverse packed pair keys
     """
-    distant_interactions = set()
-    reverse_distant_interactions = set()
-    #reads in lines from kb file
-    file = open(distant_kb_file,'rU')
-    lines = file.readlines()
-    file.close()
-    for l in lines:
-        split_line = l.split('\t')
-        #column_a is entity_1 column_b is entity 2
-        entity_a = split_line[column_a]
-        entity_b = split_line[column_b]
-        if entity_a in supplemental_dict:
-            entity_a = set([entity_a]).union(supplemental_dict[entity_a])
-        else:
-            entity_a = set([entity_a])
-        if entity_b in supplemental_dict:
-            entity_b = set([entity_b]).union(supplemental_dict[entity_b])
-        else:
-            entity_b = set([entity_b])
-        for tuple in set(itertools.product(entity_a,entity_b)):
+    distant_interactions = []
+    reverse_distant_interactions = []
+    #streams lines from kb file
+    with open(distant_kb_file,'rU') as file:
+        for l in file:
+            split_line = l.split('\t')
+            #column_a is entity_1 column_b is entity 2
+            key = (knowledge_base.intern(split_line[column_a]) << 32) | knowledge_base.intern(split_line[column_b])
             if split_line[distant_rel_col].endswith('by') is False:
-                distant_interactions.add(tuple)
+                distant_interactions.append(key)
             else:
-                reverse_distant_interactions.add(tuple)
+                reverse_distant_interactions.append(key)
 
-    #returns both forward and backward tuples for relations
+    #returns both forward and backward pairs for relations
     return distant_interactions,reverse_distant_interactions
 
 def load_id_list(id_list,column_a):
@@ -458,19 +841,9 @@ def load_abstracts_from_directory(directory_folder,entity_1,entity_2):
     print(directory_folder)
     total_abstract_sentences = []
     total_pmids = set()
-    for path, subdirs, files in os.walk(directory_folder):
-        for name in files:
-            if name.endswith('.txt'):
-                print(name)
-                xmlpath = os.path.join(path, name)
-                abstract_sentences,pmids = load_xml(xmlpath,entity_1,entity_2)
-                if len(abstract_sentences) > 0:
-                    total_abstract_sentences += abstract_sentences
-                    total_pmids = total_pmids.union(pmids)
-
-            else:
-                continue
-
+    for candidate_sentence in iter_sentences_from_directory(directory_folder, entity_1, entity_2):
+        total_abstract_sentences.append(candidate_sentence)
+        total_pmids.add(candidate_sentence.pmid)
 
     return total_pmids,total_abstract_sentences
 
@@ -484,118 +857,92 @@ def load_abstracts_from_pickle(pickle_file):
     return abstract_dict
 
 
+def distant_kb_files(directional_distant_directory,symmetric_distant_directory):
+    """
+    knowledge base files of distant directories and the relation key of each
+    :param directional_distant_directory:
+    :param symmetric_distant_directory:
+    :return: list of (relation key, file path)
+    """
+    kb_files = []
+    for filename in sorted(os.listdir(directional_distant_directory)):
+        if filename.endswith('.txt') is True:
+            kb_files.append((filename, directional_distant_directory+'/'+filename))
+    for filename in sorted(os.listdir(symmetric_distant_directory)):
+        if filename.endswith('.txt') is True:
+            kb_files.append(('SYMMETRIC'+filename, symmetric_distant_directory+'/'+filename))
+    return kb_files
+
 def load_distant_directories(directional_distant_directory,symmetric_distant_directory,distant_entity_a_col,
                              distant_entity_b_col,distant_rel_col,supplemental_dict):
     """
-    load distant directories
+    load distant directories into an indexed knowledge base, which is saved next to the directional directory
+    and reused while the knowledge base files, columns and ontology are unchanged
     :param directional_distant_directory:
     :param symmetric_distant_directory:
     :param distant_entity_a_col:
     :param distant_entity_b_col:
     :param distant_rel_col:
-    :return: forward and reverse dictionaries for each type
+    :param supplemental_dict: ontology ancestors of terms, expanded when pairs are looked up
+    :return: forward and reverse dictionaries of RelationPairs for each type
     """
+    kb_files = distant_kb_files(directional_distant_directory, symmetric_distant_directory)
+    digest = fingerprint([(key, file_md5(kb_file)) for key, kb_file in kb_files],
+                         distant_entity_a_col, distant_entity_b_col, distant_rel_col, supplemental_dict)
+
+    index_file = directional_distant_directory.rstrip('/') + '_kb_index.pickle'
+    knowledge_base = None
+    if os.path.isfile(index_file):
+        with open(index_file, 'rb') as file:
+            knowledge_base = pickle.load(file)
+        if knowledge_base.digest != digest:
+            knowledge_base = None
+
+    if knowledge_base is None:
+        knowledge_base = DistantKnowledgeBase(digest)
+        for key, kb_file in kb_files:
+            distant_interactions,reverse_distant_interactions = load_distant_kb(kb_file, distant_entity_a_col,
+                                                                                distant_entity_b_col,distant_rel_col,
+                                                                                knowledge_base)
+            knowledge_base.add_relation((key, 'forward'), distant_interactions)
+            knowledge_base.add_relation((key, 'reverse'), reverse_distant_interactions)
+        knowledge_base.expand_ontology(supplemental_dict)
+        with open(index_file + '.tmp', 'wb') as file:
+            pickle.dump(knowledge_base, file, pickle.HIGHEST_PROTOCOL)
+        os.rename(index_file + '.tmp', index_file)
+
     forward_dictionary = {}
     reverse_dictionary = {}
-    for filename in os.listdir(directional_distant_directory):
-        if filename.endswith('.txt') is False:
-            continue
-        distant_interactions,reverse_distant_interactions = load_distant_kb(directional_distant_directory+'/'+filename,
-                                                                            distant_entity_a_col,distant_entity_b_col,distant_rel_col,supplemental_dict)
-        forward_dictionary[filename] = distant_interactions
-        reverse_dictionary[filename] = reverse_distant_interactions
-
-    for filename in os.listdir(symmetric_distant_directory):
-        if filename.endswith('.txt') is False:
-            continue
-        distant_interactions,reverse_distant_interactions = load_distant_kb(symmetric_distant_directory+'/'+filename,
-                                                                            distant_entity_a_col,distant_entity_b_col,distant_rel_col,supplemental_dict)
-        forward_dictionary['SYMMETRIC'+filename] = distant_interactions
-        reverse_dictionary['SYMMETRIC'+filename] = reverse_distant_interactions
+    for key, kb_file in kb_files:
+        forward_dictionary[key] = knowledge_base.get_relation((key, 'forward'))
+        reverse_dictionary[key] = knowledge_base.get_relation((key, 'reverse'))
 
     return forward_dictionary, reverse_dictionary
 
 
-def build_dictionaries_from_directory(directory_folder,entity_a,entity_b, entity_1_list=None,entity_2_list=None,LSTM=False):
+def build_feature_dictionaries(path_word_vocabulary, dep_type_vocabulary, dep_type_word_elements_vocabulary,
+                               words_between_entities_vocabulary, dep_type_list_vocabulary, LSTM=False,
+                               prune_embeddings=False, min_count=100, max_size=None):
     """
-    build feature dictionaries from directory of abstracts
-    :param directory_folder:
-    :param entity_a:
-    :param entity_b:
-    :param entity_1_list:
-    :param entity_2_list:
+    builds feature dictionaries from collected vocabularies
+    :param path_word_vocabulary: words in dependency paths
+    :param dep_type_vocabulary: dependency path strings
+    :param dep_type_word_elements_vocabulary: dependency path elements
+    :param words_between_entities_vocabulary: words between entities
+    :param dep_type_list_vocabulary: dependency types in paths
     :param LSTM:
-    :return:
+    :param prune_embeddings: keep only word2vec words that occur in dependency paths
+    :param min_count: minimum count of features kept in the feed forward dictionaries and path word dictionary
+    :param max_size: maximum number of features kept per dictionary, None keeps every frequent enough feature
+    :return: feed forward dictionaries or LSTM dictionaries and word2vec embeddings
     """
-    print(directory_folder)
-    path_word_vocabulary = []
-    words_between_entities_vocabulary = []
-    dep_type_vocabulary = []
-    dep_type_word_elements_vocabulary = []
-    dep_type_list_vocabulary = []
-
-    total_pmids = set()
-    for path, subdirs, files in os.walk(directory_folder):
-        for name in files:
-            if name.endswith('.txt'):
-                print(name)
-                xmlpath = os.path.join(path, name)
-                abstract_sentences, pmids = load_xml(xmlpath, entity_a, entity_b)
-                for candidate_sentence in abstract_sentences:
-                    entity_pairs = candidate_sentence.get_entity_pairs()
-
-                    for pair in entity_pairs:
-                        entity_1_token = candidate_sentence.get_token(pair[0][0])
-                        entity_2_token = candidate_sentence.get_token(pair[1][0])
-                        entity_1 = entity_1_token.get_normalized_ner().split('|')
-                        entity_2 = entity_2_token.get_normalized_ner().split('|')
-
-                        if entity_1_list is not None:
-                            if len(set(entity_1).intersection(entity_1_list)) == 0:
-                                continue
-
-                            # check if entity_2 overlaps with entity_1_list if so continue
-                            if len(set(entity_2).intersection(entity_1_list)) > 0:
-                                continue
-
-                        if entity_2_list is not None:
-                            if len(set(entity_2).intersection(entity_2_list)) == 0:
-                                continue
-
-                            # check if entity_1 overlaps with entity_2_list if so continue
-                            if len(set(entity_1).intersection(entity_2_list)) > 0:
-                                continue
-
-                        entity_combos = set(itertools.product(entity_1, entity_2))
-                        # print(entity_combos)
-
-                        forward_train_instance = Instance(candidate_sentence, pair[0], pair[1], None)
-                        # print(forward_train_instance.dependency_elements)
-                        reverse_train_instance = Instance(candidate_sentence, pair[1], pair[0], None)
-
-                        #get vocabs
-                        path_word_vocabulary += forward_train_instance.dependency_words
-                        path_word_vocabulary += reverse_train_instance.dependency_words
-                        words_between_entities_vocabulary += forward_train_instance.between_words
-                        words_between_entities_vocabulary += reverse_train_instance.between_words
-                        dep_type_word_elements_vocabulary += forward_train_instance.dependency_elements
-                        dep_type_word_elements_vocabulary += reverse_train_instance.dependency_elements
-                        dep_type_list_vocabulary += forward_train_instance.dependency_path_list
-                        dep_type_list_vocabulary += reverse_train_instance.dependency_path_list
-                        dep_type_vocabulary.append(forward_train_instance.dependency_path_string)
-                        dep_type_vocabulary.append(reverse_train_instance.dependency_path_string)
-
-
-            else:
-                continue
-
-    data, count, dep_path_word_dictionary, reversed_dictionary = build_dataset(path_word_vocabulary,100)
-    dep_data, dep_count, dep_dictionary, dep_reversed_dictionary = build_dataset(dep_type_vocabulary,100)
-    dep_element_data, dep_element_count, dep_element_dictionary, dep_element_reversed_dictionary = build_dataset(
-        dep_type_word_elements_vocabulary,100)
-    between_data, between_count, between_word_dictionary, between_reversed_dictionary = build_dataset(
-        words_between_entities_vocabulary,100)
-    dep_type_list_data, dep_type_list_count, dep_type_list_dictionary, dep_type_list_reversed_dictionary = build_dataset(
+    count, dep_path_word_dictionary, reversed_dictionary = build_dataset(path_word_vocabulary, min_count, max_size)
+    dep_count, dep_dictionary, dep_reversed_dictionary = build_dataset(dep_type_vocabulary, min_count, max_size)
+    dep_element_count, dep_element_dictionary, dep_element_reversed_dictionary = build_dataset(
+        dep_type_word_elements_vocabulary, min_count, max_size)
+    between_count, between_word_dictionary, between_reversed_dictionary = build_dataset(
+        words_between_entities_vocabulary, min_count, max_size)
+    dep_type_list_count, dep_type_list_dictionary, dep_type_list_reversed_dictionary = build_dataset(
         dep_type_list_vocabulary, 0)
 
 
@@ -611,17 +958,133 @@ def build_dictionaries_from_directory(directory_folder,entity_a,entity_b, entity
         word2vec_embeddings = None
         if os.path.exists(os.path.dirname(os.path.realpath(__file__)) +'/machine_learning_models/PubMed-w2v.bin'):
             print('embeddings exist')
-            word2vec_words, word2vec_vectors,dep_path_word_dictionary = lstm.load_bin_vec(os.path.dirname(os.path.realpath(__file__)) +'/machine_learning_models/PubMed-w2v.bin')
-            word2vec_embeddings = np.array(word2vec_vectors)
+            embedding_vocabulary = None
+            if prune_embeddings is True:
+                embedding_vocabulary = path_word_vocabulary
+            word2vec_words, word2vec_vectors,dep_path_word_dictionary = lstm.load_bin_vec(os.path.dirname(os.path.realpath(__file__)) +'/machine_learning_models/PubMed-w2v.bin',
+                                                                                         embedding_vocabulary)
+            word2vec_embeddings = np.asarray(word2vec_vectors)
             print('finished fetching embeddings')
 
 
         return dep_type_list_dictionary, dep_path_word_dictionary, word2vec_embeddings
 
+def iter_instance_pairs(candidate_sentences, entity_1_list=None, entity_2_list=None):
+    """
+    builds unlabeled forward and reverse instances for entity pairs in sentences
+    :param candidate_sentences:
+    :param entity_1_list: optional ids entity 1 must be in
+    :param entity_2_list: optional ids entity 2 must be in
+    :return: generator of (forward instance, reverse instance)
+    """
+    for candidate_sentence in candidate_sentences:
+        entity_pairs = candidate_sentence.get_entity_pairs()
+
+        for pair in entity_pairs:
+            entity_1_token = candidate_sentence.get_token(pair[0][0])
+            entity_2_token = candidate_sentence.get_token(pair[1][0])
+            entity_1 = entity_1_token.get_normalized_ner().split('|')
+            entity_2 = entity_2_token.get_normalized_ner().split('|')
+
+            if entity_1_list is not None:
+                if len(set(entity_1).intersection(entity_1_list)) == 0:
+                    continue
+
+                # check if entity_2 overlaps with entity_1_list if so continue
+                if len(set(entity_2).intersection(entity_1_list)) > 0:
+                    continue
+
+            if entity_2_list is not None:
+                if len(set(entity_2).intersection(entity_2_list)) == 0:
+                    continue
+
+                # check if entity_1 overlaps with entity_2_list if so continue
+                if len(set(entity_1).intersection(entity_2_list)) > 0:
+                    continue
 
+            forward_train_instance = Instance(candidate_sentence, pair[0], pair[1], None)
+            reverse_train_instance = Instance(candidate_sentence, pair[1], pair[0], None)
+            yield forward_train_instance, reverse_train_instance
+
+def count_file_vocabularies(abstract_file):
+    """
+    worker counting the feature vocabularies of one abstract file
+    :param abstract_file: (name, path) of abstract file
+    :return: count_vocabularies result
+    """
+    name, xmlpath = abstract_file
+    print(name)
+    candidate_sentences = iter_xml_sentences(xmlpath, worker_state['entity_a'], worker_state['entity_b'])
+    return count_vocabularies(iter_instance_pairs(candidate_sentences, worker_state['entity_1_list'],
+                                                  worker_state['entity_2_list']))
+
+def build_dictionaries_from_directory(directory_folder,entity_a,entity_b, entity_1_list=None,entity_2_list=None,LSTM=False,
+                                      num_workers=1, prune_embeddings=False, min_count=100, max_size=None,
+                                      sketch_width=None, all_pairs_min_tokens=None, max_token_distance=None,
+                                      max_pairs=None):
+    """
+    build feature dictionaries from directory of abstracts, counts of each file are merged as they are done
+    :param directory_folder:
+    :param entity_a:
+    :param entity_b:
+    :param entity_1_list:
+    :param entity_2_list:
+    :param LSTM:
+    :param num_workers: number of processes counting vocabularies
+    :param prune_embeddings: keep only word2vec words that occur in dependency paths
+    :param min_count: minimum count of kept features
+    :param max_size: maximum number of features kept per dictionary, None keeps every frequent enough feature
+    :param sketch_width: count-min sketch width for approximate counting of very large corpora, None counts exactly
+    :param all_pairs_min_tokens: sentences with at least this many tokens compute all shortest path trees at once
+    :param max_token_distance: skip entity pairs with more tokens between their mentions, None keeps every pair
+    :param max_pairs: entity pairs generated per sentence, None keeps every pair
+    :return:
+    """
+    print(directory_folder)
+    abstract_files = list(iter_abstract_files(directory_folder))
+    settings = sentence_settings(all_pairs_min_tokens, max_token_distance, max_pairs)
+    set_sentence_settings(settings)
+    state = {'entity_a': entity_a, 'entity_b': entity_b, 'entity_1_list': entity_1_list, 'entity_2_list': entity_2_list,
+             'sentence_settings': settings}
+    vocabulary_counts = iter_map_abstract_files(count_file_vocabularies, abstract_files, state, num_workers)
+
+    path_word_vocabulary, \
+    dep_type_vocabulary, \
+    dep_type_word_elements_vocabulary, \
+    words_between_entities_vocabulary, \
+    dep_type_list_vocabulary = merge_vocabulary_counts(vocabulary_counts, min_count, sketch_width)
+
+    return build_feature_dictionaries(path_word_vocabulary, dep_type_vocabulary, dep_type_word_elements_vocabulary,
+                                      words_between_entities_vocabulary, dep_type_list_vocabulary, LSTM, prune_embeddings,
+                                      min_count, max_size)
+
+def write_file_tfrecord(record_item):
+    """
+    worker building the feed forward tfrecord of one abstract file
+    :param record_item: (abstract file, tfrecord file)
+    :return: tfrecord file
+    """
+    xmlpath, tfrecord_file = record_item
+    state = worker_state
+    test_sentences = iter_xml_sentences(xmlpath, state['entity_a'], state['entity_b'])
+    candidate_instances = build_instances_testing(test_sentences, state['dep_dictionary'], state['dep_path_word_dictionary'],
+                                                  state['dep_element_dictionary'], state['between_word_dictionary'],
+                                                  state['distant_interactions'], state['reverse_distant_interactions'],
+                                                  state['key_order'], state['supplemental_dict'])
+
+    X = []
+    y = []
+    for ci in candidate_instances:
+        X.append(ci.features)
+        y.append(ci.label)
+    labels = np.array(y)
+
+    return np_to_tfrecord(X,labels,tfrecord_file,state['compression'])
 
 def build_instances_from_directory(directory_folder, entity_a, entity_b, dep_dictionary, dep_path_word_dictionary, dep_element_dictionary, between_word_dictionary,
-                                   distant_interactions, reverse_distant_interactions, key_order,supplemental_dict):
+                                   distant_interactions, reverse_distant_interactions, key_order,supplemental_dict,num_workers=1,
+                                   compression=None, all_pairs_min_tokens=None, max_token_distance=None,
+                                   max_pairs=None):
     """
     build instances from directory of abstract sentences
     :param directory_folder:
@@ -634,37 +1097,57 @@ def build_instances_from_directory(directory_folder, entity_a, entity_b, dep_dic
     :param distant_interactions:
     :param reverse_distant_interactions:
     :param key_order:
-    :return:
+    :param num_workers: number of processes writing tfrecord files
+    :param compression: None, 'GZIP' or 'ZLIB' compression of tfrecord files
+    :param all_pairs_min_tokens: sentences with at least this many tokens compute all shortest path trees at once
+    :param max_token_distance: skip entity pairs with more tokens between their mentions, None keeps every pair
+    :param max_pairs: entity pairs generated per sentence, None keeps every pair
+    :return: list of tfrecord files, only new or changed abstracts are featurized again
     """
-    total_dataset= []
-    if os.path.isdir(directory_folder+'_tf_record') == False:
-        os.mkdir(directory_folder+'_tf_record')
-    for path, subdirs, files in os.walk(directory_folder):
-        for name in files:
-            if name.endswith('.txt'):
-                #print(name)
-                xmlpath = os.path.join(path, name)
-                test_sentences, pmids = load_xml(xmlpath, entity_a, entity_b)
-                candidate_instances = build_instances_testing(test_sentences, dep_dictionary, dep_path_word_dictionary, dep_element_dictionary, between_word_dictionary,
-                            distant_interactions,reverse_distant_interactions, key_order, supplemental_dict)
-
-                X = []
-                y = []
-                for ci in candidate_instances:
-                    X.append(ci.features)
-                    y.append(ci.label)
-                features = np.array(X)
-                labels = np.array(y)
-
+    record_folder = directory_folder + '_tf_record'
+    if os.path.isdir(record_folder) == False:
+        os.mkdir(record_folder)
+    settings = sentence_settings(all_pairs_min_tokens, max_token_distance, max_pairs)
+    set_sentence_settings(settings)
+    state = {'compression': compression, 'entity_a': entity_a, 'entity_b': entity_b,
+             'dep_dictionary': dep_dictionary, 'dep_path_word_dictionary': dep_path_word_dictionary,
+             'dep_element_dictionary': dep_element_dictionary, 'between_word_dictionary': between_word_dictionary,
+             'distant_interactions': distant_interactions, 'reverse_distant_interactions': reverse_distant_interactions,
+             'key_order': key_order, 'supplemental_dict': supplemental_dict, 'sentence_settings': settings}
+    fingerprints = {'dictionaries': fingerprint(dep_dictionary, dep_path_word_dictionary, dep_element_dictionary,
+                                                between_word_dictionary),
+                    'distant_kb': distant_kb_fingerprint(distant_interactions, reverse_distant_interactions, key_order)}
+    fingerprints.update(sentence_fingerprints())
+
+    record_items = []
+    for name, xmlpath in iter_abstract_files(directory_folder):
+        tfrecord_file = record_folder + '/' + name.replace('.txt',tfrecord_io.record_extension(compression))
+        record_items.append((tfrecord_file, xmlpath, (xmlpath, tfrecord_file)))
+    total_dataset = update_record_folder(record_folder, write_file_tfrecord, record_items, state, fingerprints, num_workers)
 
-                tfrecord_filename = name.replace('.txt','.tfrecord')
+    return total_dataset
 
-                total_dataset.append(np_to_tfrecord(features,labels,directory_folder +'_tf_record/'+ tfrecord_filename))
+def write_file_lstm_record(record_item):
+    """
+    worker building the lstm tfrecord or npy shard of one abstract file
+    :param record_item: (abstract file, record file)
+    :return: record file
+    """
+    xmlpath, record_file = record_item
+    state = worker_state
+    test_sentences = iter_xml_sentences(xmlpath, state['entity_a'], state['entity_b'])
+    candidate_instances = build_instances_testing(test_sentences, None, state['dep_path_word_dictionary'], None, None,
+                                                  state['distant_interactions'], state['reverse_distant_interactions'],
+                                                  state['key_order'], state['supplemental_dict'],
+                                                  dep_path_type_dictionary=state['dep_type_list_dictionary'])
 
-    return total_dataset
+    return write_lstm_record(lstm_feature_columns(candidate_instances), record_file, state['record_format'],
+                             state['compression'])
 
 def build_LSTM_instances_from_directory(directory_folder, entity_a, entity_b, dep_type_list_dictionary, dep_path_word_dictionary,
-                                        distant_interactions, reverse_distant_interactions, key_order,supplemental_dict):
+                                        distant_interactions, reverse_distant_interactions, key_order,supplemental_dict,num_workers=1,
+                                        record_format='tfrecord', compression=None, all_pairs_min_tokens=None,
+                                        max_token_distance=None, max_pairs=None):
     """
     build lstm instances from directory of abstract sentences
     :param directory_folder:
@@ -675,47 +1158,40 @@ def build_LSTM_instances_from_directory(directory_folder, entity_a, entity_b, de
     :param distant_interactions:
     :param reverse_distant_interactions:
     :param key_order:
-    :return:
+    :param num_workers: number of processes writing tfrecord files
+    :param record_format: 'tfrecord' or 'npy' for memory mappable shards
+    :param compression: None, 'GZIP' or 'ZLIB' compression of tfrecord files
+    :param all_pairs_min_tokens: sentences with at least this many tokens compute all shortest path trees at once
+    :param max_token_distance: skip entity pairs with more tokens between their mentions, None keeps every pair
+    :param max_pairs: entity pairs generated per sentence, None keeps every pair
+    :return: list of record files, only new or changed abstracts are featurized again
     """
-    total_dataset= []
-    if os.path.isdir(directory_folder+'_lstm_tf_record') == False:
-        os.mkdir(directory_folder+'_lstm_tf_record')
-    for path, subdirs, files in os.walk(directory_folder):
-        for name in files:
-            if name.endswith('.txt'):
-                #print(name)
-                xmlpath = os.path.join(path, name)
-                test_sentences, pmids = load_xml(xmlpath, entity_a, entity_b)
-                candidate_instances = build_instances_testing(test_sentences, None, dep_path_word_dictionary, None, None,
-                                                              distant_interactions, reverse_distant_interactions, key_order, supplemental_dict,dep_path_type_dictionary=dep_type_list_dictionary)
-
-                dep_path_list_features = []
-                dep_word_features = []
-                dep_type_path_length = []
-                dep_word_path_length = []
-                labels = []
-                instance_sentences = set()
-                entity_a_dict = {}
-                entity_b_dict = {}
-                for t in candidate_instances:
-
-                    # instance_sentences.add(' '.join(t.sentence.sentence_words))
-                    dep_path_list_features.append(t.features[0:100])
-                    dep_word_features.append(t.features[100:200])
-                    dep_type_path_length.append(t.features[200])
-                    dep_word_path_length.append(t.features[201])
-                    labels.append(t.label)
-
-
-                tfrecord_filename = name.replace('.txt','.tfrecord')
-
-                total_dataset.append(np_to_lstm_tfrecord(dep_path_list_features,dep_word_features,dep_type_path_length,
-                                                         dep_word_path_length,labels,directory_folder +'_lstm_tf_record/'+ tfrecord_filename))
+    record_folder = directory_folder + lstm_record_folders[record_format]
+    if os.path.isdir(record_folder) == False:
+        os.mkdir(record_folder)
+    settings = sentence_settings(all_pairs_min_tokens, max_token_distance, max_pairs)
+    set_sentence_settings(settings)
+    state = {'record_format': record_format, 'compression': compression, 'entity_a': entity_a, 'entity_b': entity_b,
+             'dep_type_list_dictionary': dep_type_list_dictionary, 'dep_path_word_dictionary': dep_path_word_dictionary,
+             'distant_interactions': distant_interactions, 'reverse_distant_interactions': reverse_distant_interactions,
+             'key_order': key_order, 'supplemental_dict': supplemental_dict, 'sentence_settings': settings}
+    fingerprints = {'dictionaries': fingerprint(dep_type_list_dictionary, dep_path_word_dictionary),
+                    'distant_kb': distant_kb_fingerprint(distant_interactions, reverse_distant_interactions, key_order),
+                    'layout': lstm_record_layout}
+    fingerprints.update(sentence_fingerprints())
+
+    record_items = []
+    for name, xmlpath in iter_abstract_files(directory_folder):
+        record_file = record_folder + '/' + name.replace('.txt', lstm_record_extension(record_format, compression))
+        record_items.append((record_file, xmlpath, (xmlpath, record_file)))
+    total_dataset = update_record_folder(record_folder, write_file_lstm_record, record_items, state, fingerprints,
+                                         num_workers)
 
     return total_dataset
 
 def build_test_instances_from_directory(directory_folder, entity_a, entity_b, dep_dictionary, dep_path_word_dictionary, dep_element_dictionary, between_word_dictionary,
-                                   distant_interactions, reverse_distant_interactions, key_order,supplemental_dict):
+                                   distant_interactions, reverse_distant_interactions, key_order,supplemental_dict,
+                                   all_pairs_min_tokens=None, max_token_distance=None, max_pairs=None):
     """
     build test instances from directory of abstract folders does not make tfrecord files
     :param directory_folder:
@@ -728,30 +1204,30 @@ def build_test_instances_from_directory(directory_folder, entity_a, entity_b, de
     :param distant_interactions:
     :param reverse_distant_interactions:
     :param key_order:
-    :return:
+    :param all_pairs_min_tokens: sentences with at least this many tokens compute all shortest path trees at once
+    :param max_token_distance: skip entity pairs with more tokens between their mentions, None keeps every pair
+    :param max_pairs: entity pairs generated per sentence, None keeps every pair
+    :return: InstanceTable of test instances, features and labels
     """
+    set_sentence_settings(sentence_settings(all_pairs_min_tokens, max_token_distance, max_pairs))
 
     total_features = []
-    total_labels = []
-    total_instances = []
-    for path, subdirs, files in os.walk(directory_folder):
-        for name in files:
-            if name.endswith('.txt'):
-                #print(name)
-                xmlpath = os.path.join(path, name)
-                test_sentences, pmids = load_xml(xmlpath, entity_a, entity_b)
-                candidate_instances = build_instances_testing(test_sentences, dep_dictionary, dep_path_word_dictionary, dep_element_dictionary, between_word_dictionary,
-                            distant_interactions,reverse_distant_interactions, key_order, supplemental_dict)
+    total_instances = InstanceTable(len(key_order))
+    for name, xmlpath in iter_abstract_files(directory_folder):
+        test_sentences = iter_xml_sentences(xmlpath, entity_a, entity_b)
+        candidate_instances = build_instances_testing(test_sentences, dep_dictionary, dep_path_word_dictionary, dep_element_dictionary, between_word_dictionary,
+                    distant_interactions,reverse_distant_interactions, key_order, supplemental_dict)
 
-                for ci in candidate_instances:
-                    total_instances.append(ci)
-                    total_features.append(ci.features)
-                    total_labels.append(ci.label)
+        # only the output fields and features are kept, the instances and sentences of the file are released
+        for ci in candidate_instances:
+            total_instances.append(ci)
+            total_features.append(array('i', ci.features))
 
-    return total_instances,total_features,total_labels
+    return total_instances,total_features,total_instances.get_labels()
 
 def build_LSTM_test_instances_from_directory(directory_folder, entity_a, entity_b, dep_path_type_dictionary, dep_path_word_dictionary,
-                                   distant_interactions, reverse_distant_interactions, key_order,supplemental_dict):
+                                   distant_interactions, reverse_distant_interactions, key_order,supplemental_dict,
+                                   all_pairs_min_tokens=None, max_token_distance=None, max_pairs=None):
     """
     Build LSTM test instances from directory of abstract folders does not make tfrecord files
     :param directory_folder:
@@ -762,68 +1238,390 @@ def build_LSTM_test_instances_from_directory(directory_folder, entity_a, entity_
     :param distant_interactions:
     :param reverse_distant_interactions:
     :param key_order:
-    :return:
+    :param all_pairs_min_tokens: sentences with at least this many tokens compute all shortest path trees at once
+    :param max_token_distance: skip entity pairs with more tokens between their mentions, None keeps every pair
+    :param max_pairs: entity pairs generated per sentence, None keeps every pair
+    :return: InstanceTable of test instances, features and labels
     """
+    set_sentence_settings(sentence_settings(all_pairs_min_tokens, max_token_distance, max_pairs))
+
     total_dep_id_features = []
     total_dep_word_features = []
     total_dep_id_length = []
     total_dep_word_length = []
 
-    total_labels = []
-    total_instances = []
-    for path, subdirs, files in os.walk(directory_folder):
-        for name in files:
-            if name.endswith('.txt'):
-                #print(name)
-                xmlpath = os.path.join(path, name)
-                test_sentences, pmids = load_xml(xmlpath, entity_a, entity_b)
-                candidate_instances = build_instances_testing(test_sentences, None, dep_path_word_dictionary, None,
-                                                              None,
-                                                              distant_interactions, reverse_distant_interactions,
-                                                              key_order, supplemental_dict,
-                                                              dep_path_type_dictionary=dep_path_type_dictionary)
-
-                for ci in candidate_instances:
-                    total_instances.append(ci)
-                    total_dep_id_features.append(ci.features[0:100])
-                    total_dep_word_features.append(ci.features[100:200])
-                    total_dep_id_length.append(ci.features[200])
-                    total_dep_word_length.append(ci.features[201])
-                    total_labels.append(ci.label)
-
-    return total_instances,total_dep_id_features,total_dep_word_features,total_dep_id_length,total_dep_word_length,total_labels
-
-def ontology_recurse(term,path,ontology_dict):
-    path.add(term)
-    for t in ontology_dict[term]:
-        path = ontology_recurse(t,path,ontology_dict)
-    return path
+    total_instances = InstanceTable(len(key_order))
+    for name, xmlpath in iter_abstract_files(directory_folder):
+        test_sentences = iter_xml_sentences(xmlpath, entity_a, entity_b)
+        candidate_instances = build_instances_testing(test_sentences, None, dep_path_word_dictionary, None,
+                                                      None,
+                                                      distant_interactions, reverse_distant_interactions,
+                                                      key_order, supplemental_dict,
+                                                      dep_path_type_dictionary=dep_path_type_dictionary)
+
+        # only the output fields and features are kept, the instances and sentences of the file are released
+        for ci in candidate_instances:
+            total_instances.append(ci)
+            total_dep_id_features.append(array('i', ci.features[0]))
+            total_dep_word_features.append(array('i', ci.features[1]))
+            total_dep_id_length.append(ci.features[2])
+            total_dep_word_length.append(ci.features[3])
+
+    return total_instances,total_dep_id_features,total_dep_word_features,total_dep_id_length,total_dep_word_length,total_instances.get_labels()
+
+# layout of path cache records, caches written with another layout are rebuilt
+path_cache_layout = 'path_feature_tuples'
+
+def build_path_records(candidate_sentences):
+    """
+    builds the unlabeled path features of the forward and reverse instances of every entity pair in sentences
+    :param candidate_sentences:
+    :return: list of (entity_1 ids, entity_2 ids, gene_to_gene, forward path features, reverse path features)
+    tuples, path features are Instance.get_path_features tuples
+    """
+    path_records = []
+    for candidate_sentence in candidate_sentences:
+        entity_pairs = candidate_sentence.get_entity_pairs()
+
+        for pair in entity_pairs:
+            entity_1_token = candidate_sentence.get_token(pair[0][0])
+            entity_2_token = candidate_sentence.get_token(pair[1][0])
+            entity_1 = tuple(entity_1_token.get_normalized_ner().split('|'))
+            entity_2 = tuple(entity_2_token.get_normalized_ner().split('|'))
+
+            gene_to_gene = False
+            if 'GENE' in entity_1_token.get_ner() and 'GENE' in entity_2_token.get_ner():
+                gene_to_gene = True
+
+            forward_instance = Instance(candidate_sentence, pair[0], pair[1], None)
+            reverse_instance = Instance(candidate_sentence, pair[1], pair[0], None)
+            path_records.append((entity_1, entity_2, gene_to_gene, forward_instance.get_path_features(),
+                                 reverse_instance.get_path_features()))
+
+    return path_records
+
+def write_path_cache(cache_item):
+    """
+    worker parsing one abstract file into its path cache file
+    :param cache_item: (name, path, cache file) of abstract file
+    :return: cache file
+    """
+    name, xmlpath, cache_file = cache_item
+    print(name)
+    path_records = build_path_records(iter_xml_sentences(xmlpath, worker_state['entity_a'], worker_state['entity_b']))
+    # write then rename so an interrupted run never leaves a partial cache file
+    with open(cache_file + '.tmp', 'wb') as file:
+        pickle.dump(path_records, file, pickle.HIGHEST_PROTOCOL)
+    os.rename(cache_file + '.tmp', cache_file)
+    return cache_file
+
+def build_path_cache_from_directory(directory_folder, entity_a, entity_b, num_workers=1, all_pairs_min_tokens=None,
+                                    max_token_distance=None, max_pairs=None):
+    """
+    parses every abstract once and caches the unlabeled path features of its entity pairs,
+    abstracts that are unchanged since their cache file was written are not parsed again
+    :param directory_folder:
+    :param entity_a:
+    :param entity_b:
+    :param num_workers: number of processes parsing abstracts
+    :param all_pairs_min_tokens: sentences with at least this many tokens compute all shortest path trees at once
+    :param max_token_distance: skip entity pairs with more tokens between their mentions, None keeps every pair
+    :param max_pairs: entity pairs generated per sentence, None keeps every pair
+    :return: list of cache files
+    """
+    cache_folder = directory_folder + '_path_cache_' + entity_a + '_' + entity_b
+    if os.path.isdir(cache_folder) == False:
+        os.mkdir(cache_folder)
+
+    record_items = []
+    for name, xmlpath in iter_abstract_files(directory_folder):
+        cache_file = cache_folder + '/' + name.replace('.txt', '.pickle')
+        record_items.append((cache_file, xmlpath, (name, xmlpath, cache_file)))
+
+    settings = sentence_settings(all_pairs_min_tokens, max_token_distance, max_pairs)
+    set_sentence_settings(settings)
+    state = {'entity_a': entity_a, 'entity_b': entity_b, 'sentence_settings': settings}
+    fingerprints = {'layout': path_cache_layout}
+    fingerprints.update(sentence_fingerprints())
+    cache_files = update_record_folder(cache_folder, write_path_cache, record_items, state, fingerprints, num_workers)
+
+    return cache_files
+
+def load_path_cache(cache_file):
+    """
+    loads path records from cache file
+    :param cache_file:
+    :return: list of path records
+    """
+    with open(cache_file, 'rb') as file:
+        path_records = pickle.load(file)
+    return path_records
+
+def label_path_records(path_records, distant_interactions, key_order, stop_list):
+    """
+    labels cached path records and keeps the instances used for training and testing
+    :param path_records:
+    :param distant_interactions:
+    :param key_order:
+    :param stop_list:
+    :return: labelled instances
+    """
+    labelled_instances = []
+    for entity_1, entity_2, gene_to_gene, forward_features, reverse_features in path_records:
+        entity_1 = set(entity_1)
+        entity_2 = set(entity_2)
+        if len(entity_1.intersection(stop_list)) > 0 or len(entity_2.intersection(stop_list)) > 0:
+            continue
 
+        forward_instance = PathInstance(forward_features, [0] * len(key_order))
+        reverse_instance = PathInstance(reverse_features, [0] * len(key_order))
+        distant_label_pair(entity_1, entity_2, forward_instance, reverse_instance,
+                           distant_interactions, key_order)
+
+        labelled_instances.append(forward_instance)
+        if gene_to_gene is True:
+            labelled_instances.append(reverse_instance)
+
+    return labelled_instances
+
+def count_cache_vocabularies(cache_file):
+    """
+    worker counting the feature vocabularies of one path cache file
+    :param cache_file:
+    :return: count_vocabularies result
+    """
+    return count_vocabularies((PathInstance(path_record[3], None), PathInstance(path_record[4], None))
+                              for path_record in load_path_cache(cache_file))
+
+def build_dictionaries_from_cache(cache_files, LSTM=False, num_workers=1, prune_embeddings=False, min_count=100,
+                                  max_size=None, sketch_width=None):
+    """
+    build feature dictionaries from path cache files, counts of each file are merged as they are done
+    :param cache_files:
+    :param LSTM:
+    :param num_workers: number of processes counting vocabularies
+    :param prune_embeddings: keep only word2vec words that occur in dependency paths
+    :param min_count: minimum count of kept features
+    :param max_size: maximum number of features kept per dictionary, None keeps every frequent enough feature
+    :param sketch_width: count-min sketch width for approximate counting of very large corpora, None counts exactly
+    :return:
+    """
+    vocabulary_counts = iter_map_abstract_files(count_cache_vocabularies, cache_files, {}, num_workers)
+
+    path_word_vocabulary, \
+    dep_type_vocabulary, \
+    dep_type_word_elements_vocabulary, \
+    words_between_entities_vocabulary, \
+    dep_type_list_vocabulary = merge_vocabulary_counts(vocabulary_counts, min_count, sketch_width)
+
+    return build_feature_dictionaries(path_word_vocabulary, dep_type_vocabulary, dep_type_word_elements_vocabulary,
+                                      words_between_entities_vocabulary, dep_type_list_vocabulary, LSTM, prune_embeddings,
+                                      min_count, max_size)
+
+def write_cache_tfrecord(record_item):
+    """
+    worker building the feed forward tfrecord of one path cache file
+    :param record_item: (cache file, tfrecord file)
+    :return: tfrecord file
+    """
+    cache_file, tfrecord_file = record_item
+    state = worker_state
+    candidate_instances = label_path_records(load_path_cache(cache_file), state['distant_interactions'],
+                                             state['key_order'], state['stop_list'])
+
+    # batches are serialized and written in the writer thread while the next batch is featurized, a failing
+    # batch stops the thread and removes the partial file so the worker can go on with the next file
+    y = []
+    with tfrecord_io.BatchRecordWriter(tfrecord_file, tfrecord_io.feed_forward_examples, state['compression']) as writer:
+        for start in range(0, len(candidate_instances), record_batch_size):
+            batch = candidate_instances[start:start + record_batch_size]
+            for ci in batch:
+                ci.build_features(state['dep_dictionary'], state['dep_path_word_dictionary'],
+                                  state['dep_element_dictionary'], state['between_word_dictionary'])
+            batch_labels = [ci.label for ci in batch]
+            writer.write_batch([ci.features for ci in batch], batch_labels)
+            y.extend(batch_labels)
+    record_stats.write_record_stats(y, tfrecord_file)
+
+    return tfrecord_file
+
+def build_instances_from_cache(cache_files, directory_folder, dep_dictionary, dep_path_word_dictionary, dep_element_dictionary,
+                               between_word_dictionary, distant_interactions, reverse_distant_interactions, key_order,
+                               num_workers=1, compression=None):
+    """
+    build tfrecord files from path cache files without parsing abstracts again
+    :param cache_files:
+    :param directory_folder: abstract directory the cache was built from
+    :param dep_dictionary:
+    :param dep_path_word_dictionary:
+    :param dep_element_dictionary:
+    :param between_word_dictionary:
+    :param distant_interactions:
+    :param reverse_distant_interactions:
+    :param key_order:
+    :param num_workers: number of processes writing tfrecord files
+    :param compression: None, 'GZIP' or 'ZLIB' compression of tfrecord files
+    :return: list of tfrecord files, only new or changed cache files are featurized again
+    """
+    stop_list = get_stop_list(os.path.dirname(os.path.realpath(__file__)) + '/static_data/stop_list.txt')
+    record_folder = directory_folder + '_tf_record'
+    if os.path.isdir(record_folder) == False:
+        os.mkdir(record_folder)
+    state = {'compression': compression, 'stop_list': stop_list,
+             'dep_dictionary': dep_dictionary, 'dep_path_word_dictionary': dep_path_word_dictionary,
+             'dep_element_dictionary': dep_element_dictionary, 'between_word_dictionary': between_word_dictionary,
+             'distant_interactions': distant_interactions, 'key_order': key_order}
+    fingerprints = {'dictionaries': fingerprint(dep_dictionary, dep_path_word_dictionary, dep_element_dictionary,
+                                                between_word_dictionary),
+                    'distant_kb': distant_kb_fingerprint(distant_interactions, reverse_distant_interactions, key_order)}
+
+    record_items = []
+    for cache_file in cache_files:
+        tfrecord_file = record_folder + '/' + os.path.basename(cache_file).replace('.pickle',tfrecord_io.record_extension(compression))
+        record_items.append((tfrecord_file, cache_file, (cache_file, tfrecord_file)))
+    total_dataset = update_record_folder(record_folder, write_cache_tfrecord, record_items, state, fingerprints, num_workers)
+
+    return total_dataset
+
+def write_cache_lstm_record(record_item):
+    """
+    worker building the lstm tfrecord or npy shard of one path cache file
+    :param record_item: (cache file, record file)
+    :return: record file
+    """
+    cache_file, record_file = record_item
+    state = worker_state
+    candidate_instances = label_path_records(load_path_cache(cache_file), state['distant_interactions'],
+                                             state['key_order'], state['stop_list'])
+
+    if state['record_format'] == 'npy':
+        for t in candidate_instances:
+            t.build_lstm_features(state['dep_type_list_dictionary'], state['dep_path_word_dictionary'])
+        return write_lstm_record(lstm_feature_columns(candidate_instances), record_file, 'npy')
+
+    # batches are serialized and written in the writer thread while the next batch is featurized, a failing
+    # batch stops the thread and removes the partial file so the worker can go on with the next file
+    labels = []
+    with tfrecord_io.BatchRecordWriter(record_file, tfrecord_io.lstm_examples, state['compression']) as writer:
+        for start in range(0, len(candidate_instances), record_batch_size):
+            batch = candidate_instances[start:start + record_batch_size]
+            for t in batch:
+                t.build_lstm_features(state['dep_type_list_dictionary'], state['dep_path_word_dictionary'])
+            columns = lstm_feature_columns(batch)
+            writer.write_batch(*columns)
+            labels.extend(columns[-1])
+    record_stats.write_record_stats(labels, record_file)
+
+    return record_file
+
+def build_LSTM_instances_from_cache(cache_files, directory_folder, dep_type_list_dictionary, dep_path_word_dictionary,
+                                    distant_interactions, reverse_distant_interactions, key_order, num_workers=1,
+                                    record_format='tfrecord', compression=None):
+    """
+    build lstm tfrecord files or npy shards from path cache files without parsing abstracts again
+    :param cache_files:
+    :param directory_folder: abstract directory the cache was built from
+    :param dep_type_list_dictionary:
+    :param dep_path_word_dictionary:
+    :param distant_interactions:
+    :param reverse_distant_interactions:
+    :param key_order:
+    :param num_workers: number of processes writing tfrecord files
+    :param record_format: 'tfrecord' or 'npy' for memory mappable shards
+    :param compression: None, 'GZIP' or 'ZLIB' compression of tfrecord files
+    :return: list of record files, only new or changed cache files are featurized again
+    """
+    stop_list = get_stop_list(os.path.dirname(os.path.realpath(__file__)) + '/static_data/stop_list.txt')
+    record_folder = directory_folder + lstm_record_folders[record_format]
+    if os.path.isdir(record_folder) == False:
+        os.mkdir(record_folder)
+    state = {'record_format': record_format, 'compression': compression, 'stop_list': stop_list,
+             'dep_type_list_dictionary': dep_type_list_dictionary, 'dep_path_word_dictionary': dep_path_word_dictionary,
+             'distant_interactions': distant_interactions, 'key_order': key_order}
+    fingerprints = {'dictionaries': fingerprint(dep_type_list_dictionary, dep_path_word_dictionary),
+                    'distant_kb': distant_kb_fingerprint(distant_interactions, reverse_distant_interactions, key_order),
+                    'layout': lstm_record_layout}
+
+    record_items = []
+    for cache_file in cache_files:
+        record_file = record_folder + '/' + os.path.basename(cache_file).replace('.pickle', lstm_record_extension(record_format, compression))
+        record_items.append((record_file, cache_file, (cache_file, record_file)))
+    total_dataset = update_record_folder(record_folder, write_cache_lstm_record, record_items, state, fingerprints,
+                                         num_workers)
+
+    return total_dataset
+
+class OntologyClosure(dict):
+    def __init__(self, closure, digest):
+        '''Ancestor sets of ontology terms, identified by the hash of the ontology file so fingerprints
+        don't have to read every set'''
+        dict.__init__(self, closure)
+        self.digest = digest
+
+    def fingerprint(self):
+        return 'ontology:' + self.digest
+
+def ontology_closure(ontology_dict):
+    """
+    transitive is_a closure of every term, each ancestor set is built once from the sets of its parents
+    :param ontology_dict: term to set of parent terms
+    :return: dictionary of term to frozenset of the term and its ancestors
+    """
+    closure = {}
+    for root in ontology_dict:
+        if root in closure:
+            continue
+        # parents are closed before their children, a parent already on the path is a cycle and skipped
+        stack = [(root, iter(ontology_dict.get(root, ())))]
+        on_path = set([root])
+        while len(stack) > 0:
+            term, parents = stack[-1]
+            for t in parents:
+                if t not in closure and t not in on_path:
+                    stack.append((t, iter(ontology_dict.get(t, ()))))
+                    on_path.add(t)
+                    break
+            else:
+                stack.pop()
+                on_path.discard(term)
+                path = set([term])
+                for t in ontology_dict.get(term, ()):
+                    path.update(closure.get(t, ()))
+                closure[term] = frozenset(path)
+    return closure
 
 def get_ontology_dictionary(filename):
-    file = open(filename,'rU')
-    lines = file.readlines()
-    file.close()
+    """
+    ancestor sets of every term of an obo ontology, cached next to the ontology file and rebuilt when its hash changes
+    :param filename: obo file
+    :return: OntologyClosure of term to frozenset of the term and its ancestors
+    """
+    digest = file_md5(filename)
+    cache_file = filename + '.closure.pickle'
+    if os.path.isfile(cache_file):
+        with open(cache_file, 'rb') as file:
+            cached = pickle.load(file)
+        if cached['md5'] == digest:
+            return OntologyClosure(cached['closure'], digest)
 
     ontology_dict = {}
     id = ''
-    for l in range(len(lines)):
-        line = lines[l]
-        if line.startswith('id:'):
-            id = line.split()[1]
-            if id not in ontology_dict:
-                ontology_dict[id] = set()
-        if line.startswith('is_a'):
-            is_a = line.split()[1]
-            ontology_dict[id].add(is_a)
-
-    path_dict = {}
-    for o in ontology_dict:
-        path = set()
-        path = ontology_recurse(o, path, ontology_dict)
-        path_dict[o] = path
-
-    return path_dict
+    with open(filename,'rU') as file:
+        for line in file:
+            if line.startswith('id:'):
+                id = line.split()[1]
+                if id not in ontology_dict:
+                    ontology_dict[id] = set()
+            if line.startswith('is_a'):
+                is_a = line.split()[1]
+                ontology_dict[id].add(is_a)
+
+    closure = ontology_closure(ontology_dict)
+    with open(cache_file + '.tmp', 'wb') as file:
+        pickle.dump({'md5': digest, 'closure': closure}, file, pickle.HIGHEST_PROTOCOL)
+    os.rename(cache_file + '.tmp', cache_file)
+
+    return OntologyClosure(closure, digest)
 
 def get_sentence_data_from_directory(directory_folder, entity_a, entity_b, supplemental_dict):
     """
@@ -841,31 +1639,27 @@ def get_sentence_data_from_directory(directory_folder, entity_a, entity_b, suppl
 
     entity_1_dict = {}
     entity_2_dict = {}
-    for path, subdirs, files in os.walk(directory_folder):
-        for name in files:
-            if name.endswith('.txt'):
-                #print(name)
-                xmlpath = os.path.join(path, name)
-                test_sentences, pmids = load_xml(xmlpath, entity_a, entity_b)
-                for test_sentence in test_sentences:
-                    entities = test_sentence.get_entities()
-                    if entity_a in entities:
-                        for phrase in entities[entity_a]:
-                            entity_a_phrase= '_'.join([test_sentence.get_token(word).lemma for word in phrase])
-                            entity_a_normalized = test_sentence.get_token(phrase[0]).get_normalized_ner()
-                            e_a = entity_a_normalized + '|' + entity_a_phrase
-                            if e_a not in entity_1_dict:
-                                entity_1_dict[e_a] = 0
-                            entity_1_dict[e_a]+=1
-
-                        if entity_b in entities:
-                            for phrase in entities[entity_b]:
-                                entity_b_phrase = '_'.join([test_sentence.get_token(word).lemma for word in phrase])
-                                entity_b_normalized = test_sentence.get_token(phrase[0]).get_normalized_ner()
-                                e_b = entity_b_normalized + '|' + entity_b_phrase
-                                if e_b not in entity_2_dict:
-                                    entity_2_dict[e_b] = 0
-                                entity_2_dict[e_b] += 1
+    for name, xmlpath in iter_abstract_files(directory_folder):
+        test_sentences = iter_xml_sentences(xmlpath, entity_a, entity_b)
+        for test_sentence in test_sentences:
+            entities = test_sentence.get_entities()
+            if entity_a in entities:
+                for phrase in entities[entity_a]:
+                    entity_a_phrase= '_'.join([test_sentence.get_token(word).lemma for word in phrase])
+                    entity_a_normalized = test_sentence.get_token(phrase[0]).get_normalized_ner()
+                    e_a = entity_a_normalized + '|' + entity_a_phrase
+                    if e_a not in entity_1_dict:
+                        entity_1_dict[e_a] = 0
+                    entity_1_dict[e_a]+=1
+
+                if entity_b in entities:
+                    for phrase in entities[entity_b]:
+                        entity_b_phrase = '_'.join([test_sentence.get_token(word).lemma for word in phrase])
+                        entity_b_normalized = test_sentence.get_token(phrase[0]).get_normalized_ner()
+                        e_b = entity_b_normalized + '|' + entity_b_phrase
+                        if e_b not in entity_2_dict:
+                            entity_2_dict[e_b] = 0
+                        entity_2_dict[e_b] += 1
 
 
     return entity_1_dict,entity_2_dict
@@ -0,0 +1,51 @@
+import numpy as np
+
+
+class BatchAccumulator(object):
+    def __init__(self, num_instances, num_columns, dtype=np.float32):
+        '''Collects batches of predictions or labels into a preallocated array instead of
+        growing an array with np.append'''
+        self.values = np.zeros((max(num_instances, 0), num_columns), dtype=dtype)
+        self.size = 0
+
+    def append(self, batch):
+        '''Copies batch into the next free rows, doubling the array if the instance count was too small'''
+        batch = np.reshape(batch, (-1, self.values.shape[1]))
+        end = self.size + batch.shape[0]
+        if end > self.values.shape[0]:
+            values = np.zeros((max(end, 2 * self.values.shape[0]), self.values.shape[1]), dtype=self.values.dtype)
+            values[:self.size] = self.values[:self.size]
+            self.values = values
+        self.values[self.size:end] = batch
+        self.size = end
+
+    def get_values(self):
+        '''Returns the filled rows'''
+        return self.values[:self.size]
+
+
+class LabelMetrics(object):
+    def __init__(self, num_labels):
+        '''Running per label confusion counts, f1 scores are computed without keeping predictions'''
+        self.true_positives = np.zeros(num_labels, dtype=np.int64)
+        self.false_positives = np.zeros(num_labels, dtype=np.int64)
+        self.false_negatives = np.zeros(num_labels, dtype=np.int64)
+        self.num_instances = 0
+
+    def update(self, predicted_class, labels):
+        '''Adds confusion counts of batch of predicted classes and true labels'''
+        num_labels = self.true_positives.shape[0]
+        predicted_class = np.reshape(predicted_class, (-1, num_labels)) > 0.5
+        labels = np.reshape(labels, (-1, num_labels)) > 0.5
+        self.true_positives += np.count_nonzero(predicted_class & labels, axis=0)
+        self.false_positives += np.count_nonzero(predicted_class & ~labels, axis=0)
+        self.false_negatives += np.count_nonzero(~predicted_class & labels, axis=0)
+        self.num_instances += labels.shape[0]
+
+    def f1_scores(self):
+        '''Returns f1 score per label, 0 for labels without positives or predictions like sklearn'''
+        denominator = 2 * self.true_positives + self.false_positives + self.false_negatives
+        f1 = np.zeros(self.true_positives.shape[0], dtype=np.float64)
+        nonzero = denominator > 0
+        f1[nonzero] = 2.0 * self.true_positives[nonzero] / denominator[nonzero]
+        return f1
@@ -0,0 +1,119 @@
+import os
+import tensorflow as tf
+from tensorflow.core.framework import node_def_pb2
+
+# inputs of exported inference graphs, the training graphs name them so they can be fed directly
+feed_forward_inputs = ['feature_indices', 'feature_batch_size']
+lstm_inputs = ['dependency_ids', 'word_ids', 'dependency_type_sequence_length', 'dependency_word_sequence_length']
+inference_outputs = ['predict_prob', 'class_predict']
+frozen_extension = '.pb'
+
+
+def frozen_model_file(model_file):
+    """
+    path of the frozen inference graph exported next to a trained model
+    :param model_file: path of trained model
+    :return: frozen graph file path
+    """
+    return model_file + 'frozen_inference_graph' + frozen_extension
+
+def is_frozen_model(model_file):
+    """
+    checks if model file is a frozen inference graph instead of a checkpoint
+    :param model_file: path of model
+    :return: True if frozen graph
+    """
+    return model_file.endswith(frozen_extension)
+
+def inference_model_file(model_file):
+    """
+    frozen inference graph of a trained model if it was exported, otherwise the trained model
+    :param model_file: path of trained model
+    :return: model file path to load for inference
+    """
+    if is_frozen_model(model_file) is False and os.path.isfile(frozen_model_file(model_file)):
+        return frozen_model_file(model_file)
+    return model_file
+
+def placeholder_node(tensor):
+    """
+    placeholder replacing the op of a named input tensor
+    :param tensor: input tensor
+    :return: placeholder node def
+    """
+    node = node_def_pb2.NodeDef()
+    node.op = 'Placeholder'
+    node.name = tensor.op.name
+    node.attr['dtype'].type = tensor.dtype.as_datatype_enum
+    node.attr['shape'].shape.CopyFrom(tensor.shape.as_proto())
+    return node
+
+def constant_node(tensor, value):
+    """
+    constant replacing the op of a tensor fed with the same value at inference time
+    :param tensor: tensor such as the dropout keep probability
+    :param value: constant value
+    :return: constant node def
+    """
+    node = node_def_pb2.NodeDef()
+    node.op = 'Const'
+    node.name = tensor.op.name
+    node.attr['dtype'].type = tensor.dtype.as_datatype_enum
+    node.attr['value'].tensor.CopyFrom(tf.make_tensor_proto(value, dtype=tensor.dtype))
+    return node
+
+def export_inference_graph(model_file, input_names, export_file=None):
+    """
+    freezes the variables of a trained model into constants and prunes the graph to its inputs and
+    probability outputs, so the dataset, iterator and optimizer ops are not loaded at inference time
+    :param model_file: path of trained model
+    :param input_names: names of input tensors that become placeholders
+    :param export_file: frozen graph file path, defaults to frozen_model_file
+    :return: frozen graph file path
+    """
+    if export_file is None:
+        export_file = frozen_model_file(model_file)
+
+    graph = tf.Graph()
+    with graph.as_default():
+        restored_model = tf.train.import_meta_graph(model_file + '.meta', clear_devices=True)
+        with tf.Session(graph=graph) as sess:
+            restored_model.restore(sess, model_file)
+            for name in input_names:
+                if name not in [op.name for op in graph.get_operations()]:
+                    raise ValueError('model has no input ' + name + ', it was trained before inputs were named')
+            frozen_graph_def = tf.graph_util.convert_variables_to_constants(sess, graph.as_graph_def(),
+                                                                            inference_outputs)
+
+        # the inputs become placeholders and dropout is turned off, models without hidden layers have no dropout
+        replaced_nodes = dict((name, placeholder_node(graph.get_tensor_by_name(name + ':0'))) for name in input_names)
+        if 'keep_prob' in [node.name for node in frozen_graph_def.node]:
+            replaced_nodes['keep_prob'] = constant_node(graph.get_tensor_by_name('keep_prob:0'), 1.0)
+
+    inference_graph_def = tf.GraphDef()
+    for node in frozen_graph_def.node:
+        if node.name in replaced_nodes:
+            inference_graph_def.node.extend([replaced_nodes[node.name]])
+        else:
+            inference_graph_def.node.extend([node])
+    inference_graph_def = tf.graph_util.extract_sub_graph(inference_graph_def, inference_outputs)
+
+    with open(export_file + '.tmp', 'wb') as file:
+        file.write(inference_graph_def.SerializeToString())
+    os.rename(export_file + '.tmp', export_file)
+    print('exported ' + export_file)
+    return export_file
+
+def load_frozen_graph(export_file):
+    """
+    loads a frozen inference graph into a new graph without name prefixes
+    :param export_file: frozen graph file path
+    :return: tf Graph
+    """
+    graph_def = tf.GraphDef()
+    with open(export_file, 'rb') as file:
+        graph_def.ParseFromString(file.read())
+    graph = tf.Graph()
+    with graph.as_default():
+        tf.import_graph_def(graph_def, name='')
+    return graph
@@ -0,0 +1,112 @@
+import os
+import json
+import numpy as np
+import tensorflow as tf
+
+from machine_learning_models import tfrecord_io
+
+
+def stats_file(record_file):
+    """
+    path of the stats sidecar of a record file
+    :param record_file: tfrecord file path
+    :return: stats file path
+    """
+    return record_file + '.stats.json'
+
+def label_matrix(labels):
+    """
+    converts labels to a 2d array of instances by labels
+    :param labels: list or array of labels
+    :return: 2d array
+    """
+    labels = np.asarray(labels)
+    if labels.ndim != 2:
+        labels = labels.reshape((len(labels), labels.size // max(len(labels), 1)))
+    return labels
+
+def label_stats(labels):
+    """
+    counts instances, instances with any positive label, and positives per label
+    :param labels: list or array of labels
+    :return: stats dictionary
+    """
+    labels = label_matrix(labels)
+    return {'count': int(labels.shape[0]),
+            'positives': int(np.count_nonzero(np.any(labels != 0, axis=1))),
+            'label_counts': [int(c) for c in np.count_nonzero(labels, axis=0)]}
+
+def save_record_stats(stats, record_file):
+    """
+    writes stats sidecar next to record file, through a temporary file so readers never see a partial sidecar
+    :param stats: stats dictionary
+    :param record_file: tfrecord file path
+    """
+    with open(stats_file(record_file) + '.tmp', 'w') as file:
+        json.dump(stats, file)
+    os.rename(stats_file(record_file) + '.tmp', stats_file(record_file))
+
+def write_record_stats(labels, record_file):
+    """
+    writes stats sidecar next to record file
+    :param labels: labels written to record file
+    :param record_file: tfrecord file path
+    :return: stats dictionary
+    """
+    stats = label_stats(labels)
+    save_record_stats(stats, record_file)
+    return stats
+
+def scan_record_stats(record_file, label_dtype):
+    """
+    reads every record of a tfrecord file to get its stats, only used for records without sidecar
+    :param record_file: tfrecord file path
+    :param label_dtype: numpy dtype labels were written with
+    :return: stats dictionary
+    """
+    labels = []
+    options = tfrecord_io.record_options(tfrecord_io.record_compression(record_file))
+    for record in tf.python_io.tf_record_iterator(record_file, options):
+        result = tf.train.Example.FromString(record)
+        labels.append(np.frombuffer(result.features.feature['y'].bytes_list.value[0], dtype=label_dtype))
+    return label_stats(labels)
+
+def read_record_stats(record_file):
+    """
+    reads the stats sidecar of a record file
+    :param record_file: tfrecord file path
+    :return: stats dictionary, None if the sidecar is missing, older than the record or can't be parsed
+    """
+    if os.path.isfile(stats_file(record_file)) is False or \
+            os.path.getmtime(stats_file(record_file)) < os.path.getmtime(record_file):
+        return None
+    try:
+        with open(stats_file(record_file)) as file:
+            return json.load(file)
+    except ValueError:
+        return None
+
+def load_record_stats(record_files, label_dtype):
+    """
+    sums stats of record files from their sidecars, missing, outdated or unreadable sidecars are rebuilt by scanning
+    :param record_files: list of tfrecord files
+    :param label_dtype: numpy dtype labels were written with
+    :return: stats dictionary
+    """
+    total_stats = {'count': 0, 'positives': 0, 'label_counts': []}
+    for record_file in record_files:
+        stats = read_record_stats(record_file)
+        if stats is None:
+            print('scanning ' + record_file)
+            stats = scan_record_stats(record_file, label_dtype)
+            save_record_stats(stats, record_file)
+
+        total_stats['count'] += stats['count']
+        total_stats['positives'] += stats['positives']
+        # empty records have no label width
+        if len(total_stats['label_counts']) == 0:
+            total_stats['label_counts'] = [0] * len(stats['label_counts'])
+        for l in range(len(stats['label_counts'])):
+            total_stats['label_counts'][l] += stats['label_counts'][l]
+
+    return total_stats
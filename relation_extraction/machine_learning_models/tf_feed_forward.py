@@ -3,6 +3,11 @@ import numpy as np
 import os
 from random import shuffle, seed
 from sklearn import metrics
+from machine_learning_models import record_stats
+from machine_learning_models import tfrecord_io
+from machine_learning_models import evaluation
+from machine_learning_models import training_control
+from machine_learning_models import model_export
 
 seed(10)
 tf.set_random_seed(10)
@@ -13,26 +18,56 @@ def parse(serialized_example):
     """
     parses tfrecord file and reads it into memory
     :param serialized_example: tfrecord parse line
-    :return: features and labels of tfrecord
+    :return: sparse feature indices and labels of tfrecord
     """
 
     features = tf.parse_single_example(serialized_example,
-                                       features ={"x": tf.FixedLenFeature([], tf.string, default_value=""),
+                                       features ={"x": tf.VarLenFeature(tf.int64),
                                                   "y": tf.FixedLenFeature([], tf.string, default_value="")})
 
-    feat = tf.decode_raw(features['x'], tf.int8)
+    feat = features['x']
     label = tf.decode_raw(features['y'], tf.int8)
 
-    feat = tf.cast(feat,dtype=tf.float32)
     label = tf.cast(label,dtype=tf.float32)
 
     return feat, label
 
 
+def sparse_input(batch_feature_ids, num_features):
+    """
+    builds sparse binary input matrix from batch of feature indices
+    :param batch_feature_ids: batched sparse tensor of active feature indices
+    :param num_features: number of features in model
+    :return: sparse input tensor of shape [batch size, number of features]
+    """
+    # named so batches can be fed directly at test and prediction time
+    feature_indices = tf.identity(tf.stack([batch_feature_ids.indices[:, 0], batch_feature_ids.values], axis=1),
+                                  name='feature_indices')
+    batch_size = tf.identity(batch_feature_ids.dense_shape[0], name='feature_batch_size')
+    input_tensor = tf.SparseTensor(indices=feature_indices,
+                                   values=tf.ones([tf.shape(feature_indices)[0]], dtype=tf.float32),
+                                   dense_shape=tf.stack([batch_size, tf.constant(num_features, dtype=tf.int64)]))
+    return input_tensor
+
+
+def sparse_feature_batch(features):
+    """
+    converts list of active feature indices per instance to [row, feature] index pairs
+    :param features: list of feature index lists
+    :return: np array of index pairs
+    """
+    rows = []
+    columns = []
+    for row in range(len(features)):
+        rows.extend([row] * len(features[row]))
+        columns.extend(features[row])
+    return np.array([rows, columns], dtype=np.int64).T
+
+
 def feed_forward(input_tensor, num_hidden_layers, weights, biases,keep_prob):
     """
     feed forward component of neural network
-    :param input_tensor: input tensor
+    :param input_tensor: sparse input tensor
     :param num_hidden_layers: number of hidden layers
     :param weights: dictionary of weights
     :param biases: dictionary of biases for network
@@ -47,7 +82,7 @@ def feed_forward(input_tensor, num_hidden_layers, weights, biases,keep_prob):
 
     for i in range(num_hidden_layers):
         if i == 0:
-            hidden_mult[i] = tf.matmul(input_tensor,weights[i],name='hidden_mult'+str(i))
+            hidden_mult[i] = tf.sparse_tensor_dense_matmul(input_tensor,weights[i],name='hidden_mult'+str(i))
         else:
             hidden_mult[i] = tf.matmul(hidden_act[i-1],weights[i],name='hidden_mult'+str(i))
         hidden_add[i] = tf.add(hidden_mult[i], biases[i],'hidden_add'+str(i))
@@ -57,13 +92,14 @@ def feed_forward(input_tensor, num_hidden_layers, weights, biases,keep_prob):
     if num_hidden_layers != 0:
         out_layer_multiplication = tf.matmul(dropout[num_hidden_layers-1],weights['out'],name='out_layer_mult')
     else:
-        out_layer_multiplication = tf.matmul(input_tensor,weights['out'],name = 'out_layer_mult')
+        out_layer_multiplication = tf.sparse_tensor_dense_matmul(input_tensor,weights['out'],name = 'out_layer_mult')
     out_layer_bias_addition = tf.add(out_layer_multiplication,biases['out'],name='out_layer_add')
 
     return out_layer_bias_addition
 
 
-def feed_forward_train(train_dataset_files, hidden_array, model_dir, num_features, key_order, test_dataset_files=None):
+def feed_forward_train(train_dataset_files, hidden_array, model_dir, num_features, key_order, test_dataset_files=None,
+                       controller=None, resume=False):
     """
     trains feed forward neural network
     :param train_dataset_files: list dataset files (.tfrecord)
@@ -72,33 +108,34 @@ def feed_forward_train(train_dataset_files, hidden_array, model_dir, num_feature
     :param num_features: number of features in model
     :param key_order: order of relations
     :param test_dataset_files: list of dataset files (.tfrecord) optional
+    :param controller: TrainingController deciding epochs, evaluation and early stopping (optional)
+    :param resume: resume from the latest training checkpoint in model_dir
     :return: path of trained model
     """
 
-    # count number of instances in tfrecord files
-    training_instances_count = 0
-    num_positive_instances = 0
-    for fn in train_dataset_files:
-        for record in tf.python_io.tf_record_iterator(fn):
-            training_instances_count += 1
-            result = tf.train.Example.FromString(record)
-            if result.features.feature['y'].bytes_list.value!=['\x00']:
-                num_positive_instances+=1
+    # count number of instances from the stats sidecars of tfrecord files
+    training_stats = record_stats.load_record_stats(train_dataset_files, np.int8)
+    training_instances_count = training_stats['count']
+    num_positive_instances = training_stats['positives']
     print("training count: ",training_instances_count)
     print("training positives: ",num_positive_instances)
+    print("training label positives: ", training_stats['label_counts'])
     print("training number_of_features: ", num_features)
 
     # resets the default graph
     tf.reset_default_graph()
 
+    if controller is None:
+        controller = training_control.TrainingController()
+
     # network parameters
     num_labels = len(key_order)
-    num_epochs = 250
+    num_epochs = controller.num_epochs
     batch_size = 128
     num_hidden_layers = len(hidden_array)
 
     # build training dataset
-    dataset = tf.data.TFRecordDataset(train_dataset_files)
+    dataset = tf.data.TFRecordDataset(train_dataset_files, compression_type=tfrecord_io.dataset_compression(train_dataset_files))
     dataset = dataset.map(parse, num_parallel_calls=64).prefetch(batch_size * 100)
     #dataset = dataset.repeat(num_epochs).prefetch(batch_size * 100)
     dataset = dataset.shuffle(batch_size * 50).prefetch(buffer_size=batch_size * 100)
@@ -106,7 +143,8 @@ def feed_forward_train(train_dataset_files, hidden_array, model_dir, num_feature
     dataset = dataset.prefetch(5)
 
     # build training dataset
-    training_accuracy_dataset = tf.data.TFRecordDataset(train_dataset_files)
+    training_accuracy_dataset = tf.data.TFRecordDataset(train_dataset_files, compression_type=tfrecord_io.dataset_compression(train_dataset_files))
+    training_accuracy_dataset = training_control.subsample_records(training_accuracy_dataset, controller.eval_fraction)
     training_accuracy_dataset = training_accuracy_dataset.map(parse, num_parallel_calls=64).prefetch(batch_size * 100)
     training_accuracy_dataset = training_accuracy_dataset.batch(batch_size)  # batch size
     training_accuracy_dataset = training_accuracy_dataset.prefetch(5)
@@ -116,8 +154,11 @@ def feed_forward_train(train_dataset_files, hidden_array, model_dir, num_feature
     iterator = tf.data.Iterator.from_string_handle(
         iterator_handle,
         dataset.output_types,
-        dataset.output_shapes)
-    batch_features, batch_labels = iterator.get_next()
+        dataset.output_shapes,
+        dataset.output_classes)
+    batch_feature_ids, batch_labels = iterator.get_next()
+    batch_labels = tf.identity(batch_labels, name='batch_labels')
+    batch_features = sparse_input(batch_feature_ids, num_features)
 
     # builds training set iterator
     train_iter = dataset.make_initializable_iterator()
@@ -125,18 +166,14 @@ def feed_forward_train(train_dataset_files, hidden_array, model_dir, num_feature
 
     # get test dataset information and build test dataset
     if test_dataset_files is not None:
-        test_instances_count = 0
-        num_positive_test_instances = 0
-        for fn in test_dataset_files:
-            for record in tf.python_io.tf_record_iterator(fn):
-                test_instances_count += 1
-                result = tf.train.Example.FromString(record)
-                if result.features.feature['y'].bytes_list.value != ['\x00']:
-                    num_positive_test_instances += 1
+        test_stats = record_stats.load_record_stats(test_dataset_files, np.int8)
+        test_instances_count = test_stats['count']
+        num_positive_test_instances = test_stats['positives']
         print("test count: ", test_instances_count)
         print("test positives: ", num_positive_test_instances)
 
-        test_dataset = tf.data.TFRecordDataset(test_dataset_files)
+        test_dataset = tf.data.TFRecordDataset(test_dataset_files, compression_type=tfrecord_io.dataset_compression(test_dataset_files))
+        test_dataset = training_control.subsample_records(test_dataset, controller.eval_fraction)
         test_dataset = test_dataset.map(parse)
         test_dataset = test_dataset.batch(1024)
         test_iter = test_dataset.make_initializable_iterator()
@@ -163,6 +200,7 @@ def feed_forward_train(train_dataset_files, hidden_array, model_dir, num_feature
     class_yhat = tf.to_int32(prob_yhat > 0.5, name='class_predict')
 
     global_step = tf.Variable(0, name="global_step")
+    epoch_counter = training_control.EpochCounter(global_step)
     #calculate cost and update network via backpropogation with gradientdescent
     cost = tf.reduce_mean(tf.nn.sigmoid_cross_entropy_with_logits(labels=batch_labels, logits=yhat))
     updates = tf.train.AdamOptimizer().minimize(cost,global_step=global_step)
@@ -174,6 +212,7 @@ def feed_forward_train(train_dataset_files, hidden_array, model_dir, num_feature
     # Run stochastic gradient descent
     save_path = None
     merged = tf.summary.merge_all()
+    controller.start(model_dir, [tf.data.experimental.make_saveable_from_iterator(train_iter)])
 
     config = tf.ConfigProto(log_device_placement=True)
     config.gpu_options.allow_growth = True
@@ -184,22 +223,36 @@ def feed_forward_train(train_dataset_files, hidden_array, model_dir, num_feature
         train_writer = tf.summary.FileWriter(model_dir + '/train', graph=tf.get_default_graph())
         test_writer = tf.summary.FileWriter(model_dir + '/test')
 
-        for epoch in range(num_epochs):
-            train_handle = sess.run(train_iter.string_handle())
+        # resumes at the epoch and batch of the latest training checkpoint
+        start_epoch, resume_epoch_steps = 0, 0
+        if resume is True:
+            # iterator state can only be restored into an initialized iterator
             sess.run(train_iter.initializer)
+        if resume is True and controller.restore_checkpoint(sess) is True:
+            start_epoch, resume_epoch_steps = epoch_counter.get_position(sess)
 
+        for epoch in range(start_epoch, num_epochs):
+            train_handle = sess.run(train_iter.string_handle())
+            # the restored iterator continues an interrupted epoch
+            if resume_epoch_steps == 0:
+                epoch_counter.start_epoch(sess, epoch)
+                sess.run(train_iter.initializer)
+            resume_epoch_steps = 0
 
             while True:
                 try:
-                    u, tl = sess.run([updates, cost], feed_dict={iterator_handle: train_handle, keep_prob: 0.5})
+                    u, tl, step = sess.run([updates, cost, global_step], feed_dict={iterator_handle: train_handle, keep_prob: 0.5})
+                    controller.after_step(sess, step)
                 except tf.errors.OutOfRangeError:
                     break
 
+            if controller.should_evaluate(epoch) is False:
+                continue
+
             train_accuracy_handle = sess.run(train_accuracy_iter.string_handle())
             sess.run(train_accuracy_iter.initializer)
 
-            total_predicted_prob = np.array([])
-            total_labels = np.array([])
+            train_metrics = evaluation.LabelMetrics(num_labels)
             step = 0
             total_loss_value = 0
             total_accuracy_value = 0
@@ -211,17 +264,13 @@ def feed_forward_train(train_dataset_files, hidden_array, model_dir, num_feature
                                                                   feed_dict={
                                                                       iterator_handle: train_accuracy_handle,
                                                                       keep_prob: 1.0})
-                    total_predicted_prob = np.append(total_predicted_prob, predicted_class)
-                    total_labels = np.append(total_labels, b_labels)
+                    train_metrics.update(predicted_class, b_labels)
                     total_loss_value += tl_val
                     total_accuracy_value += ta_val
 
                 except tf.errors.OutOfRangeError:
                     break
 
-            total_predicted_prob = total_predicted_prob.reshape((training_instances_count, num_labels))
-            total_labels = total_labels.reshape((training_instances_count, num_labels))
-
             total_accuracy_value = total_accuracy_value / step
             total_loss_value = total_loss_value / step
             acc_summary = tf.Summary()
@@ -232,18 +281,20 @@ def feed_forward_train(train_dataset_files, hidden_array, model_dir, num_feature
             train_writer.add_summary(loss_summary, epoch)
             train_writer.flush()
 
+            label_f1_scores = train_metrics.f1_scores()
             for l in range(len(key_order)):
-                column_l = total_predicted_prob[:, l]
-                column_true = total_labels[:, l]
-                label_accuracy = metrics.f1_score(y_true=column_true, y_pred=column_l)
+                label_accuracy = label_f1_scores[l]
                 print("Epoch = %d,Label = %s: %.2f%% "
                       % (epoch, key_order[l], 100. * label_accuracy))
 
+            # the test set is monitored if there is one, otherwise the training set
+            monitored_loss = total_loss_value
+            monitored_f1_scores = label_f1_scores
+
             if test_dataset_files is not None:
                 test_handle = sess.run(test_iter.string_handle())
                 sess.run(test_iter.initializer)
-                test_y_predict_total = np.array([])
-                test_y_label_total = np.array([])
+                test_metrics = evaluation.LabelMetrics(num_labels)
                 test_step = 0
                 test_loss_value = 0
                 test_accuracy_value = 0
@@ -253,17 +304,13 @@ def feed_forward_train(train_dataset_files, hidden_array, model_dir, num_feature
                         test_loss, test_accuracy, batch_test_predict, batch_test_labels = sess.run(
                             [cost, accuracy, class_yhat, batch_labels], feed_dict={
                                 iterator_handle: test_handle, keep_prob: 1.0})
-                        test_y_predict_total = np.append(test_y_predict_total, batch_test_predict)
-                        test_y_label_total = np.append(test_y_label_total, batch_test_labels)
+                        test_metrics.update(batch_test_predict, batch_test_labels)
                         test_loss_value += test_loss
                         test_accuracy_value += test_accuracy
 
                     except tf.errors.OutOfRangeError:
                         break
 
-                test_y_predict_total = test_y_predict_total.reshape((test_instances_count, 1))
-                test_y_label_total = test_y_label_total.reshape((test_instances_count, 1))
-
                 test_accuracy_value = test_accuracy_value / test_step
                 test_loss_value = test_loss_value / test_step
                 test_acc_summary = tf.Summary()
@@ -274,134 +321,162 @@ def feed_forward_train(train_dataset_files, hidden_array, model_dir, num_feature
                 test_writer.add_summary(test_loss_summary, epoch)
                 test_writer.flush()
 
+                test_label_f1_scores = test_metrics.f1_scores()
                 for l in range(len(key_order)):
-                    column_l = test_y_predict_total[:, l]
-                    column_true = test_y_label_total[:, l]
-                    label_accuracy = metrics.f1_score(y_true=column_true, y_pred=column_l)
+                    label_accuracy = test_label_f1_scores[l]
                     print("Epoch = %d,Test Label = %s: %.2f%% "
                           % (epoch, key_order[l], 100. * label_accuracy))
+                monitored_loss = test_loss_value
+                monitored_f1_scores = test_label_f1_scores
 
+            if controller.end_evaluation(sess, epoch, monitored_loss, monitored_f1_scores) is True:
+                break
 
-
+        controller.finish(sess)
         save_path = saver.save(sess, model_dir)
 
     return save_path
 
 
+class FeedForwardPredictor(object):
+    def __init__(self, model_file, batch_size=4096):
+        '''Loads a trained feed forward model once into its own graph and session, which stay open for repeated predictions
+        :param model_file: path of trained model
+        :param batch_size: number of instances run per session call'''
+        self.model_file = model_file
+        self.batch_size = batch_size
+        if model_export.is_frozen_model(model_file):
+            self.graph = model_export.load_frozen_graph(model_file)
+            self.sess = tf.Session(graph=self.graph)
+        else:
+            self.graph = tf.Graph()
+            with self.graph.as_default():
+                restored_model = tf.train.import_meta_graph(model_file + '.meta', clear_devices=True)
+                self.sess = tf.Session(graph=self.graph)
+                restored_model.restore(self.sess, model_file)
+        self.feature_indices = self.graph.get_tensor_by_name('feature_indices:0')
+        self.feature_batch_size = self.graph.get_tensor_by_name('feature_batch_size:0')
+        # frozen graphs have no iterator, their batches are fed from a dataset of this graph
+        self.labels = None
+        self.iterator_handle = None
+        if model_export.is_frozen_model(model_file) is False:
+            self.iterator_handle = self.graph.get_tensor_by_name('iterator_handle:0')
+            self.labels = self.graph.get_tensor_by_name('batch_labels:0')
+        # frozen graphs of models without hidden layers have no dropout to turn off
+        self.keep_prob = None
+        if 'keep_prob' in [op.name for op in self.graph.get_operations()]:
+            self.keep_prob = self.graph.get_tensor_by_name('keep_prob:0')
+        self.predict_prob = self.graph.get_tensor_by_name('predict_prob:0')
+        self.num_labels = int(self.predict_prob.shape[1])
+
+    def inference_feed(self, feed_dict):
+        '''Adds the keep probability of 1.0 to feed_dict if the graph has dropout'''
+        if self.keep_prob is not None:
+            feed_dict[self.keep_prob] = 1.0
+        return feed_dict
+
+    def predict_batch(self, features):
+        '''Returns probabilities of one batch of active feature indices per instance'''
+        if len(features) == 0:
+            return np.zeros((0, self.num_labels), dtype=np.float32)
+        return self.sess.run(self.predict_prob, feed_dict=self.inference_feed({self.feature_indices: sparse_feature_batch(features),
+                                                                               self.feature_batch_size: len(features)}))
+
+    def predict(self, features):
+        '''Returns probabilities of in memory instances in their order'''
+        predicted_prob = evaluation.BatchAccumulator(len(features), self.num_labels)
+        for start in range(0, len(features), self.batch_size):
+            predicted_prob.append(self.predict_batch(features[start:start + self.batch_size]))
+        return predicted_prob.get_values()
+
+    def iter_predict(self, batches):
+        '''Yields probabilities of each batch of features of an iterable, so instances are scored without
+        holding them all in memory'''
+        for features in batches:
+            yield self.predict_batch(features)
+
+    def iter_predict_files(self, dataset_files):
+        '''Yields probabilities and labels of each batch of tfrecord files in file order'''
+        with self.graph.as_default():
+            dataset = tf.data.TFRecordDataset(dataset_files, compression_type=tfrecord_io.dataset_compression(dataset_files))
+            dataset = dataset.map(parse, num_parallel_calls=8)
+            dataset = dataset.batch(self.batch_size).prefetch(2)
+            iterator = dataset.make_one_shot_iterator()
+            batch_feature_ids, batch_labels = iterator.get_next()
+            next_batch = (tf.stack([batch_feature_ids.indices[:, 0], batch_feature_ids.values], axis=1),
+                          batch_feature_ids.dense_shape[0], batch_labels)
+            handle = self.sess.run(iterator.string_handle())
+        while True:
+            try:
+                if self.iterator_handle is None:
+                    feature_indices, feature_batch_size, labels = self.sess.run(next_batch)
+                    yield self.sess.run(self.predict_prob,
+                                        feed_dict=self.inference_feed({self.feature_indices: feature_indices,
+                                                                       self.feature_batch_size: feature_batch_size})), labels
+                else:
+                    yield self.sess.run([self.predict_prob, self.labels],
+                                        feed_dict=self.inference_feed({self.iterator_handle: handle}))
+            except tf.errors.OutOfRangeError:
+                break
+
+    def close(self):
+        '''Closes the session'''
+        self.sess.close()
+
+
 def neural_network_test_tfrecord(total_dataset_files, model_file):
     """
-
+    tests neural network on tfrecord files
     :param total_dataset_files: list of tfrecord files for testing
     :param model_file: trained model file path
     :return: predicted probabilities and labels
     """
     print(model_file)
-    c = 0
-    positive = 0
-    labels = []
-    for fn in total_dataset_files:
-        for record in tf.python_io.tf_record_iterator(fn):
-            c += 1
-            result = tf.train.Example.FromString(record)
-            if result.features.feature['y'].bytes_list.value != ['\x00']:
-                labels.append(1)
-                positive += 1
-            else:
-                labels.append(0)
-    labels = np.array(labels)
-    print("count: ", c)
-    print("positives: ", positive)
-
-    dataset = tf.data.TFRecordDataset(total_dataset_files)
-    dataset = dataset.map(parse)
-    dataset = dataset.batch(1000)
-
-    total_predicted_prob = np.array([])
-
-    with tf.Session() as sess:
-        restored_model = tf.train.import_meta_graph(model_file + '.meta',clear_devices=True)
-        restored_model.restore(sess,model_file)
-        graph =tf.get_default_graph()
-        iterator_handle = graph.get_tensor_by_name('iterator_handle:0')
-        iterator = dataset.make_one_shot_iterator()
-        new_handle = sess.run(iterator.string_handle())
-        keep_prob_tensor = graph.get_tensor_by_name('keep_prob:0')
-        predict_tensor = graph.get_tensor_by_name('class_predict:0')
-        predict_prob = graph.get_tensor_by_name('predict_prob:0')
-        while True:
-            try:
-                predicted_val, predict_class = sess.run([predict_prob,predict_tensor],feed_dict={iterator_handle: new_handle,keep_prob_tensor:1.0})
-                total_predicted_prob = np.append(total_predicted_prob,predicted_val[0])
-            except tf.errors.OutOfRangeError:
-                break
-
+    test_stats = record_stats.load_record_stats(total_dataset_files, np.int8)
+    print("count: ", test_stats['count'])
+    print("positives: ", test_stats['positives'])
+
+    num_labels = len(test_stats['label_counts'])
+    total_predicted_prob = evaluation.BatchAccumulator(test_stats['count'], num_labels)
+    total_labels = evaluation.BatchAccumulator(test_stats['count'], num_labels)
+
+    predictor = FeedForwardPredictor(model_export.inference_model_file(model_file))
+    for predicted_val, batch_labels in predictor.iter_predict_files(total_dataset_files):
+        total_predicted_prob.append(predicted_val)
+        total_labels.append(batch_labels)
+    predictor.close()
+
+    total_predicted_prob = total_predicted_prob.get_values()
+    labels = total_labels.get_values()
     print(total_predicted_prob)
     return total_predicted_prob, labels
 
 def neural_network_test(features, labels, model_file):
     """
     test neural network if features fit into memory
-    :param features: array of features
+    :param features: list of active feature indices per instance
     :param labels: array of labels
     :param model_file: path of model file
     :return: predicted probabilities and labels
     """
 
-    print(features.shape)
+    print(len(features))
     print(labels.shape)
-    features_placeholder = tf.placeholder(features.dtype, features.shape, name='test_features')
-    labels_placeholder = tf.placeholder(labels.dtype, labels.shape, name='test_labels')
-    dataset = tf.data.Dataset.from_tensor_slices((features_placeholder, labels_placeholder))
-    dataset = dataset.batch(1024)
-    total_predicted_prob = np.array([])
-    total_labels = np.array([])
-
-    with tf.Session() as sess:
-        restored_model = tf.train.import_meta_graph(model_file + '.meta',clear_devices=True)
-        restored_model.restore(sess,model_file)
-        graph = tf.get_default_graph()
-        tensor_names = [t.name for op in graph.get_operations() for t in op.values()]
-        iterator_handle = graph.get_tensor_by_name('iterator_handle:0')
-        test_iterator = dataset.make_initializable_iterator()
-        new_handle = sess.run(test_iterator.string_handle())
-        sess.run(test_iterator.initializer, feed_dict={features_placeholder: features,
-                                                   labels_placeholder: labels})
-        batch_features_tensor = graph.get_tensor_by_name('IteratorGetNext:0')
-        batch_labels_tensor = graph.get_tensor_by_name('IteratorGetNext:1')
-        keep_prob_tensor = graph.get_tensor_by_name('keep_prob:0')
-        predict_tensor = graph.get_tensor_by_name('class_predict:0')
-        predict_prob = graph.get_tensor_by_name('predict_prob:0')
-
-        while True:
-            try:
-                predicted_val,batch_features,batch_labels= sess.run([predict_prob,batch_features_tensor,batch_labels_tensor],feed_dict={iterator_handle: new_handle,keep_prob_tensor:1.0})
-                total_labels = np.append(total_labels,batch_labels)
-                total_predicted_prob = np.append(total_predicted_prob,predicted_val)
-            except tf.errors.OutOfRangeError:
-                break
-
-    total_predicted_prob = total_predicted_prob.reshape(labels.shape)
-    total_labels = total_labels.reshape(labels.shape)
-    return total_predicted_prob, total_labels
+    predictor = FeedForwardPredictor(model_export.inference_model_file(model_file), batch_size=1024)
+    total_predicted_prob = predictor.predict(features)
+    predictor.close()
+    return total_predicted_prob, labels
 
 
 def neural_network_predict(predict_features,model_file):
     """
-    WORK IN PROGRESS!
-    :param predict_features:
-    :param model_file:
-    :return:
+    predicts probabilities of instances that fit into memory
+    :param predict_features: list of active feature indices per instance
+    :param model_file: path of model file
+    :return: predicted probabilities
     """
-    with tf.Session() as sess:
-        restored_model = tf.train.import_meta_graph(model_file + '.meta',clear_devices=True)
-        restored_model.restore(sess,model_file)
-        graph = tf.get_default_graph()
-        input_tensor = graph.get_tensor_by_name('input:0')
-        output_tensor = graph.get_tensor_by_name('output:0')
-        keep_prob_tensor = graph.get_tensor_by_name('keep_prob:0')
-        predict_tensor = graph.get_tensor_by_name('class_predict:0')
-        predict_prob = graph.get_tensor_by_name('predict_prob:0')
-
-        predicted_val,predict_class = sess.run([predict_prob,predict_tensor],feed_dict={input_tensor:predict_features,keep_prob_tensor:1.0})
-
-    return predicted_val
\ No newline at end of file
+    predictor = FeedForwardPredictor(model_export.inference_model_file(model_file))
+    predicted_val = predictor.predict(predict_features)
+    predictor.close()
+
+    return predicted_val
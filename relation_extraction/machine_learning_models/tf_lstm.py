@@ -1,8 +1,14 @@
 import tensorflow as tf
 import numpy as np
 import os
+import mmap
 from random import shuffle, seed
 from sklearn import metrics
+from machine_learning_models import record_stats
+from machine_learning_models import tfrecord_io
+from machine_learning_models import evaluation
+from machine_learning_models import training_control
+from machine_learning_models import model_export
 
 seed(10)
 tf.set_random_seed(10)
@@ -10,40 +16,90 @@ tf.contrib.summary
 
 os.environ["CUDA_VISIBLE_DEVICES"]="1"
 
-def load_bin_vec(fname):
+def embedding_cache_files(fname):
     """
-    Loads word2vec embeddings from .bin file
+    paths of the cached embedding matrix and vocabulary of a word2vec .bin file
     :param fname: filename
-    :return: list of words, list of word embedding arrays, dictionary of word to index
+    :return: npy matrix file, vocabulary file
     """
-    word_vecs = []
-    words = []
-    word_dict = {}
-    index = 0
-    with open(fname,"rb") as f:
+    return fname + '.vectors.npy', fname + '.vocab.txt'
+
+def cache_bin_vec(fname):
+    """
+    scans word2vec .bin file once through a memory map and writes its vectors, followed by the UNKNOWN_WORD and
+    PADDING_WORD vectors, straight into an npy matrix with one word per line in the vocabulary file
+    :param fname: filename
+    :return: npy matrix file, vocabulary file
+    """
+    matrix_file, vocabulary_file = embedding_cache_files(fname)
+    with open(fname, 'rb') as f:
         header = f.readline()
-        vocab_size,layer_size = map(int,header.split())
-        binary_len = np.dtype('float32').itemsize*layer_size
-        for line in range(vocab_size):
-            word = []
-            while True:
-                ch = f.read(1)
-                if ch == ' ':
-                    word = ''.join(word)
-                    break
-                if ch != '\n':
-                    word.append(ch)
-            word_vecs.append(np.fromstring(f.read(binary_len), dtype='float32'))
-            words.append(word)
-            word_dict[word] = index
-            index+=1
+        vocab_size, layer_size = map(int, header.split())
+        binary_len = np.dtype('float32').itemsize * layer_size
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            # word boundaries are found with one search per word instead of reading a byte at a time
+            words = []
+            vector_offsets = np.zeros(vocab_size, dtype=np.int64)
+            position = len(header)
+            for index in range(vocab_size):
+                word_end = buffer.find(' ', position)
+                # vectors may be followed by a newline before the next word
+                words.append(buffer[position:word_end].lstrip('\n'))
+                vector_offsets[index] = word_end + 1
+                position = word_end + 1 + binary_len
+
+            # vectors are gathered from the mapped bytes in chunks of rows
+            matrix = np.lib.format.open_memmap(matrix_file + '.tmp', mode='w+', dtype=np.float32,
+                                               shape=(vocab_size + 2, layer_size))
+            file_bytes = np.frombuffer(buffer, dtype=np.uint8)
+            byte_range = np.arange(binary_len, dtype=np.int64)
+            for start in range(0, vocab_size, 10000):
+                rows = file_bytes[vector_offsets[start:start + 10000, None] + byte_range]
+                matrix[start:start + rows.shape[0]] = rows.view(np.float32)
+            del file_bytes
+        finally:
+            buffer.close()
+    matrix[vocab_size] = np.random.rand(layer_size)
+    matrix[vocab_size + 1] = 0.0
+    matrix.flush()
+    del matrix
+
+    with open(vocabulary_file + '.tmp', 'wb') as f:
+        for word in words:
+            f.write(word + '\n')
+    os.rename(vocabulary_file + '.tmp', vocabulary_file)
+    os.rename(matrix_file + '.tmp', matrix_file)
+    return matrix_file, vocabulary_file
+
+def load_bin_vec(fname, vocabulary=None):
+    """
+    Loads word2vec embeddings from .bin file, the file is scanned once into a cached npy matrix that later
+    loads are memory mapped from
+    :param fname: filename
+    :param vocabulary: words to keep, for example the dependency path word vocabulary, None keeps all words
+    :return: list of words, embedding matrix, dictionary of word to index
+    """
+    matrix_file, vocabulary_file = embedding_cache_files(fname)
+    if os.path.isfile(matrix_file) is False or os.path.getmtime(matrix_file) < os.path.getmtime(fname):
+        print('caching embeddings')
+        cache_bin_vec(fname)
+    word_vecs = np.load(matrix_file, mmap_mode='r')
+    with open(vocabulary_file, 'rb') as f:
+        words = f.read().split('\n')[:-1]
+
+    if vocabulary is not None:
+        vocabulary = set(word.lower() for word in vocabulary)
+        keep = [index for index in range(len(words)) if words[index] in vocabulary]
+        words = [words[index] for index in keep]
+        # unknown and padding vectors are the last two rows
+        word_vecs = word_vecs[keep + [word_vecs.shape[0] - 2, word_vecs.shape[0] - 1]]
+
+    word_dict = dict(zip(words, range(len(words))))
     words.append('UNKNOWN_WORD')
     words.append('PADDING_WORD')
-    word_dict['UNKNOWN_WORD'] = index
-    word_dict['PADDING_WORD'] = index+1
-    last_vector = word_vecs[-1]
-    word_vecs.append(np.random.rand(last_vector.shape[0]))
-    word_vecs.append(np.zeros(last_vector.shape, dtype='float32'))
+    word_dict['UNKNOWN_WORD'] = len(word_dict)
+    word_dict['PADDING_WORD'] = len(word_dict)
     print('finished loading embeddings')
     return words, word_vecs, word_dict
 
@@ -72,31 +128,226 @@ def parse(serialized_example):
 
     return dep_path_list,dep_word_feat,dep_path_length,dep_word_length, label
 
-def lstm_train(train_dataset_files, num_dep_types,num_path_words, model_dir, key_order,test_dataset_files=None,word2vec_embeddings = None):
+# fields of npy shards in the order parse returns them
+npy_fields = ['dep_path_list', 'dep_word_feat', 'dep_path_length', 'dep_word_length', 'y']
+# variable length path fields stored flat in npy shards with the length field splitting them
+npy_path_fields = {'dep_path_list': 'dep_path_length', 'dep_word_feat': 'dep_word_length'}
+
+# upper bounds of path length buckets, batches hold paths of similar length so little padding is run
+length_bucket_boundaries = [3, 4, 5, 6, 7, 8, 10, 12, 15, 20, 30, 50, 100]
+
+def padding_values(num_dep_types, num_path_words):
+    """
+    padding values of parsed lstm instances, paths are padded with the PADDING_WORD ids, the last ids of the dictionaries
+    :param num_dep_types: number of dep types
+    :param num_path_words: number of dep path words
+    :return: padding value per parsed field
+    """
+    return (np.int32(num_dep_types - 1), np.int32(num_path_words - 1), np.int32(0), np.int32(0), np.float32(0))
+
+def bucket_batches(dataset, batch_size, batch_padding_values):
+    """
+    batches parsed instances of similar path length, padded to the longest path of each batch
+    :param dataset: dataset of parsed instances
+    :param batch_size: batch size
+    :param batch_padding_values: padding value per parsed field
+    :return: batched dataset
+    """
+    return dataset.apply(tf.data.experimental.bucket_by_sequence_length(
+        lambda dep_path_list, dep_word_feat, dep_path_length, dep_word_length, label: tf.maximum(dep_path_length,
+                                                                                              dep_word_length),
+        length_bucket_boundaries, [batch_size] * (len(length_bucket_boundaries) + 1),
+        padding_values=batch_padding_values))
+
+def padded_batches(dataset, batch_size, batch_padding_values):
+    """
+    batches parsed instances in order, padded to the longest path of each batch
+    :param dataset: dataset of parsed instances
+    :param batch_size: batch size
+    :param batch_padding_values: padding value per parsed field
+    :return: batched dataset
+    """
+    return dataset.padded_batch(batch_size, ([None], [None], [], [], [None]), batch_padding_values)
+
+def pad_sequences(sequences, padding_id, length=None):
+    """
+    pads id sequences of different lengths into a 2d array
+    :param sequences: list of id sequences
+    :param padding_id: PADDING_WORD id
+    :param length: padded length, defaults to the longest sequence
+    :return: 2d int32 array
+    """
+    if length is None:
+        length = max([len(sequence) for sequence in sequences] + [1])
+    padded = np.full((len(sequences), length), padding_id, dtype=np.int32)
+    for i in range(len(sequences)):
+        padded[i, :len(sequences[i])] = sequences[i]
+    return padded
+
+def is_npy_dataset(dataset_files):
+    """
+    checks if dataset is npy shard folders instead of tfrecord files
+    :param dataset_files: list of dataset files
+    :return: True if npy shards
+    """
+    return len(dataset_files) > 0 and os.path.isdir(dataset_files[0])
+
+def load_npy_shards(shard_folders):
+    """
+    memory maps the field arrays of npy shards, empty shards are skipped
+    :param shard_folders: list of npy shard folders
+    :return: list of dictionaries of field to memory mapped array, path fields also have their row offsets
+    """
+    shards = []
+    for shard_folder in shard_folders:
+        shard = {}
+        for field in npy_fields:
+            shard[field] = np.load(shard_folder + '/' + field + '.npy', mmap_mode='r')
+        for field in npy_path_fields:
+            shard[field + '_offsets'] = np.concatenate([[0], np.cumsum(shard[npy_path_fields[field]])])
+        if shard['y'].shape[0] > 0:
+            shards.append(shard)
+    return shards
+
+def npy_instance_counts(shards):
+    """
+    counts instances and instances with a positive label from shard shapes and labels
+    :param shards: list of memory mapped shards
+    :return: number of instances, number of positive instances
+    """
+    instance_count = 0
+    positive_count = 0
+    for shard in shards:
+        instance_count += shard['y'].shape[0]
+        positive_count += int(np.count_nonzero(np.any(shard['y'] != 0, axis=1)))
+    return instance_count, positive_count
+
+def npy_dataset(shards, batch_size, batch_padding_values, shuffle=False, random_seed=10, fraction=1.0, epoch_position=None,
+                bucket_window=50):
+    """
+    builds dataset of batches gathered from memory mapped npy shards
+    :param shards: list of memory mapped shards
+    :param batch_size: batch size
+    :param batch_padding_values: padding value per parsed field
+    :param shuffle: shuffles instances every time the dataset is iterated, batching instances of similar path length
+    :param random_seed: seed of shuffling
+    :param fraction: fraction of instances randomly sampled every time the dataset is iterated
+    :param epoch_position: (epoch, batches trained in epoch) tensors read when the iterator is initialized,
+    instances are then shuffled by epoch and the trained batches are skipped
+    :param bucket_window: number of batches of shuffled instances sorted by path length before batching
+    :return: batched dataset with the same outputs as bucket_batches
+    """
+    offsets = np.cumsum([0] + [shard['y'].shape[0] for shard in shards])
+    path_lengths = np.concatenate([np.maximum(shard['dep_path_length'], shard['dep_word_length']) for shard in shards] +
+                                  [np.zeros(0, dtype=np.int32)])
+    random_state = np.random.RandomState(random_seed)
+
+    def gather_batch(batch_index):
+        # sorted so rows of the same shard are gathered together
+        batch_index = np.sort(batch_index)
+        shard_ids = np.searchsorted(offsets, batch_index, side='right') - 1
+        batch = [[] for field in npy_fields]
+        for shard_id in np.unique(shard_ids):
+            rows = batch_index[shard_ids == shard_id] - offsets[shard_id]
+            shard = shards[shard_id]
+            for f in range(len(npy_fields)):
+                field = npy_fields[f]
+                if field in npy_path_fields:
+                    row_offsets = shard[field + '_offsets']
+                    batch[f].extend(shard[field][row_offsets[r]:row_offsets[r + 1]] for r in rows)
+                else:
+                    batch[f].append(shard[field][rows])
+        length = max([len(path) for f in range(2) for path in batch[f]] + [1])
+        batch = [pad_sequences(batch[f], batch_padding_values[f], length) for f in range(2)] + \
+                [np.concatenate(field_batch) for field_batch in batch[2:]]
+        batch[-1] = batch[-1].astype(np.float32)
+        return tuple(batch)
+
+    def generate_batches(epoch=None, skip_batches=0):
+        batch_random_state = random_state
+        if epoch is not None:
+            batch_random_state = np.random.RandomState(random_seed + epoch)
+        if shuffle is True:
+            order = batch_random_state.permutation(offsets[-1])
+        else:
+            order = np.arange(offsets[-1])
+        if fraction < 1.0:
+            order = order[batch_random_state.rand(offsets[-1]) < fraction]
+
+        batches = []
+        if shuffle is True:
+            # windows of shuffled instances are sorted by path length, cut into batches and the batches shuffled
+            window_size = batch_size * bucket_window
+            for window_start in range(0, len(order), window_size):
+                window = order[window_start:window_start + window_size]
+                window = window[np.argsort(path_lengths[window], kind='mergesort')]
+                window_batches = [window[start:start + batch_size] for start in range(0, len(window), batch_size)]
+                batches.extend(window_batches[i] for i in batch_random_state.permutation(len(window_batches)))
+        else:
+            batches = [order[start:start + batch_size] for start in range(0, len(order), batch_size)]
+
+        for batch_index in batches[skip_batches:]:
+            yield gather_batch(batch_index)
+
+    return tf.data.Dataset.from_generator(generate_batches,
+                                          (tf.int32, tf.int32, tf.int32, tf.int32, tf.float32),
+                                          (tf.TensorShape([None, None]), tf.TensorShape([None, None]),
+                                           tf.TensorShape([None]), tf.TensorShape([None]),
+                                           tf.TensorShape([None, None])),
+                                          args=epoch_position)
+
+def tfrecord_dataset(dataset_files, batch_size, batch_padding_values, epoch_position, random_seed=10):
+    """
+    builds dataset of shuffled batches of instances of similar path length parsed from tfrecord files
+    :param dataset_files: list of tfrecord files
+    :param batch_size: batch size
+    :param batch_padding_values: padding value per parsed field
+    :param epoch_position: (epoch, batches trained in epoch) tensors read when the iterator is initialized,
+    instances are shuffled with a seed of the epoch so a resumed epoch replays the permutation of the interrupted one
+    and the trained batches are skipped
+    :param random_seed: seed of shuffling added to the epoch
+    :return: batched dataset with the same outputs as bucket_batches
+    """
+    epoch, epoch_steps = epoch_position
+    dataset = tf.data.TFRecordDataset(dataset_files, compression_type=tfrecord_io.dataset_compression(dataset_files))
+    dataset = dataset.map(parse,num_parallel_calls=64).prefetch(batch_size*100)
+    dataset = dataset.shuffle(batch_size * 50, seed=tf.cast(epoch, tf.int64) + random_seed)
+    dataset = dataset.prefetch(buffer_size=batch_size * 100)
+    dataset = bucket_batches(dataset, batch_size, batch_padding_values)
+    # bucketed iterators cannot be saved, a resumed epoch skips the batches already trained instead
+    dataset = dataset.skip(tf.cast(epoch_steps, tf.int64))
+    return dataset.prefetch(5)
+
+def lstm_train(train_dataset_files, num_dep_types,num_path_words, model_dir, key_order,test_dataset_files=None,word2vec_embeddings = None,
+               controller=None, resume=False):
     """
     Trains LSTM model with word embeddings
-    :param train_dataset_files: list of training dataset (.tfrecord) files
+    :param train_dataset_files: list of training dataset (.tfrecord) files or npy shard folders
     :param num_dep_types: number of dep types
     :param num_path_words: number of dep path words
     :param model_dir: directory where model gets saved
     :param key_order: key order of relations
-    :param test_dataset_files: list of testing datset (.tfrecord) files (optional)
+    :param test_dataset_files: list of testing datset (.tfrecord) files or npy shard folders (optional)
     :param word2vec_embeddings: word2vec embedding dictionary
+    :param controller: TrainingController deciding epochs, evaluation and early stopping (optional)
+    :param resume: resume from the latest training checkpoint in model_dir
     :return: return saved path
     """
-    # training set statistics
-    training_instances_count = 0
-    num_positive_instances = 0
-    for fn in train_dataset_files:
-        for record in tf.python_io.tf_record_iterator(fn):
-            training_instances_count += 1
-            result = tf.train.Example.FromString(record)
-            if result.features.feature['y'].bytes_list.value!=['\x00\x00\x00\x00']:
-                num_positive_instances+=1
+    # training set statistics, npy shards have them in their array shapes
+    if is_npy_dataset(train_dataset_files):
+        train_shards = load_npy_shards(train_dataset_files)
+        training_instances_count, num_positive_instances = npy_instance_counts(train_shards)
+    else:
+        training_stats = record_stats.load_record_stats(train_dataset_files, np.int32)
+        training_instances_count = training_stats['count']
+        num_positive_instances = training_stats['positives']
     print("training count: ",training_instances_count)
     print("training positives: ",num_positive_instances)
     tf.reset_default_graph()
 
+    if controller is None:
+        controller = training_control.TrainingController()
+
     # network parameters
     lambda_l2 = 0.00001
     word_embedding_dimension = 200
@@ -104,23 +355,34 @@ def lstm_train(train_dataset_files, num_dep_types,num_path_words, model_dir, key
     dep_embedding_dimension = 50
     dep_state_size = 50
     num_labels = len(key_order)
-    num_epochs = 250
+    num_epochs = controller.num_epochs
     batch_size = 128
 
-    # build training dataset
-    dataset = tf.data.TFRecordDataset(train_dataset_files)
-    dataset = dataset.map(parse,num_parallel_calls=64).prefetch(batch_size*100)
-    #dataset = dataset.repeat(num_epochs).prefetch(batch_size * 100)
-    dataset = dataset.shuffle(batch_size * 50).prefetch(buffer_size=batch_size * 100)
-    dataset = dataset.batch(batch_size)
-    dataset = dataset.prefetch(5)
-
-    # build training dataset
-    training_accuracy_dataset = tf.data.TFRecordDataset(train_dataset_files)
-    # dataset = dataset.shuffle(10000)
-    training_accuracy_dataset = training_accuracy_dataset.map(parse, num_parallel_calls=64).prefetch(batch_size * 100)
-    training_accuracy_dataset = training_accuracy_dataset.batch(batch_size)  # batch size
-    training_accuracy_dataset = training_accuracy_dataset.prefetch(5)
+    global_step = tf.Variable(0, name="global_step")
+    epoch_counter = training_control.EpochCounter(global_step)
+
+    # paths are padded per batch with the PADDING_WORD ids
+    batch_padding_values = padding_values(num_dep_types, num_path_words)
+
+    if is_npy_dataset(train_dataset_files):
+        # batches are gathered straight from the memory mapped shards without parsing records, the generator
+        # shuffles by epoch and skips batches already trained so it does not need a saved iterator state
+        dataset = npy_dataset(train_shards, batch_size, batch_padding_values, shuffle=True,
+                              epoch_position=(epoch_counter.epoch, epoch_counter.epoch_steps)).prefetch(5)
+        training_accuracy_dataset = npy_dataset(train_shards, batch_size, batch_padding_values,
+                                                fraction=controller.eval_fraction).prefetch(5)
+    else:
+        # build training dataset
+        dataset = tfrecord_dataset(train_dataset_files, batch_size, batch_padding_values,
+                                   epoch_position=(epoch_counter.epoch, epoch_counter.epoch_steps))
+
+        # build training dataset
+        training_accuracy_dataset = tf.data.TFRecordDataset(train_dataset_files, compression_type=tfrecord_io.dataset_compression(train_dataset_files))
+        # dataset = dataset.shuffle(10000)
+        training_accuracy_dataset = training_control.subsample_records(training_accuracy_dataset, controller.eval_fraction)
+        training_accuracy_dataset = training_accuracy_dataset.map(parse, num_parallel_calls=64).prefetch(batch_size * 100)
+        training_accuracy_dataset = bucket_batches(training_accuracy_dataset, batch_size, batch_padding_values)
+        training_accuracy_dataset = training_accuracy_dataset.prefetch(5)
 
     # build iterator
     iterator_handle = tf.placeholder(tf.string, shape=[],name='iterator_handle')
@@ -129,26 +391,41 @@ def lstm_train(train_dataset_files, num_dep_types,num_path_words, model_dir, key
         dataset.output_types,
         dataset.output_shapes)
     batch_dependency_ids, batch_word_ids, batch_dependency_type_length, batch_dep_word_length, batch_labels = iterator.get_next()
+    # named inputs so predictors can feed batches without an iterator
+    batch_dependency_ids = tf.identity(batch_dependency_ids, name='dependency_ids')
+    batch_word_ids = tf.identity(batch_word_ids, name='word_ids')
+    batch_dependency_type_length = tf.identity(batch_dependency_type_length, name='dependency_type_sequence_length')
+    batch_dep_word_length = tf.identity(batch_dep_word_length, name='dependency_word_sequence_length')
+    batch_labels = tf.identity(batch_labels, name='batch_labels')
+
+    # dependency type and word paths are interleaved, so both are padded to the longer one of the batch
+    max_path_length = tf.maximum(tf.maximum(tf.shape(batch_dependency_ids)[1], tf.shape(batch_word_ids)[1]), 1)
+    batch_dependency_ids = tf.pad(batch_dependency_ids, [[0, 0], [0, max_path_length - tf.shape(batch_dependency_ids)[1]]],
+                                  constant_values=num_dep_types - 1)
+    batch_word_ids = tf.pad(batch_word_ids, [[0, 0], [0, max_path_length - tf.shape(batch_word_ids)[1]]],
+                            constant_values=num_path_words - 1)
 
     #intialize training iterator
     train_iter = dataset.make_initializable_iterator()
     train_accuracy_iter = training_accuracy_dataset.make_initializable_iterator()
     #test dataset files
     if test_dataset_files is not None:
-        test_instances_count = 0
-        num_positive_test_instances = 0
-        for fn in test_dataset_files:
-            for record in tf.python_io.tf_record_iterator(fn):
-                test_instances_count += 1
-                result = tf.train.Example.FromString(record)
-                if result.features.feature['y'].bytes_list.value != ['\x00\x00\x00\x00']:
-                    num_positive_test_instances += 1
+        if is_npy_dataset(test_dataset_files):
+            test_shards = load_npy_shards(test_dataset_files)
+            test_instances_count, num_positive_test_instances = npy_instance_counts(test_shards)
+            test_dataset = npy_dataset(test_shards, 1024, batch_padding_values, fraction=controller.eval_fraction)
+        else:
+            test_stats = record_stats.load_record_stats(test_dataset_files, np.int32)
+            test_instances_count = test_stats['count']
+            num_positive_test_instances = test_stats['positives']
+
+            test_dataset = tf.data.TFRecordDataset(test_dataset_files, compression_type=tfrecord_io.dataset_compression(test_dataset_files))
+            test_dataset = training_control.subsample_records(test_dataset, controller.eval_fraction)
+            test_dataset = test_dataset.map(parse)
+            test_dataset = bucket_batches(test_dataset, 1024, batch_padding_values)
         print("test count: ", test_instances_count)
         print("test positives: ", num_positive_test_instances)
 
-        test_dataset = tf.data.TFRecordDataset(test_dataset_files)
-        test_dataset = test_dataset.map(parse)
-        test_dataset = test_dataset.batch(1024)
         test_iter = test_dataset.make_initializable_iterator()
 
 
@@ -192,7 +469,7 @@ def lstm_train(train_dataset_files, num_dep_types,num_path_words, model_dir, key
         embedded_word_drop = tf.nn.dropout(embedded_word, keep_prob)
 
     concattenated = tf.concat([tf.expand_dims(embedded_word_drop,2),tf.expand_dims(embedded_dep,2)],2)
-    total_embedded = tf.reshape(concattenated,[-1,200,word_embedding_dimension+dep_embedding_dimension])
+    total_embedded = tf.reshape(concattenated,[-1,2 * max_path_length,word_embedding_dimension+dep_embedding_dimension])
 
     total_sequence_length = tf.add(batch_dep_word_length,batch_dependency_type_length)
 
@@ -247,13 +524,12 @@ def lstm_train(train_dataset_files, num_dep_types,num_path_words, model_dir, key
 
 
 
-    global_step = tf.Variable(0, name="global_step")
-
     optimizer = tf.train.AdamOptimizer().minimize(total_loss, global_step=global_step)
 
     # Run training
     save_path = None
     merged = tf.summary.merge_all()
+    controller.start(model_dir)
 
     config = tf.ConfigProto(log_device_placement=True)
     config.gpu_options.allow_growth = True
@@ -267,21 +543,33 @@ def lstm_train(train_dataset_files, num_dep_types,num_path_words, model_dir, key
             print('using word2vec embeddings')
             sess.run(embedding_init, feed_dict={embedding_placeholder: word2vec_embeddings})
 
-        for epoch in range(num_epochs):
+        # resumes at the epoch and batch of the latest training checkpoint
+        start_epoch, resume_epoch_steps = 0, 0
+        if resume is True and controller.restore_checkpoint(sess) is True:
+            start_epoch, resume_epoch_steps = epoch_counter.get_position(sess)
+
+        for epoch in range(start_epoch, num_epochs):
             train_handle = sess.run(train_iter.string_handle())
+            # the training datasets skip the batches of an interrupted epoch when initialized
+            if resume_epoch_steps == 0:
+                epoch_counter.start_epoch(sess, epoch)
             sess.run(train_iter.initializer)
+            resume_epoch_steps = 0
 
             while True:
                 try:
-                    u, tl = sess.run([optimizer, loss], feed_dict={iterator_handle: train_handle, keep_prob: 0.5})
+                    u, tl, step = sess.run([optimizer, loss, global_step], feed_dict={iterator_handle: train_handle, keep_prob: 0.5})
+                    controller.after_step(sess, step)
                 except tf.errors.OutOfRangeError:
                     break
 
+            if controller.should_evaluate(epoch) is False:
+                continue
+
             train_accuracy_handle = sess.run(train_accuracy_iter.string_handle())
             sess.run(train_accuracy_iter.initializer)
 
-            total_predicted_prob = np.array([])
-            total_labels = np.array([])
+            train_metrics = evaluation.LabelMetrics(num_labels)
             step = 0
             total_loss_value = 0
             total_accuracy_value = 0
@@ -293,17 +581,13 @@ def lstm_train(train_dataset_files, num_dep_types,num_path_words, model_dir, key
                                                                          feed_dict={
                                                                              iterator_handle: train_accuracy_handle,
                                                                              keep_prob: 1.0})
-                    total_predicted_prob = np.append(total_predicted_prob, predicted_class)
-                    total_labels = np.append(total_labels, b_labels)
+                    train_metrics.update(predicted_class, b_labels)
                     total_loss_value += tl_val
                     total_accuracy_value += ta_val
 
                 except tf.errors.OutOfRangeError:
                     break
 
-            total_predicted_prob = total_predicted_prob.reshape((training_instances_count, num_labels))
-            total_labels = total_labels.reshape((training_instances_count, num_labels))
-
             total_accuracy_value = total_accuracy_value / step
             total_loss_value = total_loss_value / step
             acc_summary = tf.Summary()
@@ -314,18 +598,20 @@ def lstm_train(train_dataset_files, num_dep_types,num_path_words, model_dir, key
             train_writer.add_summary(loss_summary, epoch)
             train_writer.flush()
 
+            label_f1_scores = train_metrics.f1_scores()
             for l in range(len(key_order)):
-                column_l = total_predicted_prob[:, l]
-                column_true = total_labels[:, l]
-                label_accuracy = metrics.f1_score(y_true=column_true, y_pred=column_l)
+                label_accuracy = label_f1_scores[l]
                 print("Epoch = %d,Label = %s: %.2f%% "
                       % (epoch, key_order[l], 100. * label_accuracy))
 
+            # the test set is monitored if there is one, otherwise the training set
+            monitored_loss = total_loss_value
+            monitored_f1_scores = label_f1_scores
+
             if test_dataset_files is not None:
                 test_handle = sess.run(test_iter.string_handle())
                 sess.run(test_iter.initializer)
-                test_y_predict_total = np.array([])
-                test_y_label_total = np.array([])
+                test_metrics = evaluation.LabelMetrics(num_labels)
                 test_step = 0
                 test_loss_value = 0
                 test_accuracy_value = 0
@@ -335,17 +621,13 @@ def lstm_train(train_dataset_files, num_dep_types,num_path_words, model_dir, key
                         test_loss, test_accuracy, batch_test_predict, batch_test_labels = sess.run(
                             [total_loss, accuracy, class_yhat, batch_labels], feed_dict={
                                 iterator_handle: test_handle, keep_prob: 1.0})
-                        test_y_predict_total = np.append(test_y_predict_total, batch_test_predict)
-                        test_y_label_total = np.append(test_y_label_total, batch_test_labels)
+                        test_metrics.update(batch_test_predict, batch_test_labels)
                         test_loss_value += test_loss
                         test_accuracy_value += test_accuracy
 
                     except tf.errors.OutOfRangeError:
                         break
 
-                test_y_predict_total = test_y_predict_total.reshape((test_instances_count, 1))
-                test_y_label_total = test_y_label_total.reshape((test_instances_count, 1))
-
                 test_accuracy_value = test_accuracy_value / test_step
                 test_loss_value = test_loss_value / test_step
                 test_acc_summary = tf.Summary()
@@ -356,17 +638,151 @@ def lstm_train(train_dataset_files, num_dep_types,num_path_words, model_dir, key
                 test_writer.add_summary(test_loss_summary, epoch)
                 test_writer.flush()
 
+                test_label_f1_scores = test_metrics.f1_scores()
                 for l in range(len(key_order)):
-                    column_l = test_y_predict_total[:, l]
-                    column_true = test_y_label_total[:, l]
-                    label_accuracy = metrics.f1_score(y_true=column_true, y_pred=column_l)
+                    label_accuracy = test_label_f1_scores[l]
                     print("Epoch = %d,Test Label = %s: %.2f%% "
                           % (epoch, key_order[l], 100. * label_accuracy))
+                monitored_loss = test_loss_value
+                monitored_f1_scores = test_label_f1_scores
+
+            if controller.end_evaluation(sess, epoch, monitored_loss, monitored_f1_scores) is True:
+                break
 
+        controller.finish(sess)
         save_path = saver.save(sess, model_dir)
 
     return save_path
 
+class LSTMPredictor(object):
+    def __init__(self, model_file, batch_size=4096):
+        '''Loads a trained lstm model once into its own graph and session, which stay open for repeated predictions
+        :param model_file: path of trained lstm model
+        :param batch_size: number of instances run per session call'''
+        self.model_file = model_file
+        self.batch_size = batch_size
+        if model_export.is_frozen_model(model_file):
+            self.graph = model_export.load_frozen_graph(model_file)
+            self.sess = tf.Session(graph=self.graph)
+        else:
+            self.graph = tf.Graph()
+            with self.graph.as_default():
+                restored_model = tf.train.import_meta_graph(model_file + '.meta', clear_devices=True)
+                self.sess = tf.Session(graph=self.graph)
+                restored_model.restore(self.sess, model_file)
+
+        # models saved before the inputs were named are fed through the outputs of the iterator, and were
+        # trained on paths padded to a fixed length
+        input_names = ['dependency_ids', 'word_ids', 'dependency_type_sequence_length', 'dependency_word_sequence_length']
+        self.inputs = []
+        self.fixed_path_length = None
+        for i in range(len(input_names)):
+            try:
+                self.inputs.append(self.graph.get_tensor_by_name(input_names[i] + ':0'))
+            except KeyError:
+                self.inputs.append(self.graph.get_tensor_by_name('IteratorGetNext:' + str(i)))
+                self.fixed_path_length = 100
+        # frozen graphs have no iterator, their batches are fed from a dataset of this graph
+        self.labels = None
+        self.iterator_handle = None
+        if model_export.is_frozen_model(model_file) is False:
+            try:
+                self.labels = self.graph.get_tensor_by_name('batch_labels:0')
+            except KeyError:
+                # models saved before the labels were named
+                self.labels = self.graph.get_tensor_by_name('IteratorGetNext:4')
+            self.iterator_handle = self.graph.get_tensor_by_name('iterator_handle:0')
+        self.keep_prob = self.graph.get_tensor_by_name('keep_prob:0')
+        self.predict_prob = self.graph.get_tensor_by_name('predict_prob:0')
+        self.num_labels = int(self.predict_prob.shape[1])
+
+        # PADDING_WORD is the last row of both embeddings
+        self.padding_ids = (int(self.graph.get_tensor_by_name('dependency_type_embedding/W:0').shape[0]) - 1,
+                            int(self.graph.get_tensor_by_name('dependency_word_embedding/W:0').shape[0]) - 1)
+        self.batch_padding_values = padding_values(self.padding_ids[0] + 1, self.padding_ids[1] + 1)
+
+    def predict_batch(self, dep_path_list_features, dep_word_features, dep_type_path_length, dep_word_path_length):
+        '''Returns probabilities of one batch, paths are lists of ids or padded 2d arrays trimmed to the batch'''
+        dep_type_path_length = np.asarray(dep_type_path_length, dtype=np.int32)
+        dep_word_path_length = np.asarray(dep_word_path_length, dtype=np.int32)
+        if dep_type_path_length.shape[0] == 0:
+            return np.zeros((0, self.num_labels), dtype=np.float32)
+        length = max(int(dep_type_path_length.max()), int(dep_word_path_length.max()), 1)
+        if self.fixed_path_length is not None:
+            length = self.fixed_path_length
+        paths = []
+        for f, features in enumerate([dep_path_list_features, dep_word_features]):
+            if isinstance(features, np.ndarray) and features.ndim == 2:
+                features = features[:, :length]
+                if features.shape[1] < length:
+                    features = pad_sequences(features, self.padding_ids[f], length)
+                paths.append(features)
+            else:
+                paths.append(pad_sequences(features, self.padding_ids[f], length))
+        feed_dict = {self.inputs[0]: paths[0], self.inputs[1]: paths[1], self.inputs[2]: dep_type_path_length,
+                     self.inputs[3]: dep_word_path_length, self.keep_prob: 1.0}
+        return self.sess.run(self.predict_prob, feed_dict=feed_dict)
+
+    def predict(self, dep_path_list_features, dep_word_features, dep_type_path_length, dep_word_path_length):
+        '''Returns probabilities of in memory instances in their order, batching instances of similar path length'''
+        lengths = np.maximum(np.asarray(dep_type_path_length, dtype=np.int32),
+                             np.asarray(dep_word_path_length, dtype=np.int32))
+        order = np.argsort(lengths, kind='mergesort')
+        predicted_prob = np.zeros((lengths.shape[0], self.num_labels), dtype=np.float32)
+        for start in range(0, lengths.shape[0], self.batch_size):
+            batch_index = order[start:start + self.batch_size]
+            batch = [take_rows(features, batch_index) for features in
+                     [dep_path_list_features, dep_word_features, dep_type_path_length, dep_word_path_length]]
+            predicted_prob[batch_index] = self.predict_batch(*batch)
+        return predicted_prob
+
+    def iter_predict(self, batches):
+        '''Yields probabilities of each batch of an iterable of (dep paths, dep words, dep path lengths,
+        dep word lengths) tuples, so candidates are scored without holding them all in memory'''
+        for batch in batches:
+            yield self.predict_batch(*batch[:4])
+
+    def iter_predict_files(self, dataset_files):
+        '''Yields probabilities and labels of each batch of tfrecord files or npy shards in file order'''
+        with self.graph.as_default():
+            if is_npy_dataset(dataset_files):
+                dataset = npy_dataset(load_npy_shards(dataset_files), self.batch_size, self.batch_padding_values)
+            else:
+                dataset = tf.data.TFRecordDataset(dataset_files,
+                                                  compression_type=tfrecord_io.dataset_compression(dataset_files))
+                dataset = dataset.map(parse, num_parallel_calls=8)
+                dataset = padded_batches(dataset, self.batch_size, self.batch_padding_values)
+            dataset = dataset.prefetch(2)
+            iterator = dataset.make_initializable_iterator()
+            next_batch = iterator.get_next()
+            handle = self.sess.run(iterator.string_handle())
+        self.sess.run(iterator.initializer)
+        while True:
+            try:
+                if self.iterator_handle is None:
+                    batch = self.sess.run(next_batch)
+                    yield self.predict_batch(*batch[:4]), batch[4]
+                else:
+                    yield self.sess.run([self.predict_prob, self.labels],
+                                        feed_dict={self.iterator_handle: handle, self.keep_prob: 1.0})
+            except tf.errors.OutOfRangeError:
+                break
+
+    def close(self):
+        '''Closes the session'''
+        self.sess.close()
+
+def take_rows(features, index):
+    """
+    selects rows of an array or list
+    :param features: array or list of rows
+    :param index: array of row indices
+    :return: selected rows
+    """
+    if isinstance(features, np.ndarray):
+        return features[index]
+    return [features[i] for i in index]
+
 def lstm_test(test_dep_path_list_features,test_dep_word_features,test_dep_type_path_length,test_dep_word_path_length, test_labels,model_file):
     """
     test instances through lstm network
@@ -375,91 +791,28 @@ def lstm_test(test_dep_path_list_features,test_dep_word_features,test_dep_type_p
     :param model_file: path of trained lstm model
     :return: predicted probabilities and labels
     """
-
-
-    dependency_ids = tf.placeholder(test_dep_path_list_features.dtype, test_dep_path_list_features.shape,
-                                    name="dependency_ids")
-    dependency_type_sequence_length = tf.placeholder(test_dep_type_path_length.dtype,
-                                                     test_dep_type_path_length.shape,
-                                                     name="dependency_type_sequence_length")
-    word_ids = tf.placeholder(test_dep_word_features.dtype, test_dep_word_features.shape, name="word_ids")
-    dependency_word_sequence_length = tf.placeholder(test_dep_word_path_length.dtype,
-                                                     test_dep_word_path_length.shape,
-                                                     name="dependency_word_sequence_length")
-    output_tensor = tf.placeholder(tf.float32, test_labels.shape, name='output')
-    dataset = tf.data.Dataset.from_tensor_slices((dependency_ids, word_ids, dependency_type_sequence_length,
-                                                  dependency_word_sequence_length, output_tensor))
-    dataset = dataset.batch(1000)
-
-    total_labels = np.array([])
-    total_predicted_prob = np.array([])
-    with tf.Session() as sess:
-        restored_model = tf.train.import_meta_graph(model_file + '.meta',clear_devices=True)
-        restored_model.restore(sess, model_file)
-        graph = tf.get_default_graph()
-
-        iterator_handle = graph.get_tensor_by_name('iterator_handle:0')
-        test_iterator = dataset.make_initializable_iterator()
-        new_handle = sess.run(test_iterator.string_handle())
-        sess.run(test_iterator.initializer, feed_dict={dependency_ids: test_dep_path_list_features,
-                                                       word_ids: test_dep_word_features,
-                                                       dependency_type_sequence_length: test_dep_type_path_length,
-                                                       dependency_word_sequence_length: test_dep_word_path_length,
-                                                       output_tensor: test_labels})
-        dependency_ids_tensor = graph.get_tensor_by_name('IteratorGetNext:0')
-        dependency_words_tensor = graph.get_tensor_by_name('IteratorGetNext:1')
-        dep_type_sequence_length_tensor = graph.get_tensor_by_name('IteratorGetNext:2')
-        dep_word_sequence_length_tensor = graph.get_tensor_by_name('IteratorGetNext:3')
-        batch_labels_tensor = graph.get_tensor_by_name('IteratorGetNext:4')
-        keep_prob_tensor = graph.get_tensor_by_name('keep_prob:0')
-        predict_tensor = graph.get_tensor_by_name('class_predict:0')
-        predict_prob = graph.get_tensor_by_name('predict_prob:0')
-        while True:
-            try:
-                predicted_val, batch_labels = sess.run(
-                    [predict_prob, batch_labels_tensor],
-                    feed_dict={iterator_handle: new_handle, keep_prob_tensor: 1.0})
-                total_labels = np.append(total_labels, batch_labels)
-                total_predicted_prob = np.append(total_predicted_prob, predicted_val)
-            except tf.errors.OutOfRangeError:
-                break
-
+    predictor = LSTMPredictor(model_export.inference_model_file(model_file))
+    total_predicted_prob = predictor.predict(test_dep_path_list_features, test_dep_word_features,
+                                             test_dep_type_path_length, test_dep_word_path_length)
+    predictor.close()
+    total_labels = np.asarray(test_labels, dtype=np.float32)
     print(total_predicted_prob.shape)
-    total_predicted_prob = total_predicted_prob.reshape(test_labels.shape)
-    total_labels = total_labels.reshape(test_labels.shape)
 
     return total_predicted_prob, total_labels
 
 def lstm_predict(total_dataset_files,model_file):
-    dataset = tf.data.TFRecordDataset(total_dataset_files)
-    dataset = dataset.map(parse)
-    dataset = dataset.batch(1)
-
-
-    with tf.Session() as sess:
-        restored_model = tf.train.import_meta_graph(model_file + '.meta')
-        restored_model.restore(sess, model_file)
-        graph = tf.get_default_graph()
-        iterator_handle = graph.get_tensor_by_name('iterator_handle:0')
-        test_iterator = dataset.make_initializable_iterator()
-        new_handle = sess.run(test_iterator.string_handle())
-        sess.run(test_iterator.initializer)
-        dependency_ids_tensor = graph.get_tensor_by_name('IteratorGetNext:0')
-        dependency_words_tensor = graph.get_tensor_by_name('IteratorGetNext:1')
-        dep_type_sequence_length_tensor = graph.get_tensor_by_name('IteratorGetNext:2')
-        dep_word_sequence_length_tensor = graph.get_tensor_by_name('IteratorGetNext:3')
-        batch_labels_tensor = graph.get_tensor_by_name('IteratorGetNext:4')
-        keep_prob_tensor = graph.get_tensor_by_name('keep_prob:0')
-        predict_tensor = graph.get_tensor_by_name('class_predict:0')
-        predict_prob = graph.get_tensor_by_name('predict_prob:0')
-        total_predicted_prob = np.array([])
-        while True:
-            try:
-                predicted_val = sess.run([predict_prob], feed_dict={iterator_handle: new_handle, keep_prob_tensor: 1.0})
-                total_predicted_prob = np.append(total_predicted_prob, predicted_val[0])
-            except tf.errors.OutOfRangeError:
-                break
+    # probabilities are collected flat, one value per instance and label
+    predictor = LSTMPredictor(model_export.inference_model_file(model_file))
+    if is_npy_dataset(total_dataset_files):
+        num_values = npy_instance_counts(load_npy_shards(total_dataset_files))[0] * predictor.num_labels
+    else:
+        predict_stats = record_stats.load_record_stats(total_dataset_files, np.int32)
+        num_values = predict_stats['count'] * len(predict_stats['label_counts'])
+    total_predicted_prob = evaluation.BatchAccumulator(num_values, 1)
+    for predicted_val, batch_labels in predictor.iter_predict_files(total_dataset_files):
+        total_predicted_prob.append(np.ravel(predicted_val))
+    predictor.close()
+    total_predicted_prob = total_predicted_prob.get_values().ravel()
 
     print(total_predicted_prob)
     return total_predicted_prob
-
@@ -0,0 +1,213 @@
+import os
+import sys
+import itertools
+import threading
+import Queue
+import numpy as np
+import tensorflow as tf
+
+# file extensions of compressed tfrecord files
+compression_extensions = {'GZIP': '.gz', 'ZLIB': '.zlib'}
+
+def record_extension(compression=None):
+    """
+    file extension of tfrecord files written with compression
+    :param compression: None, 'GZIP' or 'ZLIB'
+    :return: file extension
+    """
+    if compression is None:
+        return '.tfrecord'
+    return '.tfrecord' + compression_extensions[compression]
+
+def record_compression(record_file):
+    """
+    compression type of tfrecord file from its extension
+    :param record_file: tfrecord file path
+    :return: '', 'GZIP' or 'ZLIB'
+    """
+    for compression in compression_extensions:
+        if record_file.endswith(compression_extensions[compression]):
+            return compression
+    return ''
+
+def dataset_compression(record_files):
+    """
+    compression type shared by tfrecord files read into one dataset
+    :param record_files: list of tfrecord files
+    :return: '', 'GZIP' or 'ZLIB'
+    """
+    compressions = set(record_compression(record_file) for record_file in record_files)
+    if len(compressions) > 1:
+        raise ValueError('tfrecord files of one dataset must share compression: ' + str(sorted(compressions)))
+    if len(compressions) == 0:
+        return ''
+    return compressions.pop()
+
+def record_options(compression):
+    """
+    tfrecord options for compression type
+    :param compression: None, '', 'GZIP' or 'ZLIB'
+    :return: TFRecordOptions or None
+    """
+    if not compression:
+        return None
+    return tf.python_io.TFRecordOptions(compression)
+
+def row_slices(matrix):
+    """
+    converts matrix to contiguous int32 bytes once and slices the buffer per row
+    :param matrix: 2d array or list of equal length rows
+    :return: list of row bytes
+    """
+    matrix = np.ascontiguousarray(matrix, dtype=np.int32)
+    buffer = matrix.tobytes()
+    row_size = matrix.itemsize * int(np.prod(matrix.shape[1:]))
+    return [buffer[i * row_size:(i + 1) * row_size] for i in range(matrix.shape[0])]
+
+def ragged_row_slices(rows):
+    """
+    converts rows of different lengths to one int32 buffer once and slices the buffer per row
+    :param rows: list of rows
+    :return: list of row bytes
+    """
+    lengths = [len(row) for row in rows]
+    values = np.fromiter(itertools.chain.from_iterable(rows), dtype=np.int32, count=sum(lengths))
+    buffer = values.tobytes()
+    offsets = np.concatenate([[0], np.cumsum(lengths)]) * values.itemsize
+    return [buffer[offsets[i]:offsets[i + 1]] for i in range(len(rows))]
+
+def feed_forward_examples(features, labels):
+    """
+    serializes a batch of sparse feed forward features and labels
+    :param features: list of active feature indices per instance
+    :param labels: labels of instances
+    :return: list of serialized examples
+    """
+    labels = np.ascontiguousarray(labels, dtype=np.int8)
+    label_buffer = labels.tobytes()
+    label_size = labels.size // max(len(features), 1)
+
+    serialized = []
+    example = tf.train.Example()
+    # the single example is refilled for every row, SetInParent keeps x present when a row has no features
+    example.features.feature['x'].int64_list.SetInParent()
+    x = example.features.feature['x'].int64_list.value
+    y = example.features.feature['y'].bytes_list.value
+    y.append(b'')
+    for i in range(len(features)):
+        del x[:]
+        x.extend(features[i])
+        y[0] = label_buffer[i * label_size:(i + 1) * label_size]
+        serialized.append(example.SerializeToString())
+    return serialized
+
+def lstm_examples(dep_path_list_features, dep_word_features, dep_type_path_length, dep_word_path_length, labels):
+    """
+    serializes a batch of lstm features and labels
+    :param dep_path_list_features: dependency path type features
+    :param dep_word_features: dependency word path features
+    :param dep_type_path_length: dep type path length
+    :param dep_word_path_length: dep word path length
+    :param labels: distantly trained labels
+    :return: list of serialized examples
+    """
+    num_instances = len(labels)
+    if num_instances == 0:
+        return []
+    columns = [('dep_path_list', ragged_row_slices(dep_path_list_features)),
+               ('dep_word_feat', ragged_row_slices(dep_word_features)),
+               ('dep_path_length', row_slices(np.reshape(dep_type_path_length, (num_instances, 1)))),
+               ('dep_word_length', row_slices(np.reshape(dep_word_path_length, (num_instances, 1)))),
+               ('y', row_slices(labels))]
+
+    serialized = []
+    example = tf.train.Example()
+    values = []
+    for name, rows in columns:
+        value = example.features.feature[name].bytes_list.value
+        value.append(b'')
+        values.append((value, rows))
+    for i in range(num_instances):
+        for value, rows in values:
+            value[0] = rows[i]
+        serialized.append(example.SerializeToString())
+    return serialized
+
+class BatchRecordWriter(object):
+    def __init__(self, record_file, serialize_batch, compression=None, background=True, max_pending_batches=4):
+        '''Writes batches of instances to a tfrecord file, serializing and writing in a background thread
+        while the caller featurizes the next batch. Used in a with statement the file is closed when the block
+        ends, or aborted if it raises'''
+        self.record_file = record_file
+        self.serialize_batch = serialize_batch
+        self.writer = tf.python_io.TFRecordWriter(record_file, record_options(compression))
+        self.error = None
+        self.aborted = False
+        self.closed = False
+        self.thread = None
+        if background is True:
+            self.batches = Queue.Queue(max_pending_batches)
+            self.thread = threading.Thread(target=self.run)
+            self.thread.daemon = True
+            self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+    def write_serialized(self, batch):
+        '''Serializes and writes one batch'''
+        for serialized in self.serialize_batch(*batch):
+            self.writer.write(serialized)
+
+    def run(self):
+        '''Writes queued batches until close or abort puts None on the queue'''
+        while True:
+            batch = self.batches.get()
+            if batch is None:
+                break
+            if self.error is None and self.aborted is False:
+                try:
+                    self.write_serialized(batch)
+                except Exception:
+                    self.error = sys.exc_info()
+
+    def write_batch(self, *batch):
+        '''Queues batch of feature columns for writing'''
+        if self.error is not None:
+            raise self.error[0], self.error[1], self.error[2]
+        if self.thread is None:
+            self.write_serialized(batch)
+        else:
+            self.batches.put(batch)
+
+    def stop(self):
+        '''Waits for the writer thread to take every queued batch and closes the file'''
+        if self.closed is True:
+            return
+        self.closed = True
+        if self.thread is not None:
+            self.batches.put(None)
+            self.thread.join()
+        self.writer.close()
+
+    def close(self):
+        '''Waits for queued batches and closes the file, raising errors of the writer thread'''
+        self.stop()
+        if self.error is not None:
+            self.abort()
+            raise self.error[0], self.error[1], self.error[2]
+        return self.record_file
+
+    def abort(self):
+        '''Drops batches that are not written yet, stops the writer thread and removes the partial file'''
+        self.aborted = True
+        self.stop()
+        if os.path.isfile(self.record_file):
+            os.remove(self.record_file)
@@ -0,0 +1,194 @@
+import os
+import json
+import time
+import numpy as np
+import tensorflow as tf
+
+
+def subsample_records(dataset, fraction):
+    """
+    randomly keeps a fraction of serialized records, sampled again every time the dataset is iterated
+    :param dataset: dataset of serialized records
+    :param fraction: fraction of records to keep
+    :return: sampled dataset
+    """
+    if fraction >= 1.0:
+        return dataset
+    return dataset.filter(lambda serialized_example: tf.random_uniform([]) < fraction)
+
+
+class EpochCounter(object):
+    def __init__(self, global_step):
+        '''Epoch and epoch start step variables, saved in checkpoints so training resumes inside an epoch'''
+        self.epoch = tf.Variable(0, name='epoch', trainable=False)
+        self.start_step = tf.Variable(0, name='epoch_start_step', trainable=False)
+        # number of batches trained in the current epoch
+        self.epoch_steps = tf.identity(global_step - self.start_step, name='epoch_steps')
+        self.next_epoch = tf.placeholder(tf.int32, shape=[], name='next_epoch')
+        self.start_epoch_op = tf.group(tf.assign(self.epoch, self.next_epoch), tf.assign(self.start_step, global_step))
+
+    def start_epoch(self, sess, epoch):
+        '''Sets the epoch and marks the current step as its start'''
+        sess.run(self.start_epoch_op, feed_dict={self.next_epoch: epoch})
+
+    def get_position(self, sess):
+        '''Returns the epoch and the number of batches trained in it'''
+        return sess.run([self.epoch, self.epoch_steps])
+
+
+class TrainingController(object):
+    def __init__(self, num_epochs=250, eval_every=1, eval_fraction=1.0, monitor='loss', patience=None,
+                 min_delta=0.0, keep_best=False, checkpoint_steps=None, checkpoint_secs=None, max_checkpoints=5):
+        '''Decides when a trainer evaluates, stops early and checkpoints its best model.
+        The defaults train all epochs and evaluate the whole training and test sets every epoch.
+        :param num_epochs: maximum number of epochs
+        :param eval_every: evaluate every N epochs, the last epoch is always evaluated
+        :param eval_fraction: fraction of instances randomly sampled for each evaluation
+        :param monitor: 'loss' or 'f1' (mean over labels) of the test set, or of the training set without test set
+        :param patience: evaluations without an improvement of more than min_delta before stopping, None never stops
+        :param min_delta: minimum change of the monitored value counted as improvement
+        :param keep_best: checkpoint the best evaluated model and restore it before the final save
+        :param checkpoint_steps: save a training checkpoint every N batches, None disables step checkpoints
+        :param checkpoint_secs: save a training checkpoint every N seconds, None disables timed checkpoints
+        :param max_checkpoints: number of most recent training checkpoints kept'''
+        if monitor not in ('loss', 'f1'):
+            raise ValueError('monitor must be loss or f1: ' + str(monitor))
+        self.num_epochs = num_epochs
+        self.eval_every = max(eval_every, 1)
+        self.eval_fraction = eval_fraction
+        self.monitor = monitor
+        self.patience = patience
+        self.min_delta = min_delta
+        self.keep_best = keep_best
+        self.checkpoint_steps = checkpoint_steps
+        self.checkpoint_secs = checkpoint_secs
+        self.max_checkpoints = max_checkpoints
+
+        self.best_value = None
+        self.best_epoch = None
+        self.evaluations_without_improvement = 0
+        self.best_saver = None
+        self.best_model_path = None
+        self.best_model_dir = None
+        self.checkpoint_saver = None
+        self.checkpoint_dir = None
+        self.last_checkpoint_step = 0
+        self.last_checkpoint_time = None
+
+    def start(self, model_dir, saveables=None):
+        '''Builds the savers of the best model and of training checkpoints, called once the model graph is built
+        :param model_dir: directory of the trained model
+        :param saveables: saveable objects such as the training iterator stored with training checkpoints'''
+        self.best_value = None
+        self.best_epoch = None
+        self.evaluations_without_improvement = 0
+        self.best_model_path = None
+        if self.keep_best is True:
+            self.best_model_dir = os.path.join(model_dir, 'best_model')
+            if os.path.isdir(self.best_model_dir) == False:
+                os.makedirs(self.best_model_dir)
+            self.best_saver = tf.train.Saver(max_to_keep=1)
+
+        # training checkpoints also hold optimizer slots, epoch counter and iterator position
+        self.checkpoint_dir = os.path.join(model_dir, 'checkpoints')
+        if saveables is None:
+            saveables = []
+        self.checkpoint_saver = tf.train.Saver(tf.global_variables() + list(saveables), max_to_keep=self.max_checkpoints)
+        self.last_checkpoint_step = 0
+        self.last_checkpoint_time = time.time()
+
+    def get_state(self):
+        '''Returns the early stopping state saved next to training checkpoints'''
+        return {'best_value': self.best_value, 'best_epoch': self.best_epoch,
+                'evaluations_without_improvement': self.evaluations_without_improvement,
+                'best_model_path': self.best_model_path}
+
+    def set_state(self, state):
+        '''Restores the early stopping state of a training checkpoint'''
+        self.best_value = state['best_value']
+        self.best_epoch = state['best_epoch']
+        self.evaluations_without_improvement = state['evaluations_without_improvement']
+        if self.best_saver is not None:
+            self.best_model_path = state['best_model_path']
+
+    def save_checkpoint(self, sess, step):
+        '''Saves a training checkpoint and the early stopping state'''
+        if os.path.isdir(self.checkpoint_dir) == False:
+            os.makedirs(self.checkpoint_dir)
+        checkpoint_path = self.checkpoint_saver.save(sess, os.path.join(self.checkpoint_dir, 'model'), global_step=step,
+                                                     write_meta_graph=False)
+        with open(checkpoint_path + '.state.json.tmp', 'w') as file:
+            json.dump(self.get_state(), file)
+        os.rename(checkpoint_path + '.state.json.tmp', checkpoint_path + '.state.json')
+        # states of checkpoints removed by the saver's retention limit
+        kept = set(self.checkpoint_saver.last_checkpoints)
+        for state_file in os.listdir(self.checkpoint_dir):
+            if state_file.endswith('.state.json') and \
+                    os.path.join(self.checkpoint_dir, state_file[:-len('.state.json')]) not in kept:
+                os.remove(os.path.join(self.checkpoint_dir, state_file))
+        self.last_checkpoint_step = step
+        self.last_checkpoint_time = time.time()
+        return checkpoint_path
+
+    def after_step(self, sess, step):
+        '''Saves a training checkpoint when one is due after training batch step'''
+        if (self.checkpoint_steps is not None and step - self.last_checkpoint_step >= self.checkpoint_steps) or \
+                (self.checkpoint_secs is not None and time.time() - self.last_checkpoint_time >= self.checkpoint_secs):
+            self.save_checkpoint(sess, step)
+
+    def restore_checkpoint(self, sess):
+        '''Restores the latest training checkpoint, returns False if there is none'''
+        checkpoint_path = tf.train.latest_checkpoint(self.checkpoint_dir)
+        if checkpoint_path is None:
+            print("No checkpoint in %s, training from the start" % self.checkpoint_dir)
+            return False
+        print("Resuming from " + checkpoint_path)
+        self.checkpoint_saver.restore(sess, checkpoint_path)
+        # keeps the retention limit counting checkpoints of the interrupted run
+        checkpoint_state = tf.train.get_checkpoint_state(self.checkpoint_dir)
+        self.checkpoint_saver.recover_last_checkpoints(checkpoint_state.all_model_checkpoint_paths)
+        if os.path.isfile(checkpoint_path + '.state.json'):
+            with open(checkpoint_path + '.state.json') as file:
+                self.set_state(json.load(file))
+        self.last_checkpoint_step = int(checkpoint_path.rsplit('-', 1)[1])
+        self.last_checkpoint_time = time.time()
+        return True
+
+    def should_evaluate(self, epoch):
+        '''Returns True if the model is evaluated after epoch'''
+        return (epoch + 1) % self.eval_every == 0 or epoch + 1 == self.num_epochs
+
+    def improvement(self, value):
+        '''Returns how much value improves on the best monitored value'''
+        if self.monitor == 'f1':
+            return value - self.best_value
+        return self.best_value - value
+
+    def end_evaluation(self, sess, epoch, loss, f1_scores):
+        '''Records the evaluation of epoch and checkpoints improved models, returns True if training should stop'''
+        if self.monitor == 'f1':
+            value = float(np.mean(f1_scores))
+        else:
+            value = float(loss)
+
+        if self.best_value is None or self.improvement(value) > self.min_delta:
+            self.best_value = value
+            self.best_epoch = epoch
+            self.evaluations_without_improvement = 0
+            if self.best_saver is not None:
+                self.best_model_path = self.best_saver.save(sess, os.path.join(self.best_model_dir, 'model'),
+                                                           write_meta_graph=False)
+        else:
+            self.evaluations_without_improvement += 1
+
+        if self.patience is not None and self.evaluations_without_improvement >= self.patience:
+            print("Stopping at epoch %d, best %s = %.4f at epoch %d"
+                  % (epoch, self.monitor, self.best_value, self.best_epoch))
+            return True
+        return False
+
+    def finish(self, sess):
+        '''Restores the best model into the session before the trainer saves its final model'''
+        if self.best_model_path is not None:
+            print("Restoring best model of epoch %d" % self.best_epoch)
+            self.best_saver.restore(sess, self.best_model_path)
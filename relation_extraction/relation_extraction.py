@@ -12,6 +12,8 @@ import operator
 
 from machine_learning_models import tf_feed_forward as nn
 from machine_learning_models import tf_lstm as lstm
+from machine_learning_models import model_export
+from machine_learning_models import training_control
 
 from sklearn.linear_model import LogisticRegression, SGDClassifier
 from sklearn.externals import joblib
@@ -24,22 +26,18 @@ def write_output(filename, predicts, labels, instances, key_order):
     :param filename: output file
     :param predicts: probability values of instances
     :param labels:  labels of instances
-    :param instances: instances so you can get instance data
+    :param instances: InstanceTable of the instances
     :param key_order: key order of labels
     :return:
     """
     for k in range(len(key_order)):
         key = key_order[k]
-        labels_list = []
         file = open(filename + '_' + key, 'w')
         file.write('PMID\tE1\tE2\tClASS_LABEL\tPROBABILITY\n')
         for q in range(predicts[:, k].size):
             instance_label = labels[q, k]
-            instance_start = instances[q].sentence.get_token(instances[q].start[0]).normalized_ner
-            instance_end = instances[q].sentence.get_token(instances[q].end[0]).normalized_ner
-            labels_list.append(instance_label)
             file.write(
-                str(instances[q].sentence.pmid) + '\t' + str(instance_start) + '\t' + str(instance_end) + '\t' + str(
+                str(instances.pmids[q]) + '\t' + str(instances.entity_1[q]) + '\t' + str(instances.entity_2[q]) + '\t' + str(
                     instance_label) + '\t' + str(predicts[q, k]) + '\n')
 
         file.close()
@@ -47,40 +45,54 @@ def write_output(filename, predicts, labels, instances, key_order):
     return
 
 
-def predict(model_file, abstract_folder, entity_a, entity_b):
+def predict(model_file, abstract_folder, entity_a, entity_b, out_pairs_file, batch_size=4096):
     """
-    WORK IN PROGRESS!
-    :param model_file:
-    :param abstract_folder:
-    :param entity_a:
-    :param entity_b:
-    :return:
+    Streams a directory of unlabeled abstracts through the trained feed forward model and writes the
+    probabilities of each batch of instances as soon as it is predicted.
+    :param model_file: directory of trained model
+    :param abstract_folder: folder of abstracts to predict
+    :param entity_a: entity a in format id_type
+    :param entity_b: entity b in format id_type
+    :param out_pairs_file: prefix of output files, one file per relation
+    :param batch_size: number of instances featurized and predicted at once
+    :return: number of predicted instances
     """
 
-    predict_pmids, predict_sentences = load_data.load_abstracts_from_directory(abstract_folder,entity_a,entity_b)
-
     dep_dictionary, dep_word_dictionary, dep_element_dictionary, between_word_dictionary, key_order = pickle.load(open(model_file + 'a.pickle','rb'))
 
-
-    predict_instances = load_data.build_instances_predict(predict_sentences,dep_dictionary,
-                                                          dep_word_dictionary, dep_element_dictionary,
-                                                          between_word_dictionary,key_order)
-
-    predict_features = []
-    outfile = open(model_file+'hsv1-instances.txt','w')
-    for predict_index in range(len(predict_instances)):
-        pi = predict_instances[predict_index]
-        if predict_index%1 == 0:
-            sentence_format = pi.sentence.sentence_words
-            sentence_format[pi.entity_pair[0]] = '***' + sentence_format[pi.entity_pair[0]] + '***'
-            sentence_format[pi.entity_pair[1]] = '***'  + sentence_format[pi.entity_pair[1]] + '***'
-            outfile.write(pi.sentence.pmid + '\t' + pi.sentence.start_entity_text + '\t' + pi.sentence.end_entity_text + '\t' + ' '.join(sentence_format))
-        predict_features.append(pi.features)
-
-    outfile.close()
-    predicted_prob = nn.neural_network_predict(predict_features, model_file + '/')
-
-    return predict_instances,predicted_prob,key_order
+    predict_batches = load_data.iter_predict_instances_from_directory(abstract_folder, entity_a, entity_b,
+                                                                      dep_dictionary, dep_word_dictionary,
+                                                                      dep_element_dictionary, between_word_dictionary,
+                                                                      key_order, batch_size)
+
+    outfiles = []
+    for key in key_order:
+        outfile = open(out_pairs_file + '_' + key, 'w')
+        outfile.write('PMID\tENTITY_1\tENTITY_2\tCLASS_LABEL\tPROBABILITY\tSENTENCE\n')
+        outfiles.append(outfile)
+
+    predictor = nn.FeedForwardPredictor(model_export.inference_model_file(model_file + '/'), batch_size)
+    num_predicted = 0
+    start_time = time.time()
+    for predict_instances in predict_batches:
+        predict_probs = predictor.predict_batch([pi.features for pi in predict_instances])
+        for i in range(len(predict_instances)):
+            pi = predict_instances[i]
+            instance_start = pi.sentence.get_token(pi.start[0]).normalized_ner
+            instance_end = pi.sentence.get_token(pi.end[0]).normalized_ner
+            sentence_string = pi.sentence.get_sentence_string().strip()
+            for key_index in range(len(key_order)):
+                outfiles[key_index].write(str(pi.sentence.pmid) + '\t' + str(instance_start) + '\t'
+                                          + str(instance_end) + '\t' + str(int(predict_probs[i, key_index] > 0.5))
+                                          + '\t' + str(predict_probs[i, key_index]) + '\t' + sentence_string + '\n')
+        num_predicted += len(predict_instances)
+        print("predicted %d instances, %.1f instances/s" % (num_predicted, num_predicted / max(time.time() - start_time, 1e-6)))
+    predictor.close()
+
+    for outfile in outfiles:
+        outfile.close()
+
+    return num_predicted
 
 
 def test_lstm(model_out, abstract_folder, directional_distant_directory, symmetric_distant_directory,
@@ -134,8 +146,8 @@ def test_lstm(model_out, abstract_folder, directional_distant_directory, symmetr
     #print(test_features)
     # create np arrays
     test_labels = np.array(test_labels, dtype='float32')
-    test_dependency_ids = np.array(test_dependency_ids, dtype='int32')
-    test_dependency_words = np.array(test_dependency_words, dtype='int32')
+    test_dependency_ids = lstm.pad_sequences(test_dependency_ids, dep_path_list_dictionary['PADDING_WORD'])
+    test_dependency_words = lstm.pad_sequences(test_dependency_words, dep_word_dictionary['PADDING_WORD'])
     test_dep_type_path_length = np.array(test_dep_type_path_length, dtype='int32')
     test_dep_word_path_length = np.array(test_dep_word_path_length, dtype='int32')
 
@@ -203,7 +215,6 @@ def test_feed_forward(model_out, abstract_folder, directional_distant_directory,
     print(len(test_instances))
 
     test_labels = np.array(test_labels,dtype='float32')
-    test_features = np.array(test_features,dtype='float32')
 
     # creates instances for neural network
     instance_predicts, predict_labels = nn.neural_network_test(test_features, test_labels, model_out + '/')
@@ -250,7 +261,10 @@ def evaluate_data(model_out, abstract_folder, directional_distant_directory, sym
     return True
 
 def distant_train_lstm(model_out, abstract_folder, directional_distant_directory, symmetric_distant_directory,
-                       distant_entity_a_col, distant_entity_b_col, distant_rel_col, entity_a, entity_b, testing_abstracts):
+                       distant_entity_a_col, distant_entity_b_col, distant_rel_col, entity_a, entity_b, testing_abstracts,
+                       num_workers=1, record_format='tfrecord', compression=None, controller=None,
+                       resume=False, prune_embeddings=False, all_pairs_min_tokens=None, max_token_distance=None,
+                       max_pairs=None):
 
     """
     Distantly trains LSTM model with abstract folder full of .xml files
@@ -264,6 +278,15 @@ def distant_train_lstm(model_out, abstract_folder, directional_distant_directory
     :param entity_a: entity a in format id_type
     :param entity_b: entity b in format id_type
     :param testing_abstracts: directory of test abstracts if you want test f1 score to appear during training
+    :param num_workers: number of processes used to featurize abstracts
+    :param record_format: 'tfrecord' or 'npy' to train from memory mapped npy shards
+    :param compression: None, 'GZIP' or 'ZLIB' compression of tfrecord files
+    :param controller: TrainingController deciding epochs, evaluation and early stopping (optional)
+    :param resume: resume training from the latest checkpoint saved by the controller
+    :param prune_embeddings: keep only word2vec words that occur in dependency paths
+    :param all_pairs_min_tokens: sentences with at least this many tokens compute all shortest path trees at once
+    :param max_token_distance: skip entity pairs with more tokens between their mentions, None keeps every pair
+    :param max_pairs: entity pairs generated per sentence, None keeps every pair
     :return: path of trained model
     """
     supplemental_dict = {}
@@ -281,60 +304,65 @@ def distant_train_lstm(model_out, abstract_folder, directional_distant_directory
     # sort key order
     key_order = sorted(distant_interactions)
 
+    # parses new or changed abstracts once, the cached paths are reused for dictionaries and tfrecords
+    path_cache_files = load_data.build_path_cache_from_directory(abstract_folder, entity_a, entity_b, num_workers,
+                                                                 all_pairs_min_tokens, max_token_distance, max_pairs)
+
     # check if there is already dictionaries
     if os.path.isfile(model_out + 'a.pickle'):
         dep_type_list_dictionary, dep_word_dictionary, key_order = pickle.load(open(model_out + 'a.pickle', 'rb'))
         word2vec_embeddings = None
         if os.path.isfile(os.path.dirname(os.path.realpath(__file__)) +'/machine_learning_models/PubMed-w2v.bin'):
             print('embeddings exist')
-            word2vec_words, word2vec_vectors, dep_word_dictionary = lstm.load_bin_vec(os.path.dirname(os.path.realpath(__file__)) +'/machine_learning_models/PubMed-w2v.bin')
-            word2vec_embeddings = np.array(word2vec_vectors)
+            # a pruned dictionary was pickled with the words it kept, so pruning to it rebuilds the same rows
+            embedding_vocabulary = None
+            if prune_embeddings is True:
+                embedding_vocabulary = dep_word_dictionary
+            word2vec_words, word2vec_vectors, dep_word_dictionary = lstm.load_bin_vec(os.path.dirname(os.path.realpath(__file__)) +'/machine_learning_models/PubMed-w2v.bin',
+                                                                                      embedding_vocabulary)
+            word2vec_embeddings = np.asarray(word2vec_vectors)
             print('finished fetching embeddings')
     # load in sentences and try to get dictionaries built
     else:
-        dep_type_list_dictionary, dep_word_dictionary, word2vec_embeddings = load_data.build_dictionaries_from_directory(abstract_folder, entity_a, entity_b,LSTM=True)
+        dep_type_list_dictionary, dep_word_dictionary, word2vec_embeddings = load_data.build_dictionaries_from_cache(path_cache_files,LSTM=True,num_workers=num_workers,
+                                                                                                          prune_embeddings=prune_embeddings)
 
         pickle.dump([dep_type_list_dictionary, dep_word_dictionary, key_order], open(model_out + 'a.pickle', 'wb'))
 
 
-    # builds or loads tfrecord datsets from .xml files
-    total_dataset_files = []
-    if os.path.isdir(abstract_folder):
-        for path, subdirs, files in os.walk(abstract_folder):
-            for name in files:
-                if name.endswith('.tfrecord'):
-                    total_dataset_files.append(abstract_folder + '/' + name)
+    # builds tfrecord datasets, reusing records of abstracts unchanged since they were built with the same
+    # dictionaries and distant datasets
+    total_dataset_files = load_data.build_LSTM_instances_from_cache(path_cache_files, abstract_folder, dep_type_list_dictionary, dep_word_dictionary,
+                                   distant_interactions, reverse_distant_interactions, key_order, num_workers,
+                                   record_format, compression)
 
-        if len(total_dataset_files) == 0:
-            total_dataset_files = load_data.build_LSTM_instances_from_directory(abstract_folder, entity_a, entity_b, dep_type_list_dictionary, dep_word_dictionary,
-                                   distant_interactions, reverse_distant_interactions, key_order,supplemental_dict)
-
-    # builds or loads test tfrecord files if they exist
+    # builds test tfrecord files if there is a test directory
     total_test_files = None
     if os.path.isdir(testing_abstracts):
-        total_test_files = []
-        for path, subdirs, files in os.walk(testing_abstracts):
-            for name in files:
-                if name.endswith('.tfrecord'):
-                    total_test_files.append(testing_abstracts + '/' + name)
-        if len(total_test_files) == 0:
-            total_test_files = load_data.build_LSTM_instances_from_directory(testing_abstracts, entity_a, entity_b,
-                                                                           dep_type_list_dictionary, dep_word_dictionary,
-                                                                           distant_interactions,
-                                                                           reverse_distant_interactions, key_order,supplemental_dict)
+        total_test_files = load_data.build_LSTM_instances_from_directory(testing_abstracts, entity_a, entity_b,
+                                                                       dep_type_list_dictionary, dep_word_dictionary,
+                                                                       distant_interactions,
+                                                                       reverse_distant_interactions, key_order,supplemental_dict,
+                                                                       num_workers, record_format, compression,
+                                                                       all_pairs_min_tokens, max_token_distance, max_pairs)
 
     num_dep_types = len(dep_type_list_dictionary)
     num_path_words = len(dep_word_dictionary)
 
     # trains LSTM model
-    trained_model_path = lstm.lstm_train(total_dataset_files, num_dep_types,num_path_words, model_out + '/', key_order,total_test_files,word2vec_embeddings)
+    trained_model_path = lstm.lstm_train(total_dataset_files, num_dep_types,num_path_words, model_out + '/', key_order,total_test_files,word2vec_embeddings,
+                                         controller, resume)
 
+    # frozen inference graph loaded by test and predict instead of the training graph
+    model_export.export_inference_graph(trained_model_path, model_export.lstm_inputs)
 
     return trained_model_path
 
 
 def distant_train_feed_forward(model_out, abstract_folder, directional_distant_directory, symmetric_distant_directory,
-                               distant_entity_a_col, distant_entity_b_col, distant_rel_col, entity_a, entity_b, testing_abstracts):
+                               distant_entity_a_col, distant_entity_b_col, distant_rel_col, entity_a, entity_b, testing_abstracts,
+                               num_workers=1, compression=None, controller=None, resume=False,
+                               all_pairs_min_tokens=None, max_token_distance=None, max_pairs=None):
     """
     Distantly trains Feed forward model with abstract folder full of .xml files
     :param model_out: path to save trained model
@@ -347,6 +375,13 @@ def distant_train_feed_forward(model_out, abstract_folder, directional_distant_d
     :param entity_a: entity a in format id_type
     :param entity_b: entity b in format id_type
     :param testing_abstracts: directory of test abstracts if you want test f1 score to appear during training (optional)
+    :param num_workers: number of processes used to featurize abstracts
+    :param compression: None, 'GZIP' or 'ZLIB' compression of tfrecord files
+    :param controller: TrainingController deciding epochs, evaluation and early stopping (optional)
+    :param resume: resume training from the latest checkpoint saved by the controller
+    :param all_pairs_min_tokens: sentences with at least this many tokens compute all shortest path trees at once
+    :param max_token_distance: skip entity pairs with more tokens between their mentions, None keeps every pair
+    :param max_pairs: entity pairs generated per sentence, None keeps every pair
     :return: path of trained model
     """
 
@@ -370,6 +405,10 @@ def distant_train_feed_forward(model_out, abstract_folder, directional_distant_d
     # sort key orders
     key_order = sorted(distant_interactions)
 
+    # parses new or changed abstracts once, the cached paths are reused for dictionaries and tfrecords
+    path_cache_files = load_data.build_path_cache_from_directory(abstract_folder, entity_a, entity_b, num_workers,
+                                                                 all_pairs_min_tokens, max_token_distance, max_pairs)
+
     # check if there is already dictionaries
     if os.path.isfile(model_out + 'a.pickle'):
         dep_dictionary, dep_word_dictionary, dep_element_dictionary, between_word_dictionary, key_order = pickle.load(open(model_out + 'a.pickle', 'rb'))
@@ -379,7 +418,7 @@ def distant_train_feed_forward(model_out, abstract_folder, directional_distant_d
         dep_dictionary, \
         dep_word_dictionary, \
         dep_element_dictionary, \
-        between_word_dictionary = load_data.build_dictionaries_from_directory(abstract_folder, entity_a, entity_b)
+        between_word_dictionary = load_data.build_dictionaries_from_cache(path_cache_files, num_workers=num_workers)
 
         pickle.dump([dep_dictionary, dep_word_dictionary, dep_element_dictionary, between_word_dictionary, key_order],
                     open(model_out + 'a.pickle', 'wb'))
@@ -388,97 +427,160 @@ def distant_train_feed_forward(model_out, abstract_folder, directional_distant_d
     num_features = len(dep_dictionary) + len(dep_word_dictionary) + len(dep_element_dictionary)+ len(between_word_dictionary)
     print(num_features)
 
-    # builds or loads tfrecord files for training
-    total_dataset_files = []
-    if os.path.isdir(abstract_folder):
-        for path, subdirs, files in os.walk(abstract_folder):
-            for name in files:
-                if name.endswith('.tfrecord'):
-                    total_dataset_files.append(abstract_folder + '/' + name)
-        print(total_dataset_files)
-        if len(total_dataset_files) == 0:
-            total_dataset_files = load_data.build_instances_from_directory(abstract_folder, entity_a, entity_b, dep_dictionary, dep_word_dictionary,
+    # builds tfrecord files for training, reusing records of abstracts unchanged since they were built with the
+    # same dictionaries and distant datasets
+    total_dataset_files = load_data.build_instances_from_cache(path_cache_files, abstract_folder, dep_dictionary, dep_word_dictionary,
                                    dep_element_dictionary, between_word_dictionary,
-                                   distant_interactions, reverse_distant_interactions, key_order,supplemental_dict)
+                                   distant_interactions, reverse_distant_interactions, key_order, num_workers,
+                                   compression)
+    print(total_dataset_files)
 
     # sets hidden array for hidden layers
     hidden_array = []
 
-    # builds or loads test tfrecord files if they exist
+    # builds test tfrecord files if there is a test directory
     total_test_files = None
     if os.path.isdir(testing_abstracts):
-        total_test_files = []
-        for path, subdirs, files in os.walk(testing_abstracts):
-            for name in files:
-                if name.endswith('.tfrecord'):
-                    total_test_files.append(testing_abstracts + '/' + name)
-        if len(total_test_files) == 0:
-            total_test_files = load_data.build_instances_from_directory(testing_abstracts, entity_a, entity_b,
-                                                                           dep_dictionary, dep_word_dictionary,
-                                                                           dep_element_dictionary,
-                                                                           between_word_dictionary,
-                                                                           distant_interactions,
-                                                                           reverse_distant_interactions, key_order,supplemental_dict)
+        total_test_files = load_data.build_instances_from_directory(testing_abstracts, entity_a, entity_b,
+                                                                  dep_dictionary, dep_word_dictionary,
+                                                                  dep_element_dictionary,
+                                                                  between_word_dictionary,
+                                                                  distant_interactions,
+                                                                  reverse_distant_interactions, key_order,supplemental_dict,
+                                                                  num_workers, compression, all_pairs_min_tokens,
+                                                                  max_token_distance, max_pairs)
 
     # trains feef forward neural network model
-    trained_model_path = nn.feed_forward_train(total_dataset_files, hidden_array, model_out + '/', num_features, key_order, total_test_files)
+    trained_model_path = nn.feed_forward_train(total_dataset_files, hidden_array, model_out + '/', num_features, key_order, total_test_files,
+                                               controller, resume)
 
+    # frozen inference graph loaded by test and predict instead of the training graph
+    model_export.export_inference_graph(trained_model_path, model_export.feed_forward_inputs)
 
     return trained_model_path
 
 
+def boolean_option(value):
+    """
+    converts a True or False command line value
+    :param value: command line value
+    :return: boolean
+    """
+    if value not in ('True', 'False'):
+        raise ValueError('expected True or False: ' + value)
+    return value == 'True'
+
+# optional --name=value options of the training modes and their types, passed to the TrainingController
+# except resume, which resumes training from the latest checkpoint saved every checkpoint_steps or checkpoint_secs
+training_options = {'num_epochs': int, 'eval_every': int, 'eval_fraction': float, 'monitor': str, 'patience': int,
+                    'min_delta': float, 'keep_best': boolean_option, 'checkpoint_steps': int,
+                    'checkpoint_secs': float, 'max_checkpoints': int, 'resume': boolean_option}
+
+# optional --name=value options of the Sentence settings used while parsing abstracts, passed to distant_train_*
+sentence_options = {'all_pairs_min_tokens': int, 'max_token_distance': int, 'max_pairs': int}
+
+def parse_options(arguments, option_types):
+    """
+    splits --name=value options from the positional command line arguments
+    :param arguments: command line arguments
+    :param option_types: dictionary of option name to function converting its value
+    :return: positional arguments and dictionary of converted option values
+    """
+    positional_arguments = []
+    options = {}
+    for argument in arguments:
+        if argument.startswith('--') is False:
+            positional_arguments.append(argument)
+            continue
+        name, separator, value = argument[2:].partition('=')
+        name = name.replace('-', '_')
+        if name not in option_types or separator == '':
+            raise ValueError('unknown option: ' + argument)
+        options[name] = option_types[name](value)
+    return positional_arguments, options
+
+def split_training_options(options):
+    """
+    splits the options of a training mode into its TrainingController, resume and the Sentence settings
+    :param options: options parsed with training_options and sentence_options
+    :return: TrainingController, resume, dictionary of Sentence settings passed to distant_train_*
+    """
+    options = dict(options)
+    settings = dict((name, options.pop(name)) for name in sentence_options if name in options)
+    resume = options.pop('resume', False)
+    return training_control.TrainingController(**options), resume, settings
+
+
 def main():
     """
-    Main method, mode determines whether program runs training, testing, or prediction
+    Main method, mode determines whether program runs training, testing, or prediction.
+    Training modes take optional --name=value options after the positional arguments, see training_options
+    and sentence_options
     :return:
     """
 
     mode = sys.argv[1]  # what option
     if "TRAIN_FEED_FORWARD" in mode.upper(): # train feed forward network
-        model_out = sys.argv[2]  # location of where model should be saved after training
-        abstract_folder = sys.argv[3]  # xml file of sentences from Stanford Parser
-        directional_distant_directory = sys.argv[4]  # distant supervision knowledge base to use
-        symmetric_distant_directory = sys.argv[5]
-        distant_entity_a_col = int(sys.argv[6])  # entity 1 column
-        distant_entity_b_col = int(sys.argv[7])  # entity 2 column
+        arguments, options = parse_options(sys.argv, dict(training_options, **sentence_options))
+        model_out = arguments[2]  # location of where model should be saved after training
+        abstract_folder = arguments[3]  # xml file of sentences from Stanford Parser
+        directional_distant_directory = arguments[4]  # distant supervision knowledge base to use
+        symmetric_distant_directory = arguments[5]
+        distant_entity_a_col = int(arguments[6])  # entity 1 column
+        distant_entity_b_col = int(arguments[7])  # entity 2 column
         print(distant_entity_b_col)
-        distant_rel_col = int(sys.argv[8])  # relation column
+        distant_rel_col = int(arguments[8])  # relation column
         print(distant_rel_col)
-        entity_a = sys.argv[9].upper()  # entity_a
+        entity_a = arguments[9].upper()  # entity_a
         print(entity_a)
-        entity_b = sys.argv[10].upper()  # entity_b
-        testing_abstracts =sys.argv[11] # optional put None if you don't want to get f1 score of test set
+        entity_b = arguments[10].upper()  # entity_b
+        testing_abstracts =arguments[11] # optional put None if you don't want to get f1 score of test set
+        num_workers = 1 # optional number of processes used to featurize abstracts
+        if len(arguments) > 12:
+            num_workers = int(arguments[12])
+        controller, resume, settings = split_training_options(options)
 
         # distanty train feed forward neural network
         trained_model_path = distant_train_feed_forward(model_out, abstract_folder, directional_distant_directory,
                                                         symmetric_distant_directory,
                                                         distant_entity_a_col, distant_entity_b_col, distant_rel_col, entity_a,
-                                                        entity_b, testing_abstracts)
+                                                        entity_b, testing_abstracts, num_workers,
+                                                        controller=controller, resume=resume, **settings)
 
 
 
         print(trained_model_path)
         
     elif "TRAIN_LSTM" in mode.upper(): # train LSTM network
-        model_out = sys.argv[2]  # location of where model should be saved after training
-        abstract_folder = sys.argv[3]  # xml file of sentences from Stanford Parser
-        directional_distant_directory = sys.argv[4]  # distant supervision knowledge base to use
-        symmetric_distant_directory = sys.argv[5]
-        distant_entity_a_col = int(sys.argv[6])  # entity 1 column
-        distant_entity_b_col = int(sys.argv[7])  # entity 2 column
+        arguments, options = parse_options(sys.argv, dict(training_options, **sentence_options))
+        model_out = arguments[2]  # location of where model should be saved after training
+        abstract_folder = arguments[3]  # xml file of sentences from Stanford Parser
+        directional_distant_directory = arguments[4]  # distant supervision knowledge base to use
+        symmetric_distant_directory = arguments[5]
+        distant_entity_a_col = int(arguments[6])  # entity 1 column
+        distant_entity_b_col = int(arguments[7])  # entity 2 column
         print(distant_entity_b_col)
-        distant_rel_col = int(sys.argv[8])  # relation column
+        distant_rel_col = int(arguments[8])  # relation column
         print(distant_rel_col)
-        entity_a = sys.argv[9].upper()  # entity_a
+        entity_a = arguments[9].upper()  # entity_a
         print(entity_a)
-        entity_b = sys.argv[10].upper()  # entity_b
-        testing_abstracts =sys.argv[11] # optional put None if you don't want to get f1 score of test set
+        entity_b = arguments[10].upper()  # entity_b
+        testing_abstracts =arguments[11] # optional put None if you don't want to get f1 score of test set
+        num_workers = 1 # optional number of processes used to featurize abstracts
+        if len(arguments) > 12:
+            num_workers = int(arguments[12])
+
+        record_format = 'tfrecord' # optional 'npy' to train from memory mapped npy shards
+        if len(arguments) > 13:
+            record_format = arguments[13]
+        controller, resume, settings = split_training_options(options)
 
         #distantly train LSTM network
         trained_model_path = distant_train_lstm(model_out, abstract_folder, directional_distant_directory,
                                                 symmetric_distant_directory,
                                                 distant_entity_a_col, distant_entity_b_col, distant_rel_col, entity_a,
-                                                entity_b, testing_abstracts)
+                                                entity_b, testing_abstracts, num_workers, record_format,
+                                                controller=controller, resume=resume, **settings)
 
 
 
@@ -536,30 +638,18 @@ def main():
                                            entity_b)
         print('finished testfile')
 
-    elif "PREDICT" in mode.upper(): # WORKING ON IT!
-        model_file = sys.argv[2]
-        sentence_file = sys.argv[3]
+    elif "PREDICT" in mode.upper(): # predicts unlabeled abstracts with trained feed forward network
+        model_file = sys.argv[2]  # location of trained model
+        sentence_file = sys.argv[3]  # folder of abstracts to predict
         entity_a = sys.argv[4].upper()
         entity_b = sys.argv[5].upper()
-        out_pairs_file = sys.argv[6]
-
-        prediction_instances, predict_probs,key_order = predict(model_file, sentence_file, entity_a, entity_b)
-
-        for key_index in range(len(key_order)):
-            key = key_order[key_index]
-            outfile = open(out_pairs_file + '_' + key, 'w')
-            outfile.write('PMID\tENTITY_1\tENTITY_2\tCLASS_LABEL\tPROBABILITY\tSENTENCE\n')
-            for i in range(len(prediction_instances)):
-                pi = prediction_instances[i]
-                outfile.write(str(pi.sentence.pmid) + '\t'
-                              + str(pi.sentence.start_entity_id) + '\t'
-                              + str(pi.sentence.end_entity_id) + '\t'
-                              + str(pi.label[key_index]) + '\t'
-                              + str(predict_probs[i,key_index])+'\t'
-                              + str(pi.sentence.start_entity_text) + '\t'
-                              + ' '.join(pi.sentence.sentence_words) + '\n')
-
-            outfile.close()
+        out_pairs_file = sys.argv[6]  # prefix of output files
+        batch_size = 4096 # optional number of instances predicted at once
+        if len(sys.argv) > 7:
+            batch_size = int(sys.argv[7])
+
+        num_predicted = predict(model_file, sentence_file, entity_a, entity_b, out_pairs_file, batch_size)
+        print('predicted instances: ' + str(num_predicted))
 
     else:
         print("usage error")
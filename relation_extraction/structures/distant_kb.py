@@ -0,0 +1,180 @@
+import numpy as np
+
+#class objects for indexed distant supervision knowledge bases
+
+def pack_pairs(entity_a_ids, entity_b_ids):
+    '''Packs entity id pairs into 64 bit keys, entity a in the high 32 bits so the keys of an entity are contiguous'''
+    return (np.asarray(entity_a_ids, dtype=np.uint64) << np.uint64(32)) | np.asarray(entity_b_ids, dtype=np.uint64)
+
+
+class DistantKnowledgeBase(object):
+    def __init__(self, digest=None):
+        '''Entity pairs of every distant relation file. Entities are interned to integer ids and the pairs of a relation
+        are a sorted array of packed 64 bit keys. Ontology terms are only expanded when a pair is looked up.'''
+        self.digest = digest
+        self.entity_ids = {}
+        self.entities = []
+        self.relation_keys = {}
+        self.covering_ids = {} #ontology term to ids of entities that have it as ancestor
+        self.labelers = {}
+
+    def __getstate__(self):
+        '''Pickles entities as one list, ids and labelers are rebuilt when loaded'''
+        state = self.__dict__.copy()
+        del state['entity_ids']
+        del state['labelers']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.entity_ids = dict(zip(self.entities, range(len(self.entities))))
+        self.labelers = {}
+
+    def intern(self, entity):
+        '''Returns the id of entity, adding it if it is new'''
+        entity_id = self.entity_ids.get(entity)
+        if entity_id is None:
+            entity_id = len(self.entities)
+            self.entity_ids[entity] = entity_id
+            self.entities.append(entity)
+        return entity_id
+
+    def add_relation(self, relation, packed_keys):
+        '''Stores the packed pair keys of a relation, a (relation file, direction) tuple'''
+        self.relation_keys[relation] = np.unique(np.asarray(packed_keys, dtype=np.uint64))
+
+    def expand_ontology(self, supplemental_dict):
+        '''Maps every ancestor term of the knowledge base entities to the entities below it'''
+        covering_ids = {}
+        if len(supplemental_dict) == 0:
+            self.covering_ids = covering_ids
+            return
+        for entity_id in range(len(self.entities)):
+            entity = self.entities[entity_id]
+            for term in supplemental_dict.get(entity, ()):
+                covering_ids.setdefault(term, []).append(entity_id)
+            if entity not in supplemental_dict or entity not in supplemental_dict[entity]:
+                covering_ids.setdefault(entity, []).append(entity_id)
+        self.covering_ids = dict((term, np.array(ids, dtype=np.uint64)) for term, ids in covering_ids.iteritems())
+
+    def lookup_ids(self, entity):
+        '''Returns ids of knowledge base entities that entity matches, itself or entities it is an ancestor of'''
+        if len(self.covering_ids) > 0:
+            return self.covering_ids.get(entity)
+        entity_id = self.entity_ids.get(entity)
+        if entity_id is None:
+            return None
+        return np.array([entity_id], dtype=np.uint64)
+
+    def get_relation(self, relation):
+        '''Returns the pairs of relation'''
+        return RelationPairs(self, relation)
+
+    def get_labeler(self, key_order):
+        '''Returns the labeler of the relation keys in key_order, built once per knowledge base'''
+        key_order = tuple(key_order)
+        if key_order not in self.labelers:
+            self.labelers[key_order] = DistantLabeler(self, key_order)
+        return self.labelers[key_order]
+
+
+class RelationPairs(object):
+    def __init__(self, knowledge_base, relation):
+        '''Pairs of one relation and direction of a knowledge base'''
+        self.knowledge_base = knowledge_base
+        self.relation = relation
+        self.keys = knowledge_base.relation_keys[relation]
+
+    def __len__(self):
+        return self.keys.shape[0]
+
+    def fingerprint(self):
+        '''Identifies the pairs by the knowledge base sources they were built from'''
+        return str(self.knowledge_base.digest) + '/' + '/'.join(self.relation)
+
+
+class DistantLabeler(object):
+    def __init__(self, knowledge_base, key_order, max_product=65536):
+        '''Label index of a knowledge base, every pair key of any relation maps to bitmasks of the relations that
+        have it forward and reverse, bit i being key_order[i]. A pair is labeled for all relations at once.
+        :param knowledge_base: DistantKnowledgeBase
+        :param key_order: relation keys in label order, SYMMETRIC keys label both directions
+        :param max_product: entity id combinations above which keys are searched per entity a range'''
+        self.knowledge_base = knowledge_base
+        self.key_order = list(key_order)
+        self.max_product = max_product
+        num_words = max((len(key_order) + 63) // 64, 1)
+
+        relation_keys = []
+        for distant_key in key_order:
+            relation_keys.append(knowledge_base.relation_keys[(distant_key, 'forward')])
+            relation_keys.append(knowledge_base.relation_keys[(distant_key, 'reverse')])
+        self.keys = np.unique(np.concatenate(relation_keys + [np.zeros(0, dtype=np.uint64)]))
+        self.forward_masks = np.zeros((self.keys.shape[0], num_words), dtype=np.uint64)
+        self.reverse_masks = np.zeros((self.keys.shape[0], num_words), dtype=np.uint64)
+        self.symmetric_mask = np.zeros(num_words, dtype=np.uint64)
+        for i in range(len(key_order)):
+            bit = np.uint64(1) << np.uint64(i % 64)
+            forward_keys, reverse_keys = relation_keys[2 * i], relation_keys[2 * i + 1]
+            self.forward_masks[np.searchsorted(self.keys, forward_keys), i // 64] |= bit
+            self.reverse_masks[np.searchsorted(self.keys, reverse_keys), i // 64] |= bit
+            if 'SYMMETRIC' in key_order[i]:
+                self.symmetric_mask[i // 64] |= bit
+
+        # word and shift of each label bit, to unpack masks into label lists
+        self.label_words = np.arange(len(key_order)) // 64
+        self.label_shifts = (np.arange(len(key_order)) % 64).astype(np.uint64)
+
+    def __len__(self):
+        return self.keys.shape[0]
+
+    def match_ids(self, entities):
+        '''Returns the unique knowledge base ids matched by any of the entities'''
+        ids = [self.knowledge_base.lookup_ids(entity) for entity in entities]
+        ids = [entity_ids for entity_ids in ids if entity_ids is not None]
+        if len(ids) == 0:
+            return None
+        return np.unique(np.concatenate(ids))
+
+    def pair_positions(self, a_ids, b_ids):
+        '''Returns positions in keys of the pairs of every a id with every b id'''
+        if a_ids.shape[0] * b_ids.shape[0] <= self.max_product:
+            pair_keys = pack_pairs(a_ids[:, np.newaxis], b_ids[np.newaxis, :]).ravel()
+            positions = np.searchsorted(self.keys, pair_keys)
+            found = positions < self.keys.shape[0]
+            found[found] = self.keys[positions[found]] == pair_keys[found]
+            return positions[found]
+        # keys of each entity a are contiguous, their low 32 bits are the entity b ids
+        starts = np.searchsorted(self.keys, pack_pairs(a_ids, 0))
+        ends = np.searchsorted(self.keys, pack_pairs(a_ids + np.uint64(1), 0))
+        positions = []
+        for start, end in zip(starts, ends):
+            if start < end:
+                matched = np.in1d(self.keys[start:end] & np.uint64(0xffffffff), b_ids)
+                positions.append(np.arange(start, end)[matched])
+        if len(positions) == 0:
+            return np.zeros(0, dtype=np.int64)
+        return np.concatenate(positions)
+
+    def label_pair(self, entity_1, entity_2):
+        '''Returns the forward and reverse label lists of a pair of normalized entity id sets. Directional relations
+        label the reverse instance only if the forward pair is not in the relation.'''
+        num_words = self.symmetric_mask.shape[0]
+        forward = np.zeros(num_words, dtype=np.uint64)
+        reverse = np.zeros(num_words, dtype=np.uint64)
+        a_ids = self.match_ids(entity_1)
+        b_ids = self.match_ids(entity_2) if a_ids is not None else None
+        if b_ids is not None:
+            positions = self.pair_positions(a_ids, b_ids)
+            if positions.shape[0] > 0:
+                forward = np.bitwise_or.reduce(self.forward_masks[positions], axis=0)
+                reverse = np.bitwise_or.reduce(self.reverse_masks[positions], axis=0)
+
+        either = forward | reverse
+        forward_labels = forward | (reverse & self.symmetric_mask)
+        reverse_labels = (reverse & ~forward & ~self.symmetric_mask) | (either & self.symmetric_mask)
+        return self.unpack(forward_labels), self.unpack(reverse_labels)
+
+    def unpack(self, mask):
+        '''Returns the label list of a relation bitmask'''
+        return ((mask[self.label_words] >> self.label_shifts) & np.uint64(1)).astype(np.int64).tolist()
@@ -1,32 +1,7 @@
 import sys
 import os
-
-def dijkstra(adj_matrix, source):
-    ''' Finds shortest path between dependency paths'''
-    distance = [+sys.maxint] * len(adj_matrix)  # Unknown distance function from source to v
-    previous = [-1] * len(adj_matrix)  # Previous node in optimal path from source
-    distance[source] = 0  # Distance from source to source
-    unreached = range(len(adj_matrix))  # All nodes in the graph are unoptimized -
-
-    while len(unreached) > 0:  # The main loop
-        u = distance.index(min(distance))  # Get the node closest to the source
-        # print unreached
-        # print u
-        if distance[u] == +sys.maxint:
-            break  # all remaining vertices are inaccessible
-        else:
-            unreached.remove(u)
-            for v in unreached:  # where v has not yet been removed from Q.
-                if adj_matrix[u][v] != '':
-                    alt = distance[u] + 1
-                    if alt < distance[v]:  # Relax (u,v,a)
-                        distance[v] = alt
-                        previous[v] = u
-            distance[u] = +sys.maxint  # Set the distance to u to inf so that it get's ignored in the next iteration
-    return previous
-
-
-
+from array import array
+import numpy as np
 
 class Instance(object):
     def __init__(self,sentence, start, end, label):
@@ -58,6 +33,12 @@ class Instance(object):
 
 
 
+    def __getstate__(self):
+        '''Drops the sentence when pickled so cached instances only hold path features'''
+        state = self.__dict__.copy()
+        state['sentence'] = None
+        return state
+
     def set_label(self,label):
         '''Sets the label of the candidate sentence (positive/negative)'''
         self.label = label
@@ -78,17 +59,10 @@ class Instance(object):
         return self.sentence
 
     def build_dependency_path_indexes(self):
-        '''Builds and returns shortest dependency path by calling djikstras algorithm'''
+        '''Builds and returns shortest dependency path from the sentence's cached shortest path trees'''
         source_token_no = self.start[1] #2nd element of pair, 1st element is between token
         target_token_no = self.end[1]#2nd element of pair, 1st element is between token
-        previous = dijkstra(self.sentence.get_dependency_matrix(), source_token_no)
-        if previous[target_token_no] != -1:
-            prev = previous[target_token_no]
-            path = [prev, target_token_no]
-            while prev != source_token_no:
-                prev = previous[prev]
-                path.insert(0,prev)
-            self.dependency_words_indexes = path
+        self.dependency_words_indexes = self.sentence.get_shortest_path(source_token_no, target_token_no)
 
 
     def get_dependency_path(self):
@@ -165,58 +139,105 @@ class Instance(object):
     def get_between_words(self):
         return self.between_words
 
+    def get_path_features(self):
+        '''Returns the dependency path types, path words, path elements and between words as tuples'''
+        return tuple(self.dependency_path_list), tuple(self.dependency_words), tuple(self.dependency_elements), \
+               tuple(self.between_words)
+
 
 
 
     def build_features(self, dep_dictionary, dep_word_dictionary, dep_type_word_element_dictionary, between_word_dictionary):
-        dep_word_features = [0] * len(dep_word_dictionary)
-        dep_features = [0] * len(dep_dictionary)
-        dep_type_word_element_features = [0] * len(dep_type_word_element_dictionary)
-        between_features = [0] * len(between_word_dictionary)
-
-        dep_path_feature_words = set(dep_word_dictionary.keys())
-        intersection_set = dep_path_feature_words.intersection(set(self.dependency_words))
-        for i in intersection_set:
-            dep_word_features[dep_word_dictionary[i]] = 1
-
-        dep_type_word_element_feature_words = set(dep_type_word_element_dictionary.keys())
-        intersection_set = dep_type_word_element_feature_words.intersection(set(self.dependency_elements))
-        for i in intersection_set:
-            dep_type_word_element_features[dep_type_word_element_dictionary[i]] = 1
-
-        between_feature_words = set(between_word_dictionary.keys())
-        between_intersection_set = between_feature_words.intersection(set(self.between_words))
-        for i in between_intersection_set:
-            between_features[between_word_dictionary[i]] = 1
+        '''Builds sparse feature vector as sorted indices of the active features, offsets follow the
+        order dep path, dep words, dep elements, between words'''
+        dep_word_offset = len(dep_dictionary)
+        dep_type_word_element_offset = dep_word_offset + len(dep_word_dictionary)
+        between_offset = dep_type_word_element_offset + len(dep_type_word_element_dictionary)
 
+        features = []
         dep_path_string = self.dependency_path_string
         if dep_path_string in dep_dictionary:
-            dep_features[dep_dictionary[dep_path_string]] = 1
+            features.append(dep_dictionary[dep_path_string])
 
-        self.features = dep_features + dep_word_features + dep_type_word_element_features + between_features
+        for i in set(self.dependency_words):
+            if i in dep_word_dictionary:
+                features.append(dep_word_offset + dep_word_dictionary[i])
 
+        for i in set(self.dependency_elements):
+            if i in dep_type_word_element_dictionary:
+                features.append(dep_type_word_element_offset + dep_type_word_element_dictionary[i])
 
-    def build_lstm_features(self,dep_path_list_dictionary,dep_word_dictionary):
-        dep_path_features = [dep_path_list_dictionary['PADDING_WORD']] * 100
-        dep_word_features = [dep_word_dictionary['PADDING_WORD']] * 100
+        for i in set(self.between_words):
+            if i in between_word_dictionary:
+                features.append(between_offset + between_word_dictionary[i])
 
+        self.features = sorted(features)
+
+
+    def build_lstm_features(self,dep_path_list_dictionary,dep_word_dictionary):
+        '''Builds lstm features as [dep path type ids, dep path word ids, dep path length, dep word length],
+        paths keep their own length and are only padded when batched'''
         unknown_dep_path_feature = dep_path_list_dictionary['UNKNOWN_WORD']
         unknown_word_feature = dep_word_dictionary['UNKNOWN_WORD']
 
-
-        for i in range(len(self.dependency_path_list)):
-            if self.dependency_path_list[i] not in dep_path_list_dictionary:
-                dep_path_features[i] = unknown_dep_path_feature
+        dep_path_features = []
+        for dep_type in self.dependency_path_list:
+            if dep_type not in dep_path_list_dictionary:
+                dep_path_features.append(unknown_dep_path_feature)
             else:
-                dep_path_features[i] = dep_path_list_dictionary[self.dependency_path_list[i]]
+                dep_path_features.append(dep_path_list_dictionary[dep_type])
 
-        for i in range(len(self.dependency_words)):
-            if self.dependency_words[i].lower() not in dep_word_dictionary:
-                dep_word_features[i]=unknown_word_feature
+        dep_word_features = []
+        for word in self.dependency_words:
+            if word.lower() not in dep_word_dictionary:
+                dep_word_features.append(unknown_word_feature)
             else:
-                dep_word_features[i] = dep_word_dictionary[self.dependency_words[i].lower()]
-
-        self.features =dep_path_features + dep_word_features + [len(self.dependency_path_list)] + [len(self.dependency_words)]
+                dep_word_features.append(dep_word_dictionary[word.lower()])
 
+        self.features = [dep_path_features, dep_word_features, len(dep_path_features), len(dep_word_features)]
 
 
+class PathInstance(Instance):
+    def __init__(self, path_features, label):
+        '''Instance rebuilt from the get_path_features tuples of a path cache, it has no sentence or
+        token positions and is only featurized and labeled'''
+        self.sentence = None
+        self.start = None
+        self.end = None
+        self.entity_pair = None
+        self.label = label
+        self.dependency_words_indexes = []
+        dependency_path_list, dependency_words, dependency_elements, between_words = path_features
+        self.dependency_path_list = list(dependency_path_list)
+        self.dependency_path_string = ' '.join(dependency_path_list)
+        self.dependency_words = list(dependency_words)
+        self.dependency_elements = list(dependency_elements)
+        self.between_words = list(between_words)
+
+
+class InstanceTable(object):
+    def __init__(self, num_labels):
+        '''Columns of the fields written out for featurized instances, so instances and their sentences
+        can be released once their features are built'''
+        self.num_labels = num_labels
+        self.pmids = []
+        self.sentence_ids = []
+        self.entity_1 = [] #normalized ner of the start entity
+        self.entity_2 = [] #normalized ner of the end entity
+        self.labels = array('b') #label bits of every instance, num_labels per instance
+
+    def __len__(self):
+        return len(self.pmids)
+
+    def append(self, instance):
+        '''Adds the pmid, sentence, entities and labels of instance'''
+        sentence = instance.get_sentence()
+        self.pmids.append(sentence.pmid)
+        self.sentence_ids.append(sentence.sentence_id)
+        self.entity_1.append(sentence.get_token(instance.start[0]).get_normalized_ner())
+        self.entity_2.append(sentence.get_token(instance.end[0]).get_normalized_ner())
+        self.labels.extend(instance.get_label())
+
+    def get_labels(self):
+        '''Returns labels as an instances by labels array'''
+        return np.array(self.labels, dtype=np.int8).reshape(len(self), self.num_labels)
@@ -1,21 +1,73 @@
 import sys
 import itertools
+from array import array
+
+try:
+    import numpy as np
+    from scipy.sparse import csr_matrix
+    from scipy.sparse.csgraph import shortest_path
+except ImportError:
+    csr_matrix = None
+    shortest_path = None
 
 #class objects for tokens, dependencies, and sentences
 
 
+#dependency types are interned once and shared by every sentence, id 0 means no dependency
+dependency_types = ['']
+dependency_type_ids = {'': 0}
+
+def intern_dependency_type(type):
+    '''Returns integer id of dependency type, adding it to the type table if new'''
+    if type not in dependency_type_ids:
+        dependency_type_ids[type] = len(dependency_types)
+        dependency_types.append(type)
+    return dependency_type_ids[type]
+
+#lemmas, part of speech and entity tags repeat across sentences, tokens share one string object per value
+token_strings = {}
+
+def intern_token_string(value):
+    '''Returns the shared string equal to value'''
+    if value is None:
+        return None
+    return token_strings.setdefault(value, value)
+
+
+def breadth_first_search(indptr, indices, source):
+    '''Finds shortest path tree from source over unit weight dependency edges stored as CSR arrays.
+    Each level is expanded in token order so ties resolve to the lowest token position,
+    the same paths the previous dijkstra search returned'''
+    previous = [-1] * (len(indptr) - 1)
+    visited = [False] * (len(indptr) - 1)
+    visited[source] = True
+    frontier = [source]
+    while len(frontier) > 0:
+        next_frontier = []
+        for u in sorted(frontier):
+            for v in indices[indptr[u]:indptr[u + 1]]:
+                if visited[v] is False:
+                    visited[v] = True
+                    previous[v] = u
+                    next_frontier.append(v)
+        frontier = next_frontier
+    return previous
+
+
 
 class Token(object):
+    __slots__ = ('token_id', 'word', 'lemma', 'char_begin', 'char_end', 'pos', 'ner', 'normalized_ner')
+
     def __init__(self, token_id, word, lemma, char_begin, char_end, pos, ner, normalized_ner=None):
-        '''Constructor for Token objects'''
+        '''Constructor for Token objects, character offsets are stored as integers'''
         self.token_id = int(token_id)
         self.word = word
-        self.lemma = lemma
-        self.char_begin = char_begin
-        self.char_end = char_end
-        self.pos = pos
-        self.ner = ner
-        self.normalized_ner = normalized_ner
+        self.lemma = intern_token_string(lemma)
+        self.char_begin = None if char_begin is None else int(char_begin)
+        self.char_end = None if char_end is None else int(char_end)
+        self.pos = intern_token_string(pos)
+        self.ner = intern_token_string(ner)
+        self.normalized_ner = intern_token_string(normalized_ner)
 
     def get_word(self):
         '''Prints the word identified with the Token object'''
@@ -26,7 +78,7 @@ class Token(object):
         return self.token_id
 
     def set_ner(self,new_ner):
-        self.ner = new_ner
+        self.ner = intern_token_string(new_ner)
 
     def get_ner(self):
         '''Returns ner of token'''
@@ -45,6 +97,8 @@ class Token(object):
         return self.pos
 
 class Dependency(object):
+    __slots__ = ('type', 'governor_token', 'dependent_token')
+
     def __init__(self, type, governor_token, dependent_token):
         '''Constructor for dependency type'''
         self.type = type
@@ -65,16 +119,33 @@ class Dependency(object):
 
 
 class Sentence(object):
+    __slots__ = ('pmid', 'sentence_id', 'tokens', 'entities', 'pair_types', 'mentions', 'dependencies',
+                 'dependency_indptr', 'dependency_indices', 'dependency_type_ids', 'dependency_degrees',
+                 'dependency_paths', 'shortest_path_trees')
+
+    # sentences with at least this many tokens compute all shortest path trees at once with scipy, the trees
+    # match breadth_first_search, None keeps the per source breadth first search
+    all_pairs_min_tokens = None
+    # entity pairs with more tokens between their mentions are skipped, None keeps every pair
+    max_token_distance = None
+    # entity pairs generated per sentence, None keeps every pair
+    max_pairs = None
+
     def __init__(self,pmid,sentence_id):
         '''Constructor for Sentence Object'''
         self.pmid = pmid
         self.sentence_id=sentence_id
         self.tokens = []
         self.entities = {}
-        self.pairs = []
+        self.pair_types = None #entity type combinations of the pairs
+        self.mentions = {} #mentions of each paired entity type with their anchor tokens
         self.dependencies = []
-        self.dependency_matrix = None
+        self.dependency_indptr = None #row offsets of CSR dependency graph
+        self.dependency_indices = None #neighbouring token of each edge
+        self.dependency_type_ids = None #interned dependency type of each edge
+        self.dependency_degrees = None #number of edges per token
         self.dependency_paths = None
+        self.shortest_path_trees = {}
 
         #Create root token and initialize to first position
         root = Token('0','ROOT','ROOT', None, None, None, None, None)
@@ -114,45 +185,67 @@ class Sentence(object):
         count = -1
         index = -1
         for l in entity_list:
-            dep_sum = sum(a != '' for a in self.dependency_matrix[l])
+            dep_sum = self.dependency_degrees[l]
             if dep_sum > count:
                 count = dep_sum
                 index = l
 
         return index
 
+    def build_mention(self, token_ids):
+        '''Returns (token ids, first token, last token, first anchor, last anchor) of an entity mention, anchors are
+        the tokens with the most dependencies, the first or last of them when tied'''
+        return (tuple(token_ids), token_ids[0], token_ids[-1], self.get_dependency_index(token_ids),
+                self.get_dependency_index(reversed(token_ids)))
+
     def generate_entity_pairs(self, entity_type_1_name, entity_type_2_name):
-        '''generates pairs between entities'''
+        '''Finds the entity types of both entities and the anchor tokens of their mentions once,
+        pairs are generated lazily by iter_entity_pairs'''
         entity_type_1 = set()
         entity_type_2 = set()
-        entity_set = set(self.entities)
         for e in self.entities:
             if entity_type_1_name in e:
                 entity_type_1.add(e)
             if entity_type_2_name in e:
                 entity_type_2.add(e)
-        if len(entity_type_1.intersection(entity_set))>0 and len(entity_type_2.intersection(entity_set))>0:#check if both entities in sentence
-            for z in list(itertools.product(entity_type_1,entity_type_2)):
-                for pair in list(itertools.product(self.entities[z[0]], self.entities[z[1]])):
-                    if pair[0] == pair[1]:
+        self.pair_types = None
+        self.mentions = {}
+        if len(entity_type_1) > 0 and len(entity_type_2) > 0: #check if both entities in sentence
+            self.pair_types = list(itertools.product(entity_type_1,entity_type_2))
+            for e in entity_type_1.union(entity_type_2):
+                self.mentions[e] = [self.build_mention(token_ids) for token_ids in self.entities[e]]
+
+    def iter_entity_pairs(self, max_token_distance=None, max_pairs=None):
+        '''Generates ((token, anchor), (token, anchor)) pairs between entity mentions, each entity is represented
+        by its token closest to the other entity
+        :param max_token_distance: skip pairs with more tokens between the mentions, None keeps every pair
+        :param max_pairs: stop after this many pairs, None keeps every pair'''
+        if self.pair_types is None:
+            return
+        num_pairs = 0
+        for type_1, type_2 in self.pair_types:
+            for mention_1 in self.mentions[type_1]:
+                for mention_2 in self.mentions[type_2]:
+                    if mention_1[0] == mention_2[0]:
                         continue
-                #determines which entity token to look at for shortest distance
-                    if max(pair[0]) > max(pair[1]):
-                        #between_pair = (pair[0][0], pair[1][-1])
-                        p_0_index = (pair[0][0],self.get_dependency_index(pair[0]))
-                        p_1_index = (pair[1][-1],self.get_dependency_index(reversed(pair[1])))
-                        self.pairs.append((p_0_index,p_1_index))
+                    #determines which entity token to look at for shortest distance
+                    if mention_1[2] > mention_2[2]:
+                        pair = ((mention_1[1], mention_1[3]), (mention_2[2], mention_2[4]))
                     else:
-                        #between_pair = (pair[0][-1], pair[1][0])
-                        p_0_index = (pair[0][-1],self.get_dependency_index(reversed(pair[0])))
-                        p_1_index = (pair[1][0],self.get_dependency_index(pair[1]))
-                        self.pairs.append((p_0_index, p_1_index))
-
-        else:
-            self.pairs = None
+                        pair = ((mention_1[2], mention_1[4]), (mention_2[1], mention_2[3]))
+                    if max_token_distance is not None and abs(pair[0][0] - pair[1][0]) - 1 > max_token_distance:
+                        continue
+                    yield pair
+                    num_pairs += 1
+                    if max_pairs is not None and num_pairs >= max_pairs:
+                        return
 
     def get_entity_pairs(self):
-        return self.pairs
+        '''Returns generator of entity pairs limited by the max_token_distance and max_pairs settings,
+        None if the sentence lacks one of the entity types'''
+        if self.pair_types is None:
+            return None
+        return self.iter_entity_pairs(self.max_token_distance, self.max_pairs)
 
 
     def get_sentence_string(self):
@@ -174,22 +267,82 @@ class Sentence(object):
         for d in self.dependencies:
             d.print_dependency()
 
-    def build_dependency_matrix(self):
-        self.dependency_matrix = [['' for y in range(len(self.tokens))] for x in range(len(self.tokens))]
+    def build_dependency_graph(self):
+        '''Builds sparse dependency graph in CSR form with interned dependency types, the graph replaces the
+        dependency objects, which are released'''
+        edges = {}
         for dependency in self.dependencies:
             governor_position = int(dependency.get_governor_token().get_token_id())
             dependent_position = int(dependency.get_dependent_token().get_token_id())
             type = dependency.get_type()
-            self.dependency_matrix[governor_position][dependent_position]=type
+            edges[(governor_position, dependent_position)] = intern_dependency_type(type)
             # add the reverse only if the slot is empty
-            if self.dependency_matrix[dependent_position][governor_position] == "":
-                self.dependency_matrix[dependent_position][governor_position] = "-" + type
+            if (dependent_position, governor_position) not in edges:
+                edges[(dependent_position, governor_position)] = intern_dependency_type("-" + type)
+
+        self.dependency_indptr = array('i', [0] * (len(self.tokens) + 1))
+        self.dependency_indices = array('i')
+        self.dependency_type_ids = array('i')
+        for edge in sorted(edges):
+            self.dependency_indptr[edge[0] + 1] += 1
+            self.dependency_indices.append(edge[1])
+            self.dependency_type_ids.append(edges[edge])
+        for i in range(len(self.tokens)):
+            self.dependency_indptr[i + 1] += self.dependency_indptr[i]
+        self.dependency_degrees = array('i', [self.dependency_indptr[i + 1] - self.dependency_indptr[i]
+                                              for i in range(len(self.tokens))])
+        self.dependencies = []
+        self.shortest_path_trees = {}
 
     def get_dependency_type(self,start,end):
-        return self.dependency_matrix[start][end]
-
-    def get_dependency_matrix(self):
-        return self.dependency_matrix
+        for i in range(self.dependency_indptr[start], self.dependency_indptr[start + 1]):
+            if self.dependency_indices[i] == end:
+                return dependency_types[self.dependency_type_ids[i]]
+        return ''
+
+    def build_all_shortest_path_trees(self):
+        '''Computes shortest path trees for every token with scipy. Breadth first search reaches a token first
+        from its lowest numbered neighbour one step closer to the source, so that neighbour is picked as previous
+        token for all sources at once to resolve ties the same way'''
+        num_tokens = len(self.tokens)
+        indptr = np.asarray(self.dependency_indptr, dtype=np.int64)
+        neighbours = np.asarray(self.dependency_indices, dtype=np.int64)
+        graph = csr_matrix((np.ones(len(neighbours)), neighbours, indptr), shape=(num_tokens, num_tokens))
+        distances = shortest_path(graph, directed=False, unweighted=True)
+        if len(neighbours) == 0:
+            self.shortest_path_trees.update((source, [-1] * num_tokens) for source in range(num_tokens))
+            return
+        # tokens of every edge are grouped by row, so each token's neighbours are one reduceat segment
+        tokens = np.repeat(np.arange(num_tokens), np.diff(indptr))
+        closer = (distances[:, neighbours] == distances[:, tokens] - 1) & np.isfinite(distances[:, tokens])
+        candidates = np.where(closer, neighbours, num_tokens)
+        has_neighbours = np.diff(indptr) > 0
+        previous = np.full((num_tokens, num_tokens), num_tokens, dtype=np.int64)
+        previous[:, has_neighbours] = np.minimum.reduceat(candidates, indptr[:-1][has_neighbours], axis=1)
+        previous[previous == num_tokens] = -1
+        self.shortest_path_trees.update(enumerate(previous.tolist()))
+
+    def get_shortest_path_tree(self,source):
+        '''Returns previous token of every token on shortest paths from source, trees are cached per source'''
+        if source not in self.shortest_path_trees:
+            if self.all_pairs_min_tokens is not None and shortest_path is not None \
+                    and len(self.tokens) >= self.all_pairs_min_tokens:
+                self.build_all_shortest_path_trees()
+            else:
+                self.shortest_path_trees[source] = breadth_first_search(self.dependency_indptr, self.dependency_indices, source)
+        return self.shortest_path_trees[source]
+
+    def get_shortest_path(self,source,target):
+        '''Returns token positions on shortest dependency path from source to target, empty if no path'''
+        previous = self.get_shortest_path_tree(source)
+        path = []
+        if previous[target] != -1:
+            prev = previous[target]
+            path = [prev, target]
+            while prev != source:
+                prev = previous[prev]
+                path.insert(0,prev)
+        return path
 
     def clear_all(self):
         for t in self.tokens:
@@ -0,0 +1,72 @@
+import collections
+import numpy as np
+
+#class objects for counting feature vocabularies
+
+
+class CountMinSketch(object):
+    def __init__(self, width, depth=4, seed=0):
+        '''Approximate counts of any number of words in depth x width counters. Estimates never undercount and
+        overcount by at most a few total counts / width with high probability'''
+        self.width = width
+        self.depth = depth
+        self.table = np.zeros((depth, width), dtype=np.int64)
+        random_state = np.random.RandomState(seed)
+        self.hash_a = [int(a) for a in random_state.randint(1, 1 << 31, size=depth)]
+        self.hash_b = [int(b) for b in random_state.randint(0, 1 << 31, size=depth)]
+        self.rows = range(depth)
+
+    def columns(self, word):
+        '''Returns the counter column of word in every row'''
+        h = hash(word) & 0xffffffffffffffff
+        return [((self.hash_a[i] * h + self.hash_b[i]) % 2305843009213693951) % self.width for i in self.rows]
+
+    def add(self, word, count=1):
+        '''Adds count occurrences of word and returns its estimated count'''
+        columns = self.columns(word)
+        self.table[self.rows, columns] += count
+        return int(self.table[self.rows, columns].min())
+
+    def estimate(self, word):
+        '''Returns the estimated count of word'''
+        return int(self.table[self.rows, self.columns(word)].min())
+
+
+class VocabularyCounter(object):
+    def __init__(self, min_count=None, sketch_width=None, sketch_depth=4):
+        '''Counts a vocabulary from a stream of per file counts, so the raw words are never held in memory.
+        Counts are exact unless sketch_width is given, then words are only counted once a count-min sketch
+        estimates they occur min_count times, which keeps words too rare for the dictionaries out of memory.
+        Counts of those words include the sketch overestimate at the time they were first counted.
+        :param min_count: count a word needs to be kept, required with sketch_width
+        :param sketch_width: counters per sketch row, None counts every word exactly
+        :param sketch_depth: sketch rows'''
+        if sketch_width is not None and not min_count:
+            raise ValueError('approximate counting needs a min_count')
+        self.min_count = min_count
+        self.counts = collections.Counter()
+        self.sketch = None
+        if sketch_width is not None:
+            self.sketch = CountMinSketch(sketch_width, sketch_depth)
+
+    def __len__(self):
+        return len(self.counts)
+
+    def update(self, counts):
+        '''Adds a Counter of word counts, or an iterable of words'''
+        if not isinstance(counts, collections.Counter):
+            counts = collections.Counter(counts)
+        if self.sketch is None:
+            self.counts.update(counts)
+            return
+        for word, count in counts.iteritems():
+            if word in self.counts:
+                self.counts[word] += count
+            else:
+                estimate = self.sketch.add(word, count)
+                if estimate >= self.min_count:
+                    self.counts[word] = estimate
+
+    def get_counts(self):
+        '''Returns Counter of counted words'''
+        return self.counts
@@ -0,0 +1,95 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import tensorflow as tf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import load_data
+from machine_learning_models import tf_lstm
+from machine_learning_models import training_control
+
+
+class ResumedEpochTest(unittest.TestCase):
+    def setUp(self):
+        '''Writes records whose single label is the record id, with paths of different lengths so they are
+        spread over several buckets'''
+        self.directory = tempfile.mkdtemp()
+        self.num_records = 200
+        lengths = [i % 6 + 1 for i in range(self.num_records)]
+        paths = [np.full(lengths[i], i % 5, dtype=np.int32) for i in range(self.num_records)]
+        labels = np.arange(self.num_records, dtype=np.int32).reshape(self.num_records, 1)
+        self.record_file = load_data.np_to_lstm_tfrecord(paths, paths, np.array(lengths, dtype=np.int32),
+                                                         np.array(lengths, dtype=np.int32), labels,
+                                                         os.path.join(self.directory, 'train.tfrecord'))
+        self.model_file = os.path.join(self.directory, 'model')
+
+        self.graph = tf.Graph()
+        with self.graph.as_default():
+            self.global_step = tf.Variable(0, name='global_step')
+            self.train_step = tf.assign_add(self.global_step, 1)
+            self.epoch_counter = training_control.EpochCounter(self.global_step)
+            dataset = tf_lstm.tfrecord_dataset([self.record_file], 8, tf_lstm.padding_values(5, 5),
+                                               epoch_position=(self.epoch_counter.epoch,
+                                                               self.epoch_counter.epoch_steps))
+            self.iterator = dataset.make_initializable_iterator()
+            self.batch_labels = self.iterator.get_next()[-1]
+            self.saver = tf.train.Saver()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def train_batches(self, sess, max_batches=None):
+        '''Trains batches of the initialized iterator like lstm_train and returns the record ids of each batch'''
+        batches = []
+        while max_batches is None or len(batches) < max_batches:
+            try:
+                labels = sess.run(self.batch_labels)
+            except tf.errors.OutOfRangeError:
+                break
+            sess.run(self.train_step)
+            batches.append(sorted(labels[:, 0].astype(int)))
+        return batches
+
+    def epoch_batches(self, epoch):
+        with tf.Session(graph=self.graph) as sess:
+            sess.run(tf.global_variables_initializer())
+            self.epoch_counter.start_epoch(sess, epoch)
+            sess.run(self.iterator.initializer)
+            return self.train_batches(sess)
+
+    def test_epoch_visits_every_record_once(self):
+        for epoch in (0, 3):
+            batches = self.epoch_batches(epoch)
+            self.assertEqual(sorted(id for batch in batches for id in batch), range(self.num_records))
+        self.assertNotEqual(self.epoch_batches(0), self.epoch_batches(3))
+
+    def test_resumed_epoch_visits_every_record_once(self):
+        '''An epoch interrupted after a checkpoint and resumed in a new session trains the remaining batches of
+        the same permutation'''
+        full_epoch = self.epoch_batches(3)
+        for trained_batches in (1, 7, len(full_epoch) - 1):
+            with tf.Session(graph=self.graph) as sess:
+                sess.run(tf.global_variables_initializer())
+                # steps of earlier epochs so the epoch does not start at global step 0
+                sess.run(tf.assign(self.global_step, 50))
+                self.epoch_counter.start_epoch(sess, 3)
+                sess.run(self.iterator.initializer)
+                interrupted = self.train_batches(sess, trained_batches)
+                self.saver.save(sess, self.model_file)
+
+            with tf.Session(graph=self.graph) as sess:
+                self.saver.restore(sess, self.model_file)
+                self.assertEqual(self.epoch_counter.get_position(sess), [3, trained_batches])
+                sess.run(self.iterator.initializer)
+                resumed = self.train_batches(sess)
+
+            self.assertEqual(interrupted + resumed, full_epoch)
+            self.assertEqual(sorted(id for batch in interrupted + resumed for id in batch), range(self.num_records))
+
+
+if __name__ == '__main__':
+    unittest.main()
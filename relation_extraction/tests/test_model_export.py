@@ -0,0 +1,98 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import tensorflow as tf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import load_data
+from machine_learning_models import tf_feed_forward as nn
+from machine_learning_models import tf_lstm as lstm
+from machine_learning_models import training_control
+from machine_learning_models import model_export
+
+
+class FeedForwardExportTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_predict_from_frozen_graph_without_hidden_layers(self):
+        '''Models trained with hidden_array = [] have no dropout in the frozen graph and still predict'''
+        random_state = np.random.RandomState(0)
+        features = [sorted(random_state.choice(20, 3, replace=False).tolist()) for i in range(64)]
+        labels = random_state.randint(0, 2, size=(64, 2)).astype(np.int8)
+        record_file = load_data.np_to_tfrecord(features, labels, os.path.join(self.directory, 'train.tfrecord'))
+
+        tf.reset_default_graph()
+        model_file = nn.feed_forward_train([record_file], [], os.path.join(self.directory, 'model') + '/', 20,
+                                           ['a', 'b'], None, training_control.TrainingController(num_epochs=1))
+        frozen_file = model_export.export_inference_graph(model_file, model_export.feed_forward_inputs)
+
+        checkpoint_predictor = nn.FeedForwardPredictor(model_file)
+        checkpoint_probs = checkpoint_predictor.predict(features)
+        checkpoint_predictor.close()
+
+        frozen_predictor = nn.FeedForwardPredictor(frozen_file)
+        self.assertIsNone(frozen_predictor.keep_prob)
+        frozen_probs = frozen_predictor.predict(features)
+        file_probs = np.concatenate([probs for probs, batch_labels in frozen_predictor.iter_predict_files([record_file])])
+        frozen_predictor.close()
+
+        self.assertEqual(frozen_probs.shape, (64, 2))
+        np.testing.assert_allclose(frozen_probs, checkpoint_probs, rtol=1e-5, atol=1e-6)
+        np.testing.assert_allclose(file_probs, checkpoint_probs, rtol=1e-5, atol=1e-6)
+
+
+class LSTMExportTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_predict_from_frozen_graph(self):
+        '''Checkpoints, frozen graphs and record files of a trained lstm give the same predictions, and records
+        predicted from the checkpoint keep their labels'''
+        random_state = np.random.RandomState(0)
+        lengths = random_state.randint(1, 6, size=64).astype(np.int32)
+        dep_paths = [random_state.randint(0, 5, size=length).astype(np.int32) for length in lengths]
+        word_paths = [random_state.randint(0, 7, size=length + 1).astype(np.int32) for length in lengths]
+        labels = random_state.randint(0, 2, size=(64, 2)).astype(np.int32)
+        record_file = load_data.np_to_lstm_tfrecord(dep_paths, word_paths, lengths, lengths + 1, labels,
+                                                    os.path.join(self.directory, 'train.tfrecord'))
+
+        tf.reset_default_graph()
+        model_file = lstm.lstm_train([record_file], 6, 8, os.path.join(self.directory, 'model') + '/', ['a', 'b'],
+                                     controller=training_control.TrainingController(num_epochs=1))
+        frozen_file = model_export.export_inference_graph(model_file, model_export.lstm_inputs)
+
+        checkpoint_predictor = lstm.LSTMPredictor(model_file)
+        self.assertEqual(checkpoint_predictor.labels.name, 'batch_labels:0')
+        checkpoint_probs = checkpoint_predictor.predict(dep_paths, word_paths, lengths, lengths + 1)
+        file_predictions = list(checkpoint_predictor.iter_predict_files([record_file]))
+        checkpoint_predictor.close()
+
+        frozen_predictor = lstm.LSTMPredictor(frozen_file)
+        frozen_probs = frozen_predictor.predict(dep_paths, word_paths, lengths, lengths + 1)
+        batch_probs = np.concatenate(list(frozen_predictor.iter_predict(
+            [(dep_paths[start:start + 16], word_paths[start:start + 16], lengths[start:start + 16],
+              lengths[start:start + 16] + 1) for start in range(0, 64, 16)])))
+        frozen_predictor.close()
+
+        self.assertEqual(frozen_probs.shape, (64, 2))
+        np.testing.assert_allclose(frozen_probs, checkpoint_probs, rtol=1e-5, atol=1e-6)
+        np.testing.assert_allclose(batch_probs, checkpoint_probs, rtol=1e-5, atol=1e-6)
+        np.testing.assert_allclose(np.concatenate([probs for probs, batch_labels in file_predictions]),
+                                   checkpoint_probs, rtol=1e-5, atol=1e-6)
+        np.testing.assert_array_equal(np.concatenate([batch_labels for probs, batch_labels in file_predictions]),
+                                      labels)
+
+
+if __name__ == '__main__':
+    unittest.main()
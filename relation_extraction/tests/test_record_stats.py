@@ -0,0 +1,49 @@
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import load_data
+from machine_learning_models import record_stats
+
+
+class RecordStatsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        labels = np.array([[1, 0], [0, 0], [1, 1]], dtype=np.int8)
+        self.record_file = load_data.np_to_tfrecord([[0], [1], [2]], labels,
+                                                    os.path.join(self.directory, 'train.tfrecord'))
+        self.expected = {'count': 3, 'positives': 2, 'label_counts': [2, 1]}
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_sidecar_is_read(self):
+        '''Records written with np_to_tfrecord have a sidecar with their stats'''
+        self.assertEqual(record_stats.read_record_stats(self.record_file), self.expected)
+        self.assertEqual(record_stats.load_record_stats([self.record_file, self.record_file], np.int8),
+                         {'count': 6, 'positives': 4, 'label_counts': [4, 2]})
+
+    def test_unreadable_sidecar_is_rescanned(self):
+        '''A partial sidecar newer than its record is treated as stale and written again'''
+        with open(record_stats.stats_file(self.record_file), 'w') as file:
+            file.write('{"count": 3, "posi')
+        self.assertEqual(record_stats.read_record_stats(self.record_file), None)
+        self.assertEqual(record_stats.load_record_stats([self.record_file], np.int8), self.expected)
+        with open(record_stats.stats_file(self.record_file)) as file:
+            self.assertEqual(json.load(file), self.expected)
+        self.assertFalse(os.path.exists(record_stats.stats_file(self.record_file) + '.tmp'))
+
+    def test_missing_sidecar_is_rescanned(self):
+        os.remove(record_stats.stats_file(self.record_file))
+        self.assertEqual(record_stats.load_record_stats([self.record_file], np.int8), self.expected)
+        self.assertTrue(os.path.isfile(record_stats.stats_file(self.record_file)))
+
+
+if __name__ == '__main__':
+    unittest.main()
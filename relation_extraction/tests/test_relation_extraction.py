@@ -0,0 +1,61 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import relation_extraction
+from machine_learning_models import training_control
+
+
+class ParseOptionsTest(unittest.TestCase):
+    def setUp(self):
+        self.option_types = dict(relation_extraction.training_options, **relation_extraction.sentence_options)
+
+    def test_defaults(self):
+        '''Without options the positional arguments are unchanged and the controller keeps its defaults'''
+        arguments = ['relation_extraction.py', 'TRAIN_LSTM', 'model', 'abstracts', '4']
+        positional_arguments, options = relation_extraction.parse_options(arguments, self.option_types)
+        self.assertEqual(positional_arguments, arguments)
+        self.assertEqual(options, {})
+        controller = training_control.TrainingController(**options)
+        self.assertEqual(controller.num_epochs, 250)
+        self.assertEqual(controller.monitor, 'loss')
+        self.assertEqual(controller.patience, None)
+
+    def test_controller_options(self):
+        arguments = ['relation_extraction.py', 'TRAIN_FEED_FORWARD', '--num_epochs=3', 'model', '--keep-best=True',
+                     '--eval_fraction=0.5', '--monitor=f1', '--patience=2']
+        positional_arguments, options = relation_extraction.parse_options(arguments, self.option_types)
+        self.assertEqual(positional_arguments, ['relation_extraction.py', 'TRAIN_FEED_FORWARD', 'model'])
+        self.assertEqual(options, {'num_epochs': 3, 'keep_best': True, 'eval_fraction': 0.5, 'monitor': 'f1',
+                                   'patience': 2})
+        controller = training_control.TrainingController(**options)
+        self.assertEqual((controller.num_epochs, controller.keep_best), (3, True))
+
+    def test_resume_and_checkpoint_options(self):
+        '''resume goes to the trainer and the checkpoint options to the controller'''
+        arguments = ['relation_extraction.py', 'TRAIN_LSTM', 'model', '--resume=True', '--checkpoint_steps=100',
+                     '--checkpoint_secs=60', '--max_checkpoints=2', '--max_pairs=10']
+        positional_arguments, options = relation_extraction.parse_options(arguments, self.option_types)
+        self.assertEqual(positional_arguments, ['relation_extraction.py', 'TRAIN_LSTM', 'model'])
+        controller, resume, settings = relation_extraction.split_training_options(options)
+        self.assertEqual(resume, True)
+        self.assertEqual((controller.checkpoint_steps, controller.checkpoint_secs, controller.max_checkpoints),
+                         (100, 60.0, 2))
+        self.assertEqual(settings, {'max_pairs': 10})
+
+        controller, resume, settings = relation_extraction.split_training_options({})
+        self.assertEqual(resume, False)
+        self.assertEqual((controller.checkpoint_steps, controller.checkpoint_secs), (None, None))
+        self.assertEqual(settings, {})
+
+    def test_rejects_unknown_options(self):
+        for argument in ('--epochs=3', '--num_epochs', '--keep_best=yes', '--resume=1'):
+            with self.assertRaises(ValueError):
+                relation_extraction.parse_options(['relation_extraction.py', 'TRAIN_LSTM', argument],
+                                                  self.option_types)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+import load_data
+from structures import sentence_structure
+from structures.sentence_structure import Sentence, Token, Dependency, breadth_first_search
+
+
+def build_test_sentence(num_tokens, edges, entities=None):
+    '''Builds a sentence of num_tokens tokens and (governor, dependent) dependency edges, entities maps token
+    positions to their (ner, normalized ner)'''
+    sentence = Sentence('pmid', 'sentence')
+    for i in range(1, num_tokens + 1):
+        ner, normalized_ner = (entities or {}).get(i, ('O', None))
+        sentence.add_token(Token(str(i), 'word' + str(i), 'lemma' + str(i), i, i + 1, 'NN', ner, normalized_ner))
+    for governor, dependent in edges:
+        sentence.add_dependency(Dependency('dep', sentence.get_token(governor), sentence.get_token(dependent)))
+    sentence.build_dependency_graph()
+    return sentence
+
+
+class ShortestPathTreeTest(unittest.TestCase):
+    def tearDown(self):
+        load_data.set_sentence_settings(load_data.sentence_settings())
+
+    @unittest.skipIf(sentence_structure.shortest_path is None, 'scipy is not installed')
+    def test_all_pairs_trees_match_breadth_first_search(self):
+        '''Tokens reachable over several shortest paths get the same previous token from both searches'''
+        # tokens 1 to 6 form a cycle, 6 reaches 1 through 5 and 2 or through 4 and 3, scipy's own predecessors
+        # take the second path. 7 and 8 are not connected to the rest
+        sentence = build_test_sentence(8, [(1, 2), (1, 3), (4, 3), (5, 2), (6, 4), (6, 5), (7, 8)])
+        sentence.build_all_shortest_path_trees()
+        for source in range(len(sentence.tokens)):
+            self.assertEqual(sentence.shortest_path_trees[source],
+                             breadth_first_search(sentence.dependency_indptr, sentence.dependency_indices, source))
+        self.assertEqual(sentence.get_shortest_path(6, 1), [6, 5, 2, 1])
+        self.assertEqual(sentence.get_shortest_path(1, 6), [1, 3, 4, 6])
+        self.assertEqual(sentence.get_shortest_path(1, 8), [])
+
+    @unittest.skipIf(sentence_structure.shortest_path is None, 'scipy is not installed')
+    def test_worker_state_sets_all_pairs_mode(self):
+        '''Workers take all_pairs_min_tokens from their state and long sentences build every tree at once'''
+        load_data.init_worker({'sentence_settings': load_data.sentence_settings(all_pairs_min_tokens=5)})
+        self.assertEqual(Sentence.all_pairs_min_tokens, 5)
+        sentence = build_test_sentence(5, [(1, 2), (2, 3), (3, 4), (4, 5)])
+        self.assertEqual(sentence.get_shortest_path(1, 5), [1, 2, 3, 4, 5])
+        self.assertEqual(sorted(sentence.shortest_path_trees), range(6))
+        self.assertEqual(load_data.sentence_fingerprints(), {'all_pairs_min_tokens': 5})
+
+
+
+class EntityPairTest(unittest.TestCase):
+    def setUp(self):
+        # a human gene at token 1 and viral genes at tokens 3 and 9
+        entities = {1: ('HUMAN_GENE', 'h1'), 3: ('VIRAL_GENE', 'v1'), 9: ('VIRAL_GENE', 'v2')}
+        self.sentence = build_test_sentence(9, [(i, i + 1) for i in range(1, 9)], entities)
+        self.sentence.generate_entity_pairs('HUMAN_GENE', 'VIRAL_GENE')
+
+    def tearDown(self):
+        load_data.set_sentence_settings(load_data.sentence_settings())
+
+    def test_iter_entity_pairs_limits(self):
+        '''max_token_distance skips pairs with more tokens between them and max_pairs caps the pairs'''
+        self.assertEqual(list(self.sentence.iter_entity_pairs()), [((1, 1), (3, 3)), ((1, 1), (9, 9))])
+        self.assertEqual(list(self.sentence.iter_entity_pairs(max_token_distance=1)), [((1, 1), (3, 3))])
+        self.assertEqual(list(self.sentence.iter_entity_pairs(max_token_distance=7)),
+                         [((1, 1), (3, 3)), ((1, 1), (9, 9))])
+        self.assertEqual(list(self.sentence.iter_entity_pairs(max_token_distance=0)), [])
+        self.assertEqual(list(self.sentence.iter_entity_pairs(max_pairs=1)), [((1, 1), (3, 3))])
+
+    def test_worker_state_limits_entity_pairs(self):
+        '''Workers take the pair limits from their state, get_entity_pairs applies them and they are fingerprinted'''
+        load_data.init_worker({'sentence_settings': load_data.sentence_settings(max_token_distance=5)})
+        self.assertEqual(list(self.sentence.get_entity_pairs()), [((1, 1), (3, 3))])
+        self.assertEqual(load_data.sentence_fingerprints(), {'entity_pairs': [5, None]})
+        load_data.init_worker({'sentence_settings': load_data.sentence_settings(max_pairs=2)})
+        self.assertEqual(len(list(self.sentence.get_entity_pairs())), 2)
+        self.assertEqual(load_data.sentence_fingerprints(), {'entity_pairs': [None, 2]})
+
+
+if __name__ == '__main__':
+    unittest.main()
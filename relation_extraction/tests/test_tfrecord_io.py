@@ -0,0 +1,59 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import tensorflow as tf
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+
+from machine_learning_models import tfrecord_io
+
+
+def failing_examples(features, labels):
+    '''Serializer that fails on a batch without instances'''
+    if len(labels) == 0:
+        raise ValueError('empty batch')
+    return tfrecord_io.feed_forward_examples(features, labels)
+
+
+class BatchRecordWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.record_file = os.path.join(self.directory, 'train.tfrecord')
+        self.labels = np.array([[1, 0], [0, 1]], dtype=np.int8)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_with_block_writes_every_batch(self):
+        for background in (True, False):
+            with tfrecord_io.BatchRecordWriter(self.record_file, tfrecord_io.feed_forward_examples,
+                                               background=background) as writer:
+                writer.write_batch([[0, 2], [1]], self.labels)
+                writer.write_batch([[3]], self.labels[:1])
+            self.assertEqual(len(list(tf.python_io.tf_record_iterator(self.record_file))), 3)
+
+    def test_error_in_with_block_stops_writer(self):
+        '''An error while featurizing stops the writer thread and removes the partial file'''
+        with self.assertRaises(KeyError):
+            with tfrecord_io.BatchRecordWriter(self.record_file, tfrecord_io.feed_forward_examples) as writer:
+                writer.write_batch([[0, 2], [1]], self.labels)
+                {}['missing feature']
+        self.assertFalse(writer.thread.is_alive())
+        self.assertTrue(writer.closed)
+        self.assertFalse(os.path.exists(self.record_file))
+
+    def test_error_in_writer_thread_is_raised(self):
+        '''Errors serializing a batch are raised when the block ends and the partial file is removed'''
+        with self.assertRaises(ValueError):
+            with tfrecord_io.BatchRecordWriter(self.record_file, failing_examples) as writer:
+                writer.write_batch([[0, 2], [1]], self.labels)
+                writer.write_batch([], self.labels[:0])
+        self.assertFalse(writer.thread.is_alive())
+        self.assertFalse(os.path.exists(self.record_file))
+
+
+if __name__ == '__main__':
+    unittest.main()